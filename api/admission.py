@@ -0,0 +1,162 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# ---------- Admission control ----------
+# Sits in front of every upstream call. Each student (or client address when
+# signed out) has a token bucket sized by plan, checked when a request comes
+# in. Upstream slots are capped globally and handed out by priority: masters,
+# then bachelors, then associates, first come first served within a plan. A
+# caller that does not get a slot within its plan's queue limit, or has an
+# empty bucket, gets Overloaded, which the app answers with 429 + Retry-After.
+
+PLANS = ("masters", "bachelors", "associates")
+PRIORITY = {plan: i for i, plan in enumerate(PLANS)}
+# plan -> (requests per minute, burst)
+RATES = {"masters": (60.0, 20.0), "bachelors": (30.0, 10.0), "associates": (12.0, 6.0)}
+# plan -> seconds a request may wait for an upstream slot
+QUEUE_LIMITS = {"masters": 30.0, "bachelors": 15.0, "associates": 8.0}
+# Work nobody is waiting on (quiz bank refills): queued after every plan, for
+# as long as it takes. Not a plan a student can have.
+BACKGROUND = "background"
+
+# ADMISSION_ENABLED=0 turns off rate limits, priorities and queue limits
+# (upstream calls still share OPENAI_MAX_CONCURRENCY, first come first served).
+ENABLED = (os.getenv("ADMISSION_ENABLED") or "1").strip().lower() not in ("0", "false", "no", "off")
+
+_plan: ContextVar[str] = ContextVar("admission_plan", default="associates")
+
+class Overloaded(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def normalize_plan(plan: Any) -> str:
+    plan = str(plan or "").strip().lower()
+    return plan if plan in PRIORITY else "associates"
+
+def set_plan(plan: str) -> None:
+    # Upstream calls made from this request (and tasks it starts) queue as `plan`.
+    _plan.set(plan if plan == BACKGROUND else normalize_plan(plan))
+
+def current_plan() -> str:
+    return _plan.get()
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+def settings_from_env() -> Tuple[Dict[str, Tuple[float, float]], Dict[str, float]]:
+    # ADMISSION_RATE_<PLAN> (per minute), ADMISSION_BURST_<PLAN>, ADMISSION_QUEUE_<PLAN> (seconds)
+    rates = {}
+    limits = {}
+    for plan in PLANS:
+        key = plan.upper()
+        rates[plan] = (_env_float(f"ADMISSION_RATE_{key}", RATES[plan][0]), _env_float(f"ADMISSION_BURST_{key}", RATES[plan][1]))
+        limits[plan] = _env_float(f"ADMISSION_QUEUE_{key}", QUEUE_LIMITS[plan])
+    return rates, limits
+
+class TokenBuckets:
+    def __init__(self, rates: Optional[Dict[str, Tuple[float, float]]] = None, max_keys: int = 50000):
+        self.rates = rates or dict(RATES)
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated)
+        self.counters: Dict[str, int] = {"allowed": 0, "limited": 0}
+
+    def take(self, key: str, plan: str) -> None:
+        per_minute, burst = self.rates[normalize_plan(plan)]
+        rate = per_minute / 60.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1.0:
+            self._buckets[key] = (tokens, now)
+            self.counters["limited"] += 1
+            raise Overloaded("Rate limit exceeded", (1.0 - tokens) / rate if rate > 0 else 60.0)
+        self._buckets[key] = (tokens - 1.0, now)
+        self.counters["allowed"] += 1
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"keys": len(self._buckets), **self.counters}
+
+class PriorityGate:
+    # A semaphore whose waiters are served by plan priority, then arrival.
+    def __init__(self, limit: int, queue_limits: Optional[Dict[str, float]] = None, prioritize: bool = True):
+        self.limit = max(1, limit)
+        self.queue_limits = queue_limits or dict(QUEUE_LIMITS)
+        self.prioritize = prioritize
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, "asyncio.Future[None]"]] = []
+        self._order = itertools.count()
+        self._hold = 1.0  # moving average of slot hold time, for Retry-After
+        self._waits: Dict[str, Deque[float]] = {plan: deque(maxlen=1024) for plan in PLANS + (BACKGROUND,)}
+        self.counters: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def _retry_after(self) -> float:
+        return (len(self._waiters) + 1) / self.limit * self._hold
+
+    async def acquire(self, plan: str) -> float:
+        # -> seconds spent queued
+        plan = plan if plan == BACKGROUND else normalize_plan(plan)
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            self._waits[plan].append(0.0)
+            return 0.0
+        t0 = time.monotonic()
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        prio = PRIORITY.get(plan, len(PLANS)) if self.prioritize else 0
+        heapq.heappush(self._waiters, (prio, next(self._order), fut))
+        self.counters["queued"] += 1
+        limit = self.queue_limits.get(plan) if self.prioritize else None
+        try:
+            await asyncio.wait({fut}, timeout=limit)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # handed a slot just as the caller went away
+            else:
+                fut.cancel()
+            raise
+        if not fut.done():
+            fut.cancel()
+            self.counters["rejected"] += 1
+            raise Overloaded("Upstream is busy, try again shortly", self._retry_after())
+        waited = time.monotonic() - t0
+        self.counters["admitted"] += 1
+        self._waits[plan].append(waited)
+        return waited
+
+    def release(self, held: Optional[float] = None) -> None:
+        if held is not None:
+            self._hold = 0.9 * self._hold + 0.1 * held
+        # Hand the slot straight to the best live waiter, if any.
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        waits = {}
+        for plan, values in self._waits.items():
+            ordered = sorted(values)
+            waits[plan] = round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000) if ordered else None
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for _, _, f in self._waiters if not f.done()),
+            "prioritized": self.prioritize,
+            "wait_p99_ms": waits,
+            **self.counters,
+        }
@@ -0,0 +1,119 @@
+import json
+import base64
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.datastore import DataStore
+
+# ---------- Announcements feed ----------
+# Every page load asks for the feed, so it is served from an in-memory
+# snapshot: the cleaned list, already serialized one page at a time with a
+# strong ETag per page. The snapshot is rebuilt after a write from this worker
+# and when the store's version stamp (file mtime, or a counter in SQLite)
+# changes, which is checked at most once per `recheck` seconds.
+#
+# Pages are newest first. A page's `next_cursor` names the last item on it, so
+# paging keeps its place when new announcements are added in between.
+
+PAGE_SIZE = 50
+DEFAULTS = [
+    {"text": "Welcome to Botnology101 — your premium AI tutor."},
+    {"text": "Forest-green chat panes are now live across the site."},
+    {"text": "Study Hall notes now have a lighter pane for readability."},
+]
+
+def clean(items: List[Any]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for it in items:
+        if isinstance(it, str):
+            out.append({"text": it})
+        elif isinstance(it, dict) and it.get("text"):
+            out.append({"text": str(it.get("text")), "date": it.get("date")})
+    return out
+
+def _item_key(it: Dict[str, Any]) -> str:
+    raw = json.dumps([it.get("text"), it.get("date")], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(hashlib.sha256(raw).digest()[:12]).decode("ascii")
+
+class _Snapshot:
+    __slots__ = ("version", "items", "index", "page_size", "pages")
+
+    def __init__(self, version: Any, items: List[Dict[str, Any]], page_size: int):
+        self.version = version
+        self.items = items
+        self.page_size = page_size
+        # item key -> position of the item after it; the first duplicate wins
+        self.index: Dict[str, int] = {}
+        for i in range(len(items) - 1, -1, -1):
+            self.index[_item_key(items[i])] = i + 1
+        # cursor ("" for the first page) -> (body, etag); at most one page
+        # per item, so this stays small.
+        self.pages: Dict[str, Tuple[bytes, str]] = {}
+        self.page("")
+
+    def page(self, cursor: str) -> Optional[Tuple[bytes, str]]:
+        hit = self.pages.get(cursor)
+        if hit is not None:
+            return hit
+        start = self.index.get(cursor) if cursor else 0
+        if start is None:
+            return None
+        page = self.items[start:start + self.page_size]
+        nxt = _item_key(page[-1]) if start + self.page_size < len(self.items) else None
+        body = json.dumps({"items": page, "next_cursor": nxt}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        hit = self.pages[cursor] = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+        return hit
+
+class AnnouncementFeed:
+    def __init__(self, store: DataStore, page_size: int = PAGE_SIZE, recheck: float = 1.0):
+        self.store = store
+        self.page_size = max(1, page_size)
+        self.recheck = recheck
+        self._snap: Optional[_Snapshot] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"served": 0, "not_modified": 0, "rebuilds": 0}
+
+    def _version(self) -> Any:
+        try:
+            return self.store.announcements_version()
+        except Exception:
+            return None
+
+    def refresh(self) -> None:
+        # Rebuilds from the store; a failed read keeps the previous snapshot.
+        with self._lock:
+            version = self._version()
+            try:
+                items = self.store.announcements_list()
+            except Exception as e:
+                print(f"Announcements read failed: {e}")
+                if self._snap is not None:
+                    return
+                items = []
+            self._snap = _Snapshot(version, clean(DEFAULTS if items is None else items), self.page_size)
+            self._checked = time.monotonic()
+            self.counters["rebuilds"] += 1
+
+    def _current(self) -> _Snapshot:
+        now = time.monotonic()
+        if self._snap is None or (now - self._checked >= self.recheck and self._version() != self._snap.version):
+            self.refresh()
+        elif now - self._checked >= self.recheck:
+            self._checked = now
+        return self._snap
+
+    def page(self, cursor: str = "") -> Optional[Tuple[bytes, str]]:
+        # -> (body, etag), or None for a cursor whose item has since dropped
+        # off the end of the feed.
+        return self._current().page(cursor or "")
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snap
+        return {
+            "items": len(snap.items) if snap else None,
+            "pages": len(snap.pages) if snap else None,
+            **self.counters,
+        }
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# ---------- Response cache ----------
+# In-memory LRU with TTL in front of deterministic upstream calls, with an
+# optional on-disk tier so a cold worker can still answer without OpenAI.
+
+_MISSING = object()
+
+def _norm_text(s: Any) -> str:
+    return " ".join(str(s or "").split()).casefold()
+
+def make_key(model: str, temperature: float, messages: List[Dict[str, Any]]) -> str:
+    norm = [{"role": str(m.get("role") or ""), "content": _norm_text(m.get("content"))} for m in messages]
+    raw = json.dumps({"model": model, "temperature": round(float(temperature), 3), "messages": norm}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, name: str, max_entries: int = 1024, ttl: float = 3600.0, disk_dir: Optional[Path] = None, enabled: bool = True):
+        self.name = name
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.enabled = enabled
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        if self.disk_dir is None:
+            return None
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Any:
+        if not self.enabled:
+            return _MISSING
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                expires, value = hit
+                if expires > now:
+                    self._mem.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return value
+                del self._mem[key]
+        fp = self._disk_path(key)
+        if fp is not None:
+            try:
+                rec = json.loads(fp.read_text("utf-8"))
+                if float(rec.get("expires", 0)) > now:
+                    self._remember(key, rec["value"], float(rec["expires"]))
+                    with self._lock:
+                        self.counters["disk_hits"] += 1
+                    return rec["value"]
+                fp.unlink()
+            except Exception:
+                pass
+        with self._lock:
+            self.counters["misses"] += 1
+        return _MISSING
+
+    def _remember(self, key: str, value: Any, expires: float) -> None:
+        with self._lock:
+            self._mem[key] = (expires, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        expires = time.time() + self.ttl
+        self._remember(key, value, expires)
+        with self._lock:
+            self.counters["stores"] += 1
+        fp = self._disk_path(key)
+        if fp is not None:
+            try:
+                fp.parent.mkdir(parents=True, exist_ok=True)
+                tmp = fp.with_suffix(".tmp")
+                tmp.write_text(json.dumps({"expires": expires, "value": value}, ensure_ascii=False, separators=(",", ":")), "utf-8")
+                tmp.replace(fp)
+            except Exception:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "size": len(self._mem), **self.counters}
+
+def is_missing(value: Any) -> bool:
+    return value is _MISSING
+
+def bypass_requested(cache_control: str) -> bool:
+    # Lets a caller force a fresh upstream answer with `Cache-Control: no-cache`.
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    return "no-cache" in directives or "no-store" in directives
+
+def from_env(name: str, data_dir: Path) -> ResponseCache:
+    # RESPONSE_CACHE_<NAME>=0 turns a single endpoint's cache off;
+    # RESPONSE_CACHE_DISK=1 adds the on-disk tier under data/cache/<name>.
+    prefix = f"RESPONSE_CACHE_{name.upper()}"
+    enabled = (os.getenv(prefix) or os.getenv("RESPONSE_CACHE") or "1").strip().lower() not in ("0", "false", "no", "off")
+    try:
+        ttl = float(os.getenv(f"{prefix}_TTL") or os.getenv("RESPONSE_CACHE_TTL") or 3600)
+    except ValueError:
+        ttl = 3600.0
+    try:
+        size = int(os.getenv(f"{prefix}_SIZE") or os.getenv("RESPONSE_CACHE_SIZE") or 1024)
+    except ValueError:
+        size = 1024
+    disk = (os.getenv("RESPONSE_CACHE_DISK") or "").strip().lower() in ("1", "true", "yes")
+    return ResponseCache(name, max_entries=size, ttl=ttl, disk_dir=(data_dir / "cache" / name) if disk else None, enabled=enabled)
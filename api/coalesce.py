@@ -0,0 +1,230 @@
+import time
+import asyncio
+import secrets
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# ---------- Request coalescing ----------
+# Concurrent identical upstream requests share one OpenAI call. The shared
+# call runs in its own task so one caller disconnecting does not cancel it
+# for everybody else.
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self.counters: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.counters["leaders"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), **self.counters}
+
+class _Broadcast:
+    def __init__(self) -> None:
+        self.items: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+
+class StreamFanout:
+    # One upstream stream per key, replayed from the start to every subscriber
+    # that joins while it is still running.
+    def __init__(self, name: str):
+        self.name = name
+        self._streams: Dict[str, _Broadcast] = {}
+        self.counters: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    async def _pump(self, key: str, b: _Broadcast, source: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for item in source():
+                b.items.append(item)
+                b.changed.set()
+        except asyncio.CancelledError:
+            b.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            b.error = e
+        finally:
+            b.done = True
+            b.changed.set()
+            if self._streams.get(key) is b:
+                del self._streams[key]
+
+    async def subscribe(self, key: str, source: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        b = self._streams.get(key)
+        if b is None:
+            self.counters["leaders"] += 1
+            b = _Broadcast()
+            self._streams[key] = b
+            b.task = asyncio.ensure_future(self._pump(key, b, source))
+        else:
+            self.counters["coalesced"] += 1
+        b.subscribers += 1
+        pos = 0
+        try:
+            while True:
+                while pos < len(b.items):
+                    pos += 1
+                    yield b.items[pos - 1]
+                if b.done:
+                    if b.error is not None:
+                        raise b.error
+                    return
+                b.changed.clear()
+                if pos < len(b.items) or b.done:
+                    continue
+                await b.changed.wait()
+        finally:
+            b.subscribers -= 1
+            # Nobody is listening any more, so stop paying for tokens.
+            if b.subscribers == 0 and not b.done and b.task is not None:
+                b.task.cancel()
+
+    def running(self, key: str) -> bool:
+        # True while subscribe(key) would join a stream already in flight.
+        return key in self._streams
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._streams), **self.counters}
+
+def _item_size(item: Any) -> int:
+    if isinstance(item, dict):
+        return 16 + sum(len(v) for v in item.values() if isinstance(v, str))
+    return 16 + len(item) if isinstance(item, str) else 64
+
+class _Run:
+    def __init__(self, stream_id: str, owner: Optional[str], grace: float) -> None:
+        self.id = stream_id
+        self.owner = owner
+        self.grace = grace
+        self.items: List[Any] = []
+        self.first = 1  # seq of items[0]
+        self.size = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.finished_at = 0.0
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.reaper: Optional[asyncio.TimerHandle] = None
+
+class ResumableStreams:
+    # Streams whose items are numbered from 1 and kept in a replay buffer
+    # (at most `max_bytes` per stream, for `ttl` seconds after it ends), so a
+    # client that lost its connection can continue after the last seq it saw
+    # instead of starting over. The source runs in its own task; when the last
+    # reader leaves, it gets the stream's `grace` seconds to come back before
+    # the source is cancelled. Only finished runs are ever evicted; with
+    # `max_streams` live runs, start() declines and the caller streams
+    # without a buffer.
+    def __init__(self, name: str, max_streams: int = 256, ttl: float = 300.0, max_bytes: int = 1024 * 1024):
+        self.name = name
+        self.max_streams = max(1, max_streams)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._runs: "OrderedDict[str, _Run]" = OrderedDict()
+        self.counters: Dict[str, int] = {"started": 0, "resumed": 0, "abandoned": 0, "trimmed": 0, "full": 0}
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for sid in [sid for sid, r in self._runs.items() if r.done and now - r.finished_at > self.ttl]:
+            del self._runs[sid]
+        # Make room by dropping the oldest finished runs early.
+        excess = len(self._runs) - self.max_streams + 1
+        if excess > 0:
+            for sid in [sid for sid, r in self._runs.items() if r.done][:excess]:
+                del self._runs[sid]
+
+    async def _pump(self, run: _Run, source: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            async for item in source():
+                run.items.append(item)
+                run.size += _item_size(item)
+                while run.size > self.max_bytes and len(run.items) > 1:
+                    run.size -= _item_size(run.items.pop(0))
+                    run.first += 1
+                    self.counters["trimmed"] += 1
+                run.changed.set()
+        except asyncio.CancelledError:
+            run.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            run.error = e
+        finally:
+            run.done = True
+            run.finished_at = time.monotonic()
+            run.changed.set()
+
+    def start(self, source: Callable[[], AsyncIterator[Any]], owner: Optional[str] = None, grace: float = 0.0) -> Optional[str]:
+        # None, and nothing started, when every slot holds a live run.
+        self._prune()
+        if len(self._runs) >= self.max_streams:
+            self.counters["full"] += 1
+            return None
+        run = _Run(secrets.token_urlsafe(12), owner, grace)
+        self._runs[run.id] = run
+        run.task = asyncio.ensure_future(self._pump(run, source))
+        self.counters["started"] += 1
+        return run.id
+
+    def can_resume(self, stream_id: str, owner: Optional[str], after: int) -> bool:
+        # Streams can only be resumed by whoever started them, and only from
+        # a position that is still buffered.
+        self._prune()
+        run = self._runs.get(stream_id)
+        if run is None or run.owner != owner or run.error is not None:
+            return False
+        return run.first - 1 <= after <= run.first - 1 + len(run.items)
+
+    def _release(self, run: _Run) -> None:
+        if run.subscribers == 0 and not run.done and run.task is not None:
+            self.counters["abandoned"] += 1
+            run.task.cancel()
+
+    async def subscribe(self, stream_id: str, after: int = 0) -> AsyncIterator[Any]:
+        # Items with seq > `after`, replayed from the buffer, then live.
+        run = self._runs[stream_id]
+        if after:
+            self.counters["resumed"] += 1
+        if run.reaper is not None:
+            run.reaper.cancel()
+            run.reaper = None
+        run.subscribers += 1
+        seq = after + 1
+        try:
+            while True:
+                while seq - run.first < len(run.items):
+                    if seq < run.first:
+                        raise LookupError(f"stream {stream_id} no longer buffers seq {seq}")
+                    seq += 1
+                    yield run.items[seq - 1 - run.first]
+                if run.done:
+                    if run.error is not None:
+                        raise run.error
+                    return
+                run.changed.clear()
+                if seq - run.first < len(run.items) or run.done:
+                    continue
+                await run.changed.wait()
+        finally:
+            run.subscribers -= 1
+            if run.subscribers == 0 and not run.done:
+                if run.grace > 0:
+                    run.reaper = asyncio.get_running_loop().call_later(run.grace, self._release, run)
+                else:
+                    self._release(run)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"streams": len(self._runs), "running": sum(1 for r in self._runs.values() if not r.done), **self.counters}
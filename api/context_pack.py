@@ -0,0 +1,253 @@
+import os
+import time
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+from api import cache
+from api import coalesce
+
+# ---------- Token-aware context packing ----------
+# Chat history is packed newest-first into a per-plan token budget instead of
+# a fixed number of turns. Turns that no longer fit are folded into a rolling
+# summary, stored per conversation with a hash of the prefix it covers, so
+# later requests reuse it and extending it only summarizes the turns added
+# since. A new summary is made only when the kept turns outgrow the budget,
+# and it then absorbs enough of them to leave HEADROOM for the next turns.
+
+MESSAGE_OVERHEAD = 4  # role and separator tokens per chat message
+BUDGETS = {"associates": 1500, "bachelors": 3000, "masters": 6000}
+# Room kept in the budget for the summary message itself.
+SUMMARY_TOKENS = 250
+HEADROOM = 0.4
+# Most recent dropped turns fed to one summary call.
+SUMMARY_INPUT_TOKENS = 3000
+# After a failed summary call, fall back to plain truncation for this long.
+FAILURE_BACKOFF = 30.0
+LEGACY_TURNS = 16
+SUMMARY_PROMPT = (
+    "You keep notes for a tutor. Summarize the earlier part of this tutoring conversation in at most 120 words: "
+    "the student's goals and level, facts they shared, what has already been explained, and open questions. "
+    "Plain prose, no preamble."
+)
+
+_encoding: Any = None
+_encoding_loaded = False
+
+def _get_encoding() -> Any:
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            # o200k_base is the gpt-4o tokenizer; tiktoken fetches it once and caches it.
+            for name in ("o200k_base", "cl100k_base"):
+                try:
+                    _encoding = tiktoken.get_encoding(name)
+                    break
+                except Exception:
+                    continue
+    return _encoding
+
+def tokenizer() -> str:
+    enc = _get_encoding()
+    return enc.name if enc is not None else "approx"
+
+@lru_cache(maxsize=4096)
+def _count(text: str) -> int:
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # ~4 characters per token for English without tiktoken.
+    return (len(text) + 3) // 4
+
+def count_tokens(text: str) -> int:
+    # Clients resend the whole history every turn, so counts are memoized.
+    return _count(text or "")
+
+def message_tokens(m: Dict[str, str]) -> int:
+    return _count(m["content"]) + MESSAGE_OVERHEAD
+
+def clean_history(hist: Any, last: Optional[int] = None) -> List[Dict[str, str]]:
+    # Valid user/assistant turns, copied in one pass; with `last`, only the
+    # newest `last` of them, walking back from the end.
+    if not isinstance(hist, list):
+        return []
+    items = reversed(hist) if last is not None else hist
+    out: List[Dict[str, str]] = []
+    for m in items:
+        if isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str):
+            out.append({"role": m["role"], "content": m["content"]})
+            if last is not None and len(out) >= last:
+                break
+    if last is not None:
+        out.reverse()
+    return out
+
+def prefix_hash(msgs: List[Dict[str, str]], n: int) -> str:
+    h = hashlib.sha256()
+    for m in msgs[:n]:
+        h.update(m["role"].encode("utf-8") + b"\0" + m["content"].encode("utf-8") + b"\x1e")
+    return h.hexdigest()
+
+def budgets_from_env() -> Dict[str, int]:
+    # CONTEXT_BUDGET_<PLAN> overrides the history budget of one plan.
+    out = dict(BUDGETS)
+    for plan in out:
+        try:
+            out[plan] = max(0, int(os.getenv(f"CONTEXT_BUDGET_{plan.upper()}") or out[plan]))
+        except ValueError:
+            pass
+    return out
+
+def fit(msgs: List[Dict[str, str]], limit: int, lo: int = 0) -> int:
+    # Smallest start >= lo such that msgs[start:] fits in `limit` tokens.
+    used = 0
+    start = len(msgs)
+    while start > lo:
+        cost = message_tokens(msgs[start - 1])
+        if used + cost > limit:
+            break
+        used += cost
+        start -= 1
+    return start
+
+def summary_message(summary: str) -> Dict[str, str]:
+    return {"role": "system", "content": "Summary of the earlier conversation: " + summary}
+
+def _transcript(prev: Optional[str], turns: List[Dict[str, str]], limit: int) -> str:
+    lines: List[str] = []
+    used = 0
+    for m in reversed(turns):
+        line = f"{m['role'].capitalize()}: {m['content']}"
+        cost = count_tokens(line)
+        if used + cost > limit:
+            if not lines:
+                lines.append(line[: limit * 4])
+            break
+        lines.append(line)
+        used += cost
+    body = "\n".join(reversed(lines))
+    if prev:
+        return f"Summary so far:\n{prev}\n\nLater turns:\n{body}"
+    return f"Conversation:\n{body}"
+
+class ContextPacker:
+    # `complete(messages)` returns the summary text from the model. Summaries
+    # live in `store` under the prefix hash (shared by anyone with the same
+    # history) and under the conversation key (the latest one, to extend).
+    def __init__(
+        self,
+        complete: Callable[[List[Dict[str, Any]]], Awaitable[str]],
+        store: cache.ResponseCache,
+        budgets: Optional[Dict[str, int]] = None,
+        summary_timeout: float = 5.0,
+        enabled: bool = True,
+    ):
+        self._complete = complete
+        self.store = store
+        self.budgets = budgets or dict(BUDGETS)
+        self.summary_timeout = summary_timeout
+        self.enabled = enabled
+        self._flights = coalesce.SingleFlight("summary")
+        self._failed_until = 0.0
+        self.counters: Dict[str, int] = {"packed": 0, "truncated": 0, "summary_reused": 0, "summaries": 0, "summary_failures": 0}
+
+    def budget(self, plan: str) -> int:
+        # Unknown plans get the smallest budget.
+        return self.budgets.get(plan, min(self.budgets.values()))
+
+    def _owner_key(self, student_id: Optional[str], msgs: List[Dict[str, str]]) -> str:
+        # Signed-in students have one rolling summary; anonymous chats are told
+        # apart by their first message.
+        owner = f"student:{student_id}" if student_id else f"chat:{prefix_hash(msgs, 1)}"
+        return hashlib.sha256(owner.encode("utf-8")).hexdigest()
+
+    def _valid(self, rec: Any, msgs: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        if not isinstance(rec, dict) or not isinstance(rec.get("summary"), str):
+            return None
+        cut = int(rec.get("cut") or 0)
+        if cut <= 0 or cut > len(msgs) or rec.get("hash") != prefix_hash(msgs, cut):
+            return None
+        return rec
+
+    async def _summarize(self, owner: str, msgs: List[Dict[str, str]], cut: int, base: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        digest = prefix_hash(msgs, cut)
+        hit = self._valid(self.store.get(digest), msgs)
+        if hit is not None:
+            self.counters["summary_reused"] += 1
+            self.store.set(owner, hit)
+            return hit
+        if time.monotonic() < self._failed_until:
+            return None
+        # Extend the previous summary when it covers a prefix of this one.
+        if base is not None and base["cut"] < cut:
+            prev, turns = base["summary"], msgs[base["cut"]:cut]
+        else:
+            prev, turns = None, msgs[:cut]
+        prompt = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": _transcript(prev, turns, SUMMARY_INPUT_TOKENS)},
+        ]
+
+        async def make() -> Dict[str, Any]:
+            text = (await self._complete(prompt) or "").strip()
+            if not text:
+                raise ValueError("empty summary")
+            rec = {"cut": cut, "hash": digest, "summary": text}
+            self.counters["summaries"] += 1
+            self.store.set(digest, rec)
+            self.store.set(owner, rec)
+            return rec
+
+        try:
+            # On timeout the shared call keeps running and the next request
+            # finds its result in the store.
+            return await asyncio.wait_for(self._flights.do(digest, make), self.summary_timeout)
+        except Exception as e:
+            print(f"History summary failed: {e!r}")
+            self.counters["summary_failures"] += 1
+            self._failed_until = time.monotonic() + FAILURE_BACKOFF
+            return None
+
+    async def pack(self, hist: Any, plan: str, student_id: Optional[str] = None, summarize: bool = True) -> List[Dict[str, str]]:
+        # -> the history to send: an optional summary message, then the
+        # newest turns that fit the plan's budget.
+        if not self.enabled:
+            return clean_history(hist, LEGACY_TURNS)
+        msgs = clean_history(hist)
+        self.counters["packed"] += 1
+        budget = self.budget(plan)
+        start = fit(msgs, budget)
+        if start == 0:
+            return msgs
+        if not summarize or not self.store.enabled:
+            self.counters["truncated"] += 1
+            return msgs[start:]
+
+        window = max(0, budget - SUMMARY_TOKENS)
+        owner = self._owner_key(student_id, msgs)
+        rec = self._valid(self.store.get(owner), msgs)
+        if rec is None or fit(msgs, window, rec["cut"]) > rec["cut"]:
+            cut = fit(msgs, int(window * (1 - HEADROOM)))
+            rec = await self._summarize(owner, msgs, cut, rec) or rec
+        if rec is None:
+            self.counters["truncated"] += 1
+            return msgs[start:]
+        # Normally the turns right after the summary; only when making a newer
+        # summary failed is there a gap.
+        return [summary_message(rec["summary"])] + msgs[fit(msgs, window, rec["cut"]):]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "tokenizer": tokenizer(),
+            "budgets": self.budgets,
+            "summary_cache": self.store.stats(),
+            "summary_flights": self._flights.stats(),
+            **self.counters,
+        }
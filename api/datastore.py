@@ -0,0 +1,478 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+from api.history_store import HistoryStore, clean_message
+
+# ---------- Persistent state backends ----------
+# History, subscriptions, announcements and photos all go through a DataStore.
+# FileStore keeps the original data/ layout; SqliteStore keeps everything in a
+# single WAL-mode database that is safe to share between uvicorn workers.
+
+def safe_id(student_id: str) -> str:
+    return "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
+
+def safe_name(name: str) -> str:
+    return "".join(c for c in (name or "") if c.isalnum() or c in ("-", "_", ".")).lstrip(".")
+
+class DataStore:
+    name = "base"
+
+    def history_read(self, student_id: str, since: Optional[int] = None, before: Optional[int] = None, limit: int = 200) -> Tuple[List[Dict[str, Any]], int, bool]:
+        raise NotImplementedError
+
+    def history_append(self, student_id: str, messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def history_replace(self, student_id: str, messages: List[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    def sub_get(self, student_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def sub_update(self, student_id: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        # Atomic read-modify-write: `fn` gets the current record (or {}).
+        raise NotImplementedError
+
+    def sub_version(self) -> Any:
+        # Changes whenever any subscription record changes, from any worker.
+        raise NotImplementedError
+
+    def announcements_list(self) -> Optional[List[Any]]:
+        # None means "never written", so callers can show their defaults.
+        raise NotImplementedError
+
+    def announcement_add(self, item: Dict[str, Any], keep: int = 100) -> int:
+        raise NotImplementedError
+
+    def announcements_version(self) -> Any:
+        # Changes whenever the announcements change, from any worker.
+        raise NotImplementedError
+
+    def photo_get(self, student_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def photo_put(self, student_id: str, data: bytes, variants: Optional[Dict[str, bytes]] = None) -> None:
+        # Replaces the original and all of its resized variants.
+        raise NotImplementedError
+
+    def photo_updated(self, student_id: str) -> Optional[float]:
+        # Unix time of the last photo_put, or None when there is no photo.
+        raise NotImplementedError
+
+    def photo_variants(self, student_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def photo_variant_get(self, student_id: str, name: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+# ---------- File layout ----------
+
+def _atomic_write(fp: Path, data: bytes) -> None:
+    tmp = fp.with_name(f".{fp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(fp)
+
+class FileStore(DataStore):
+    name = "file"
+
+    def __init__(self, data_dir: Path, history_max: int = 10000):
+        self.data_dir = data_dir
+        self.subs_dir = data_dir / "subscriptions"
+        self.photos_dir = data_dir / "photos"
+        self.announcements_file = data_dir / "announcements.json"
+        self.history = HistoryStore(data_dir / "history", max_messages=history_max)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, lock_path: Path) -> Iterator[None]:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with lock_path.open("a") as lf:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    def history_read(self, student_id, since=None, before=None, limit=200):
+        return self.history.read(student_id, since, before, limit)
+
+    def history_append(self, student_id, messages):
+        return self.history.append(student_id, messages)
+
+    def history_replace(self, student_id, messages):
+        return self.history.replace(student_id, messages)
+
+    def sub_path(self, student_id: str) -> Path:
+        return self.subs_dir / f"{safe_id(student_id)}.json"
+
+    def sub_get(self, student_id):
+        fp = self.sub_path(student_id)
+        try:
+            data = json.loads(fp.read_text("utf-8"))
+        except Exception:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def sub_update(self, student_id, fn):
+        fp = self.sub_path(student_id)
+        with self._locked(fp.with_suffix(".lock")):
+            current = self.sub_get(student_id) or {}
+            updated = fn(dict(current))
+            _atomic_write(fp, json.dumps(updated, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            return updated
+
+    def sub_version(self):
+        # Records are replaced by rename, which bumps the directory mtime.
+        try:
+            st = self.subs_dir.stat()
+            return (st.st_mtime_ns, st.st_ino)
+        except Exception:
+            return None
+
+    def announcements_list(self):
+        try:
+            data = json.loads(self.announcements_file.read_text("utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            return []
+        return data if isinstance(data, list) else (data.get("items") or [] if isinstance(data, dict) else [])
+
+    def announcement_add(self, item, keep=100):
+        with self._locked(self.announcements_file.with_suffix(".lock")):
+            items = self.announcements_list() or []
+            items = [item] + [it for it in items if isinstance(it, dict) and isinstance(it.get("text"), str)]
+            items = items[:keep]
+            _atomic_write(self.announcements_file, json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            return len(items)
+
+    def announcements_version(self):
+        # Writes replace the file by rename, so the inode changes with every one.
+        try:
+            st = self.announcements_file.stat()
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def photo_path(self, student_id: str) -> Path:
+        return self.photos_dir / f"{safe_id(student_id)}.png"
+
+    def photo_get(self, student_id):
+        try:
+            return self.photo_path(student_id).read_bytes()
+        except Exception:
+            return None
+
+    def photo_put(self, student_id, data, variants=None):
+        self.photos_dir.mkdir(parents=True, exist_ok=True)
+        vdir = self.photos_dir / safe_id(student_id)
+        with self._locked(self.photos_dir / f".{safe_id(student_id)}.lock"):
+            if vdir.exists():
+                for fp in vdir.iterdir():
+                    fp.unlink()
+            if variants:
+                vdir.mkdir(exist_ok=True)
+                for name, blob in variants.items():
+                    _atomic_write(vdir / safe_name(name), blob)
+            _atomic_write(self.photo_path(student_id), data)
+
+    def photo_updated(self, student_id):
+        try:
+            return self.photo_path(student_id).stat().st_mtime
+        except Exception:
+            return None
+
+    def photo_variants(self, student_id):
+        vdir = self.photos_dir / safe_id(student_id)
+        try:
+            return sorted(fp.name for fp in vdir.iterdir() if not fp.name.startswith("."))
+        except Exception:
+            return []
+
+    def photo_variant_get(self, student_id, name):
+        try:
+            return (self.photos_dir / safe_id(student_id) / safe_name(name)).read_bytes()
+        except Exception:
+            return None
+
+# ---------- SQLite (WAL) ----------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    student_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    msg_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ts REAL,
+    PRIMARY KEY (student_id, seq)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS history_msg_id ON history (student_id, msg_id) WHERE msg_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS subscriptions (
+    student_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS announcements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    date TEXT
+);
+CREATE TABLE IF NOT EXISTS photos (
+    student_id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS photo_variants (
+    student_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (student_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class SqliteStore(DataStore):
+    name = "sqlite"
+
+    def __init__(self, path: Path, pool_size: int = 4, history_max: int = 10000):
+        self.path = path
+        self.history_max = max(1, history_max)
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._all: List[sqlite3.Connection] = []
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for _ in range(max(1, pool_size)):
+            conn = self._connect()
+            self._pool.put(conn)
+            self._all.append(conn)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are opened explicitly below, so
+        # writers can take the lock up front with BEGIN IMMEDIATE.
+        conn = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        for conn in self._all:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _row_msg(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        seq, msg_id, role, content = row
+        m: Dict[str, Any] = {"role": role, "content": content, "seq": seq}
+        if msg_id:
+            m["id"] = msg_id
+        return m
+
+    def _last_seq(self, conn: sqlite3.Connection, sid: str) -> int:
+        row = conn.execute("SELECT MAX(seq) FROM history WHERE student_id = ?", (sid,)).fetchone()
+        return int(row[0] or 0)
+
+    def history_read(self, student_id, since=None, before=None, limit=200):
+        sid = safe_id(student_id)
+        limit = max(1, min(limit, 1000))
+        with self._conn() as conn:
+            last = self._last_seq(conn, sid)
+            if since is not None:
+                rows = conn.execute(
+                    "SELECT seq, msg_id, role, content FROM history WHERE student_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (sid, since, limit + 1),
+                ).fetchall()
+                return [self._row_msg(r) for r in rows[:limit]], last, len(rows) > limit
+            rows = conn.execute(
+                "SELECT seq, msg_id, role, content FROM history WHERE student_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (sid, before if before is not None else last + 1, limit + 1),
+            ).fetchall()
+            page = [self._row_msg(r) for r in reversed(rows[:limit])]
+            return page, last, len(rows) > limit
+
+    def _insert_messages(self, conn: sqlite3.Connection, sid: str, messages: List[Dict[str, Any]], base: int) -> int:
+        n = 0
+        now = round(time.time(), 3)
+        for m in messages:
+            c = clean_message(m)
+            if not c:
+                continue
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO history (student_id, seq, msg_id, role, content, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                (sid, base + n + 1, c.get("id"), c["role"], c["content"], now),
+            )
+            n += cur.rowcount
+        return n
+
+    def _trim(self, conn: sqlite3.Connection, sid: str, last: int) -> None:
+        conn.execute("DELETE FROM history WHERE student_id = ? AND seq <= ?", (sid, last - self.history_max))
+
+    def history_append(self, student_id, messages):
+        sid = safe_id(student_id)
+        with self._write() as conn:
+            base = self._last_seq(conn, sid)
+            n = self._insert_messages(conn, sid, messages, base)
+            self._trim(conn, sid, base + n)
+            return n, base + n
+
+    def history_replace(self, student_id, messages):
+        sid = safe_id(student_id)
+        with self._write() as conn:
+            base = self._last_seq(conn, sid)
+            conn.execute("DELETE FROM history WHERE student_id = ?", (sid,))
+            n = self._insert_messages(conn, sid, messages[-self.history_max:], base)
+            return n
+
+    def sub_get(self, student_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT data FROM subscriptions WHERE student_id = ?", (safe_id(student_id),)).fetchone()
+        if not row:
+            return None
+        try:
+            data = json.loads(row[0])
+        except Exception:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def sub_update(self, student_id, fn):
+        sid = safe_id(student_id)
+        with self._write() as conn:
+            row = conn.execute("SELECT data FROM subscriptions WHERE student_id = ?", (sid,)).fetchone()
+            try:
+                current = json.loads(row[0]) if row else {}
+            except Exception:
+                current = {}
+            updated = fn(current if isinstance(current, dict) else {})
+            conn.execute(
+                "INSERT INTO subscriptions (student_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (sid, json.dumps(updated, ensure_ascii=False, separators=(",", ":")), time.time()),
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('subs_version', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+            return updated
+
+    def sub_version(self):
+        with self._conn() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'subs_version'").fetchone()
+        return row[0] if row else None
+
+    def announcements_list(self):
+        with self._conn() as conn:
+            rows = conn.execute("SELECT text, date FROM announcements ORDER BY id DESC LIMIT 100").fetchall()
+            if not rows and not conn.execute("SELECT 1 FROM meta WHERE key = 'announcements_written'").fetchone():
+                return None
+        return [{"text": t, "date": d} if d else {"text": t} for t, d in rows]
+
+    def announcement_add(self, item, keep=100):
+        with self._write() as conn:
+            conn.execute("INSERT INTO announcements (text, date) VALUES (?, ?)", (str(item.get("text")), item.get("date")))
+            conn.execute("DELETE FROM announcements WHERE id NOT IN (SELECT id FROM announcements ORDER BY id DESC LIMIT ?)", (keep,))
+            # Counts writes, so it doubles as the version stamp.
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('announcements_written', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+            return int(conn.execute("SELECT COUNT(*) FROM announcements").fetchone()[0])
+
+    def announcements_version(self):
+        with self._conn() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'announcements_written'").fetchone()
+        return row[0] if row else None
+
+    def photo_get(self, student_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT data FROM photos WHERE student_id = ?", (safe_id(student_id),)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def photo_put(self, student_id, data, variants=None):
+        sid = safe_id(student_id)
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO photos (student_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (sid, sqlite3.Binary(data), time.time()),
+            )
+            conn.execute("DELETE FROM photo_variants WHERE student_id = ?", (sid,))
+            conn.executemany(
+                "INSERT INTO photo_variants (student_id, name, data) VALUES (?, ?, ?)",
+                [(sid, safe_name(name), sqlite3.Binary(blob)) for name, blob in (variants or {}).items()],
+            )
+
+    def photo_updated(self, student_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT updated_at FROM photos WHERE student_id = ?", (safe_id(student_id),)).fetchone()
+        return float(row[0]) if row else None
+
+    def photo_variants(self, student_id):
+        with self._conn() as conn:
+            rows = conn.execute("SELECT name FROM photo_variants WHERE student_id = ? ORDER BY name", (safe_id(student_id),)).fetchall()
+        return [r[0] for r in rows]
+
+    def photo_variant_get(self, student_id, name):
+        with self._conn() as conn:
+            row = conn.execute("SELECT data FROM photo_variants WHERE student_id = ? AND name = ?", (safe_id(student_id), safe_name(name))).fetchone()
+        return bytes(row[0]) if row else None
+
+def from_env(data_dir: Path) -> DataStore:
+    # DATA_BACKEND=sqlite switches to data/botnology.db (or SQLITE_PATH).
+    try:
+        history_max = int(os.getenv("HISTORY_MAX_MESSAGES") or 10000)
+    except ValueError:
+        history_max = 10000
+    backend = (os.getenv("DATA_BACKEND") or "file").strip().lower()
+    if backend == "sqlite":
+        path = Path(os.getenv("SQLITE_PATH") or (data_dir / "botnology.db"))
+        try:
+            pool = int(os.getenv("SQLITE_POOL_SIZE") or 4)
+        except ValueError:
+            pool = 4
+        return SqliteStore(path, pool_size=pool, history_max=history_max)
+    return FileStore(data_dir, history_max=history_max)
@@ -0,0 +1,209 @@
+import os
+import bisect
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+# ---------- Append-only chat history ----------
+# One JSONL log per student (`<id>.jsonl`). Every line is a message with a
+# server-assigned `seq`, so clients can page with cursors and only upload
+# new messages. Writers from several tabs or workers append under an
+# advisory file lock, duplicates are dropped by message id, and the log is
+# compacted down to the newest `max_messages` once it grows past that.
+
+ROLES = ("user", "assistant")
+
+def clean_message(m: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(m, dict) or m.get("role") not in ROLES:
+        return None
+    out: Dict[str, Any] = {"role": m["role"], "content": str(m.get("content", ""))}
+    if m.get("id"):
+        out["id"] = str(m["id"])[:64]
+    return out
+
+def _seq(m: Dict[str, Any]) -> int:
+    return int(m.get("seq") or 0)
+
+class _Log:
+    def __init__(self) -> None:
+        self.messages: List[Dict[str, Any]] = []
+        self.ids: set = set()
+        self.offset = 0
+        self.inode = 0
+        self.head = b""
+        self.last_seq = 0
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        self.messages.append(rec)
+        if rec.get("id"):
+            self.ids.add(rec["id"])
+        self.last_seq = max(self.last_seq, _seq(rec))
+
+class HistoryStore:
+    def __init__(self, root: Path, max_messages: int = 10000, cache_students: int = 256):
+        self.root = root
+        self.max_messages = max(1, max_messages)
+        self.cache_students = max(1, cache_students)
+        self._logs: "OrderedDict[str, _Log]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def safe_id(student_id: str) -> str:
+        return "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
+
+    def log_path(self, student_id: str) -> Path:
+        return self.root / f"{self.safe_id(student_id)}.jsonl"
+
+    def legacy_path(self, student_id: str) -> Path:
+        return self.root / f"{self.safe_id(student_id)}.json"
+
+    @contextmanager
+    def _locked(self, student_id: str) -> Iterator[None]:
+        # Serializes writers within this process (thread lock) and across
+        # workers (flock on a sidecar file, where the platform has it).
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with (self.root / f"{self.safe_id(student_id)}.lock").open("a") as lf:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    def _legacy_messages(self, student_id: str) -> List[Dict[str, Any]]:
+        fp = self.legacy_path(student_id)
+        if not fp.exists():
+            return []
+        try:
+            data = json.loads(fp.read_text("utf-8"))
+            items = data if isinstance(data, list) else data.get("history") or []
+        except Exception:
+            return []
+        out = []
+        for m in items:
+            c = clean_message(m)
+            if c:
+                c["seq"] = len(out) + 1
+                out.append(c)
+        return out
+
+    def _refresh(self, student_id: str) -> _Log:
+        # Reads only the bytes appended since the last call; a changed inode,
+        # a shorter file or a different first line means another worker
+        # compacted the log, so reload. (The compacted file can get the old
+        # file's inode number back, hence the first-line check.)
+        key = self.safe_id(student_id)
+        log = self._logs.get(key)
+        if log is None:
+            log = _Log()
+            self._logs[key] = log
+            while len(self._logs) > self.cache_students:
+                self._logs.popitem(last=False)
+        self._logs.move_to_end(key)
+
+        fp = self.log_path(student_id)
+        try:
+            st = fp.stat()
+        except FileNotFoundError:
+            if not log.messages and log.offset == 0:
+                for rec in self._legacy_messages(student_id):
+                    log.add(rec)
+                log.offset = -1
+            return log
+        with fp.open("rb") as f:
+            if log.inode == st.st_ino and log.offset > 0 and st.st_size >= log.offset and f.read(len(log.head)) != log.head:
+                log.inode = 0
+            if log.inode != st.st_ino or st.st_size < log.offset or log.offset < 0:
+                fresh = _Log()
+                self._logs[key] = log = fresh
+                log.inode = st.st_ino
+            if st.st_size == log.offset:
+                return log
+            f.seek(log.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if log.offset == 0:
+            log.head = data[:data.find(b"\n") + 1]
+        for line in data[:end].splitlines():
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(rec, dict) and rec.get("role") in ROLES:
+                log.add(rec)
+        log.offset += end
+        return log
+
+    def read(self, student_id: str, since: Optional[int] = None, before: Optional[int] = None, limit: int = 200) -> Tuple[List[Dict[str, Any]], int, bool]:
+        # Returns (page, newest seq, whether more messages exist in the paging direction).
+        limit = max(1, min(limit, 1000))
+        with self._lock:
+            log = self._refresh(student_id)
+            msgs = log.messages
+            last_seq = log.last_seq
+            # Seqs only ever grow along the log, so cursors are a binary search.
+            if since is not None:
+                lo = bisect.bisect_right(msgs, since, key=_seq)
+                return msgs[lo:lo + limit], last_seq, len(msgs) - lo > limit
+            hi = len(msgs) if before is None else bisect.bisect_left(msgs, before, key=_seq)
+            return msgs[max(0, hi - limit):hi], last_seq, hi > limit
+
+    def append(self, student_id: str, messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        # Returns (appended count, newest seq). Messages whose id is already in
+        # the log are skipped, which makes client retries and two tabs harmless.
+        with self._locked(student_id):
+            log = self._refresh(student_id)
+            seeded = log.offset < 0
+            fresh: List[Dict[str, Any]] = []
+            batch: set = set()
+            for m in messages:
+                c = clean_message(m)
+                if not c or (c.get("id") and (c["id"] in log.ids or c["id"] in batch)):
+                    continue
+                if c.get("id"):
+                    batch.add(c["id"])
+                c["seq"] = log.last_seq + len(fresh) + 1
+                c["ts"] = round(time.time(), 3)
+                fresh.append(c)
+            if seeded:
+                # First write after a legacy .json history: start the log with it.
+                self._rewrite(student_id, log.messages + fresh)
+            elif fresh:
+                fp = self.log_path(student_id)
+                payload = "".join(json.dumps(c, ensure_ascii=False, separators=(",", ":")) + "\n" for c in fresh)
+                with fp.open("a", encoding="utf-8") as f:
+                    f.write(payload)
+            log = self._refresh(student_id)
+            if len(log.messages) > self.max_messages * 5 // 4:
+                self._rewrite(student_id, log.messages[-self.max_messages:])
+                log = self._refresh(student_id)
+            return len(fresh), log.last_seq
+
+    def replace(self, student_id: str, messages: List[Dict[str, Any]]) -> int:
+        # Full overwrite for the legacy POST /api/history; seqs keep growing so
+        # existing cursors never point at reused numbers.
+        with self._locked(student_id):
+            log = self._refresh(student_id)
+            base = log.last_seq
+            cleaned = [c for c in (clean_message(m) for m in messages) if c]
+            for i, c in enumerate(cleaned):
+                c["seq"] = base + i + 1
+            self._rewrite(student_id, cleaned[-self.max_messages:])
+            return len(cleaned[-self.max_messages:])
+
+    def _rewrite(self, student_id: str, messages: List[Dict[str, Any]]) -> None:
+        fp = self.log_path(student_id)
+        tmp = fp.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text("".join(json.dumps(m, ensure_ascii=False, separators=(",", ":")) + "\n" for m in messages), "utf-8")
+        tmp.replace(fp)
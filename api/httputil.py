@@ -0,0 +1,63 @@
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+# ---------- Small HTTP helpers shared by the binary endpoints ----------
+
+CHUNK_SIZE = 64 * 1024
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((t[2:] if t.startswith("W/") else t) == bare for t in tags)
+
+def http_date(ts: float) -> str:
+    return formatdate(ts, usegmt=True)
+
+def not_modified_since(if_modified_since: str, ts: float) -> bool:
+    # HTTP dates have one-second resolution.
+    if not if_modified_since:
+        return False
+    try:
+        return int(ts) <= int(parsedate_to_datetime(if_modified_since).timestamp())
+    except Exception:
+        return False
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    # Returns an inclusive (start, end) for a single `bytes=` range, None when
+    # there is no usable Range header, and raises ValueError when unsatisfiable.
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    spec = header.split("=", 1)[1].strip()
+    if "," in spec:
+        return None
+    first, _, last = spec.partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            if n <= 0:
+                raise ValueError("empty suffix range")
+            return max(0, size - n), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError("malformed range")
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+async def iter_file(fp: Path, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    remaining = None if end is None else end - start + 1
+    with fp.open("rb") as f:
+        f.seek(start)
+        while remaining is None or remaining > 0:
+            data = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
@@ -0,0 +1,151 @@
+import io
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+    ImageOps = None
+try:
+    # Registers AVIF on Pillow builds that lack it.
+    import pillow_avif
+except Exception:
+    pillow_avif = None
+
+# ---------- Responsive image variants ----------
+# Variants are named "w<width>.<format>", e.g. "w640.webp", and square
+# center-cropped thumbnails "t<size>.<format>". They are made at build time
+# for public/ images and at upload time for student photos, and the server
+# picks one per request from the Accept header and a ?w= width.
+
+WIDTHS = (160, 320, 640, 1280)
+# Photos are shown as avatars and ID-card portraits, never full-bleed.
+PHOTO_WIDTHS = (96, 160, 320, 640)
+THUMB_SIZES = (64, 128, 256)
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+QUALITY = {"avif": 55, "webp": 78, "jpeg": 82}
+# Best first; jpeg is the universal fallback.
+PREFERENCE = ("avif", "webp", "jpeg")
+NAME_RE = re.compile(r"^([wt])(\d+)\.(avif|webp|jpeg)$")
+
+_formats: Optional[Tuple[str, ...]] = None
+
+def available() -> bool:
+    return Image is not None
+
+def formats() -> Tuple[str, ...]:
+    global _formats
+    if _formats is None:
+        if Image is None:
+            _formats = ()
+        else:
+            Image.init()
+            _formats = tuple(f for f in PREFERENCE if f.upper() in Image.SAVE)
+    return _formats
+
+def sniff(data: bytes) -> str:
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+def variant_name(fmt: str, width: int, kind: str = "w") -> str:
+    return f"{kind}{width}.{fmt}"
+
+def parse_name(name: str) -> Optional[Tuple[str, str, int]]:
+    # -> (kind, format, width)
+    m = NAME_RE.match(name or "")
+    return (m.group(1), m.group(3), int(m.group(2))) if m else None
+
+def media_type(name: str) -> str:
+    parsed = parse_name(name)
+    return MEDIA_TYPES[parsed[1]] if parsed else "application/octet-stream"
+
+def _open(data: bytes) -> "Image.Image":
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception as e:
+        raise ValueError(f"Not a readable image: {e}")
+    # Phone photos carry their rotation in EXIF, which the encoders drop.
+    return ImageOps.exif_transpose(img)
+
+def _encode(img: "Image.Image", fmt: str, width: int) -> bytes:
+    if img.width > width:
+        img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+    if fmt == "jpeg":
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    out = io.BytesIO()
+    opts: Dict[str, object] = {"quality": QUALITY[fmt]}
+    if fmt == "jpeg":
+        opts.update(optimize=True, progressive=True)
+    elif fmt == "webp":
+        opts["method"] = 4
+    img.save(out, format=fmt.upper(), **opts)
+    return out.getvalue()
+
+def make_variants(data: bytes, widths: Iterable[int] = WIDTHS, fmts: Optional[Iterable[str]] = None, thumbs: Iterable[int] = ()) -> Dict[str, bytes]:
+    # Never upscales: widths past the source collapse into one source-width variant.
+    if Image is None:
+        return {}
+    img = _open(data)
+    targets = sorted({min(int(w), img.width) for w in widths})
+    squares = sorted({min(int(s), img.width, img.height) for s in thumbs})
+    out: Dict[str, bytes] = {}
+    for fmt in (fmts or formats()):
+        for w in targets:
+            out[variant_name(fmt, w)] = _encode(img, fmt, w)
+        for s in squares:
+            out[variant_name(fmt, s, "t")] = _encode(ImageOps.fit(img, (s, s), Image.LANCZOS), fmt, s)
+    return out
+
+def _accepts(accept: str, fmt: str) -> bool:
+    if fmt == "jpeg":
+        return True
+    for part in (accept or "").lower().split(","):
+        media, _, params = part.strip().partition(";")
+        if media.strip() != MEDIA_TYPES[fmt]:
+            continue
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+def pick(names: Iterable[str], accept: str, width: Optional[int] = None, kind: str = "w") -> Optional[str]:
+    # Best accepted format, then the smallest variant at least `width` wide
+    # (the largest one when no width is asked for or none is wide enough).
+    by_fmt: Dict[str, List[int]] = {}
+    for name in names:
+        parsed = parse_name(name)
+        if parsed and parsed[0] == kind:
+            by_fmt.setdefault(parsed[1], []).append(parsed[2])
+    for fmt in PREFERENCE:
+        sizes = sorted(by_fmt.get(fmt) or ())
+        if not sizes or not _accepts(accept, fmt):
+            continue
+        if width:
+            fits = [w for w in sizes if w >= width]
+            return variant_name(fmt, fits[0] if fits else sizes[-1], kind)
+        return variant_name(fmt, sizes[-1], kind)
+    return None
+
+def parse_width(raw: Optional[str]) -> Optional[int]:
+    try:
+        w = int(raw or 0)
+    except ValueError:
+        return None
+    return w if w > 0 else None
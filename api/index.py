@@ -1,27 +1,61 @@
 import os
 import json
+import asyncio
+import mimetypes
 import base64
 import hmac
 import hashlib
+import time
+import threading
+from collections import OrderedDict
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional, List, cast
+from typing import Any, Dict, Optional, List, Tuple
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
-import httpx
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.background import BackgroundTask
+from api import upstream
+from api import cache
+from api import coalesce
+from api import httputil
+from api import tts_cache
+from api import speech
+from api import datastore
+from api import subs_cache
+from api import static_assets
+from api import images
+from api import storage_store
+from api import search_index
+from api import context_pack
+from api import prompts
+from api import sse
+from api import admission
+from api import announcements
+from api import webhook_inbox
+from api import outbound
+from api import quiz_bank
 
 try:
     from mangum import Mangum
 except Exception:
     Mangum = None
 
-app = FastAPI()
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    outbound.open_all()
+    # Events received before a crash or restart are still in the inbox.
+    if WEBHOOKS.pending_bytes():
+        WEBHOOKS.kick()
+    if QUIZ_BANK_PREFILL:
+        QUIZ_BANK.prefill(QUIZ_BANK_TOPICS, QUIZ_BANK_LEVELS)
+    try:
+        yield
+    finally:
+        await outbound.aclose()
+
+app = FastAPI(lifespan=_lifespan)
 
 # ---------- CORS (tighten later) ----------
 app.add_middleware(
@@ -36,7 +70,7 @@ app.add_middleware(
 try:
     ROOT_DIR = Path(__file__).resolve().parents[1]
     PUBLIC_DIR = ROOT_DIR / "public"
-    DATA_DIR = ROOT_DIR / "data"
+    DATA_DIR = Path(os.getenv("DATA_DIR") or (ROOT_DIR / "data"))
     HISTORY_DIR = DATA_DIR / "history"
     SUBS_DIR = DATA_DIR / "subscriptions"
     PHOTOS_DIR = DATA_DIR / "photos"
@@ -63,14 +97,114 @@ if os.getenv("VERCEL") and not PUBLIC_DIR.exists():
     
 _app_secret_env = os.getenv("APP_SECRET") or os.getenv("JWT_SECRET")
 APP_SECRET = (_app_secret_env or "botnology-dev-secret").encode("utf-8")
-OPENAI_ENABLED = bool(os.getenv("OPENAI_API_KEY")) and OpenAI is not None
+try:
+    TOKEN_TTL = int(os.getenv("TOKEN_TTL_SECONDS") or 30 * 24 * 3600)
+except ValueError:
+    TOKEN_TTL = 30 * 24 * 3600
+OPENAI_ENABLED = bool(os.getenv("OPENAI_API_KEY")) and upstream.AsyncOpenAI is not None
 _openai_model_raw = (os.getenv("OPENAI_MODEL") or "gpt-4o-mini").strip()
 OPENAI_MODEL = "gpt-4o-mini" if _openai_model_raw.lower().startswith("sk-") else _openai_model_raw
 TTS_MODEL = os.getenv("OPENAI_TTS_MODEL", "gpt-4o-mini-tts")
+CHAT_CACHE = cache.from_env("chat", DATA_DIR)
+QUIZ_CACHE = cache.from_env("quiz", DATA_DIR)
+CHAT_FLIGHTS = coalesce.SingleFlight("chat")
+QUIZ_FLIGHTS = coalesce.SingleFlight("quiz")
+CHAT_STREAMS = coalesce.StreamFanout("chat_stream")
+CHAT_STREAM_METRICS = sse.StreamMetrics("chat_stream")
+QUIZ_STREAM_METRICS = sse.StreamMetrics("quiz_stream")
 try:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY")) if OPENAI_ENABLED and OpenAI is not None else None
-except Exception:
-    client = None
+    SSE_RESUME_GRACE = max(0.0, float(os.getenv("SSE_RESUME_GRACE_SECONDS") or 20.0))
+except ValueError:
+    SSE_RESUME_GRACE = 20.0
+try:
+    _replay_ttl = float(os.getenv("SSE_REPLAY_TTL_SECONDS") or 300.0)
+except ValueError:
+    _replay_ttl = 300.0
+# Per-worker, so resuming needs the reconnect to reach the same worker.
+CHAT_REPLAY = coalesce.ResumableStreams("chat_stream", ttl=_replay_ttl)
+try:
+    _tts_cache_mb = float(os.getenv("TTS_CACHE_MAX_MB") or 256)
+except ValueError:
+    _tts_cache_mb = 256.0
+TTS_CACHE = tts_cache.AudioCache(DATA_DIR / "cache" / "tts", int(_tts_cache_mb * 1024 * 1024))
+DATA = datastore.from_env(DATA_DIR)
+try:
+    _subs_recheck = float(os.getenv("SUBS_CACHE_RECHECK") or 2.0)
+except ValueError:
+    _subs_recheck = 2.0
+SUBS = subs_cache.SubscriptionCache(DATA, recheck=_subs_recheck)
+ANNOUNCEMENTS = announcements.AnnouncementFeed(DATA)
+WEBHOOKS = webhook_inbox.WebhookInbox(Path(os.getenv("WEBHOOK_INBOX_DIR") or (DATA_DIR / "webhooks")), DATA, on_applied=SUBS.put)
+# Serverless functions may be frozen once the response is sent, so there the
+# inbox is drained before answering instead of by a background worker.
+WEBHOOK_ASYNC = (os.getenv("WEBHOOK_ASYNC") or ("0" if os.getenv("VERCEL") else "1")).strip().lower() not in ("0", "false", "no", "off")
+try:
+    _storage_max_mb = float(os.getenv("STORAGE_MAX_FILE_MB") or 100)
+except ValueError:
+    _storage_max_mb = 100.0
+STORAGE = storage_store.StorageStore(STORAGE_DIR, max_file_bytes=int(_storage_max_mb * 1024 * 1024))
+ADMISSION_BUCKETS = admission.TokenBuckets(admission.settings_from_env()[0])
+QUIZ_BANK_ENABLED = (os.getenv("QUIZ_BANK") or "1").strip().lower() not in ("0", "false", "no", "off")
+# Like the webhook worker, background refills are off by default on serverless.
+QUIZ_BANK_REFILL = QUIZ_BANK_ENABLED and OPENAI_ENABLED and (
+    os.getenv("QUIZ_BANK_REFILL") or ("0" if os.getenv("VERCEL") else "1")
+).strip().lower() not in ("0", "false", "no", "off")
+QUIZ_BANK_PREFILL = QUIZ_BANK_REFILL and (os.getenv("QUIZ_BANK_PREFILL") or "1").strip().lower() not in ("0", "false", "no", "off")
+# Comma-separated; default to the course catalog (see api/quiz_bank.py).
+QUIZ_BANK_TOPICS = [t.strip() for t in (os.getenv("QUIZ_BANK_TOPICS") or "").split(",") if t.strip()] or None
+QUIZ_BANK_LEVELS = [t.strip() for t in (os.getenv("QUIZ_BANK_LEVELS") or "").split(",") if t.strip()] or None
+try:
+    _quiz_bank_target = max(5, int(os.getenv("QUIZ_BANK_TARGET") or quiz_bank.TARGET))
+except ValueError:
+    _quiz_bank_target = quiz_bank.TARGET
+QUIZ_BANK = quiz_bank.QuizBank(
+    Path(os.getenv("QUIZ_BANK_DIR") or (DATA_DIR / "quiz_bank")),
+    (lambda topic, level, n: _quiz_batch(topic, level, n)) if QUIZ_BANK_REFILL else None,
+    target=_quiz_bank_target,
+)
+
+def _history_since(student_id: str, since: int) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    while True:
+        page, _, more = DATA.history_read(student_id, since=since, limit=1000)
+        out.extend(page)
+        if not page or not more:
+            return out
+        since = int(page[-1]["seq"])
+
+SEARCH = search_index.SearchIndex(STORAGE.snapshot, STORAGE.read, _history_since)
+RAG_ENABLED = (os.getenv("RAG_ENABLED") or "1").strip().lower() not in ("0", "false", "no", "off")
+try:
+    RAG_TOP_K = max(1, int(os.getenv("RAG_TOP_K") or 4))
+except ValueError:
+    RAG_TOP_K = 4
+try:
+    RAG_TOKEN_BUDGET = max(0, int(os.getenv("RAG_TOKEN_BUDGET") or 600))
+except ValueError:
+    RAG_TOKEN_BUDGET = 600
+try:
+    _summary_timeout = float(os.getenv("CONTEXT_SUMMARY_TIMEOUT") or 5.0)
+except ValueError:
+    _summary_timeout = 5.0
+# History is packed into a per-plan token budget; older turns become a cached summary.
+CONTEXT = context_pack.ContextPacker(
+    lambda msgs: upstream.chat_completion(OPENAI_MODEL, msgs, 0.2),
+    cache.from_env("summary", DATA_DIR),
+    context_pack.budgets_from_env(),
+    summary_timeout=_summary_timeout,
+    enabled=(os.getenv("CONTEXT_PACKING") or "1").strip().lower() not in ("0", "false", "no", "off"),
+)
+# Built by scripts/build_assets.py; public/ is served unprocessed when absent.
+STATIC = static_assets.StaticSite(PUBLIC_DIR, Path(os.getenv("STATIC_DIST_DIR") or ROOT_DIR / "dist"))
+try:
+    STATIC.load()
+except Exception as e:
+    print(f"Static asset manifest failed to load: {e}")
+TTS_VOICES = ("alloy", "echo", "fable", "onyx", "nova", "shimmer")
+try:
+    TTS_PIPELINE_PARALLEL = max(1, int(os.getenv("TTS_PIPELINE_PARALLEL") or 3))
+except ValueError:
+    TTS_PIPELINE_PARALLEL = 3
 
 def _b64url(b: bytes) -> str:
     return base64.urlsafe_b64encode(b).decode("utf-8").rstrip("=")
@@ -84,7 +218,7 @@ def sign_token(payload: Dict[str, Any]) -> str:
     sig = hmac.new(APP_SECRET, raw, hashlib.sha256).digest()
     return f"{_b64url(raw)}.{_b64url(sig)}"
 
-def verify_token(token: str) -> Optional[Dict[str, Any]]:
+def _verify_token_uncached(token: str) -> Optional[Dict[str, Any]]:
     try:
         raw_b64, sig_b64 = token.split(".", 1)
         raw = _b64url_dec(raw_b64)
@@ -92,16 +226,62 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
         exp = hmac.new(APP_SECRET, raw, hashlib.sha256).digest()
         if not hmac.compare_digest(sig, exp):
             return None
-        return json.loads(raw.decode("utf-8"))
+        payload = json.loads(raw.decode("utf-8"))
+        if not isinstance(payload, dict):
+            return None
+        # Tokens issued before the `exp` claim existed stay valid.
+        if isinstance(payload.get("exp"), (int, float)) and payload["exp"] <= time.time():
+            return None
+        return payload
     except Exception:
         return None
 
+# Verified payloads, keyed by the exact token string. Only valid signatures
+# are cached, and entries never outlive the token's own `exp`.
+_TOKEN_CACHE: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_TOKEN_CACHE_SIZE = 4096
+_TOKEN_CACHE_TTL = 300.0
+_token_lock = threading.Lock()
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    now = time.time()
+    with _token_lock:
+        hit = _TOKEN_CACHE.get(token)
+        if hit is not None:
+            if hit[0] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return dict(hit[1])
+            del _TOKEN_CACHE[token]
+    payload = _verify_token_uncached(token)
+    if payload is None:
+        return None
+    until = now + _TOKEN_CACHE_TTL
+    if isinstance(payload.get("exp"), (int, float)):
+        until = min(until, float(payload["exp"]))
+    if len(token) <= 4096:
+        with _token_lock:
+            _TOKEN_CACHE[token] = (until, payload)
+            while len(_TOKEN_CACHE) > _TOKEN_CACHE_SIZE:
+                _TOKEN_CACHE.popitem(last=False)
+    return dict(payload)
+
 def bearer_payload(req: Request) -> Optional[Dict[str, Any]]:
+    # Also used as a FastAPI dependency; the result is kept on request.state so
+    # the token is resolved once per request however many places ask for it.
+    if getattr(req.state, "auth_resolved", False):
+        return req.state.auth
     auth = req.headers.get("authorization", "")
-    if not auth.lower().startswith("bearer "):
-        return None
-    token = auth.split(" ", 1)[1].strip()
-    return verify_token(token)
+    payload = None
+    if auth.lower().startswith("bearer "):
+        payload = verify_token(auth.split(" ", 1)[1].strip())
+    req.state.auth = payload
+    req.state.auth_resolved = True
+    return payload
+
+def require_auth(p: Optional[Dict[str, Any]] = Depends(bearer_payload)) -> Dict[str, Any]:
+    if not p:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return p
 
 @app.get("/api/health", include_in_schema=False)
 def api_health():
@@ -110,9 +290,25 @@ def api_health():
             "status": "ok",
             "openai": OPENAI_ENABLED,
             "openai_model": OPENAI_MODEL,
+            "data_backend": DATA.name,
+            "subs_cache": SUBS.stats(),
+            "announcements": ANNOUNCEMENTS.stats(),
+            "webhooks": {"async": WEBHOOK_ASYNC, **WEBHOOKS.stats()},
+            "upstream": upstream.stats(),
+            "outbound": outbound.stats(),
+            "cache": {"chat": CHAT_CACHE.stats(), "quiz": QUIZ_CACHE.stats()},
+            "quiz_bank": {"enabled": QUIZ_BANK_ENABLED, "refill": QUIZ_BANK_REFILL, **QUIZ_BANK.stats()},
+            "tts_cache": TTS_CACHE.stats(),
+            "coalesce": {"chat": CHAT_FLIGHTS.stats(), "quiz": QUIZ_FLIGHTS.stats(), "chat_stream": CHAT_STREAMS.stats()},
+            "search": SEARCH.stats(),
+            "context": CONTEXT.stats(),
+            "streams": {"chat": CHAT_STREAM_METRICS.stats(), "quiz": QUIZ_STREAM_METRICS.stats(), "replay": CHAT_REPLAY.stats()},
+            "prompts": prompts.stats(),
+            "admission": {"enabled": admission.ENABLED, "buckets": ADMISSION_BUCKETS.stats(), "gate": upstream.gate().stats()},
             "lemonsqueezy": bool(os.getenv("LEMON_SQUEEZY_API_KEY")),
             "public_dir_exists": PUBLIC_DIR.exists(),
             "public_dir": str(PUBLIC_DIR),
+            "static": {"root": str(STATIC.root), "built": STATIC.built, "files": len(STATIC.assets)},
         }
 
 # ---------- Optional auth endpoints (so UI can show plan/name) ----------
@@ -133,20 +329,18 @@ async def api_auth(req: Request):
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         student_id = f"BN-{timestamp}-{rnd}"
 
-    token = sign_token({"email": email, "name": name, "student_id": student_id, "plan": plan})
+    token = sign_token({"email": email, "name": name, "student_id": student_id, "plan": plan, "exp": int(time.time()) + TOKEN_TTL})
     return {"token": token, "plan": plan, "name": name, "student_id": student_id}
 
 @app.get("/api/me", include_in_schema=False)
-def api_me(req: Request):
-    p = bearer_payload(req)
+def api_me(req: Request, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
     if not p:
         return {"logged_in": False}
     # If a subscription record exists, prefer its plan
     try:
         student_id = p.get("student_id") or "BN-UNKNOWN"
-        fp = SUBS_DIR / f"{student_id}.json"
-        if fp.exists():
-            sub = json.loads(fp.read_text("utf-8"))
+        sub = SUBS.get(student_id)
+        if sub:
             if isinstance(sub, dict) and str(sub.get("status")).lower() in ("active", "trialing"):
                 plan = str(sub.get("plan") or "").strip().lower()
                 if plan:
@@ -155,40 +349,105 @@ def api_me(req: Request):
         pass
     return {"logged_in": True, **p}
 
+# ---------- Admission ----------
+# Requests that reach the model are rate limited and queued by the plan the
+# student actually has (token, or an active subscription), never the plan in
+# the request body, which only shapes the prompt.
+def _effective_plan(p: Optional[Dict[str, Any]]) -> str:
+    if not p:
+        return "associates"
+    plan = p.get("plan")
+    try:
+        sub = SUBS.get(p.get("student_id") or "BN-UNKNOWN")
+        if isinstance(sub, dict) and str(sub.get("status")).lower() in ("active", "trialing") and sub.get("plan"):
+            plan = sub.get("plan")
+    except Exception:
+        pass
+    return admission.normalize_plan(plan)
 
-def _build_chat_reply(msg: str, hist: Any, subject: str, plan: str) -> Dict[str, Any]:
-    if not OPENAI_ENABLED or client is None:
-        return {"reply": f"(Demo) Dr. Botnotic heard: {msg}", "plan": plan}
-
-    sys_prompt = (
-        "You are Dr. Botnotic, a 72-year-old sophisticated Harvard graduate yeti professor. "
-        "You speak calm, soft English with a deep London accent. "
-        "You are the smartest AI tutor in the industry. "
-        "Be concise yet deeply insightful, use earthy, scholarly tone, and optionally a tasteful gentle joke. "
-        "Adapt depth to the student's plan: Associates = foundational guidance, Bachelors = deeper explanations and structured steps, Masters = elite coaching with advanced insights, references, and study strategies. "
-        "Subject: " + subject
-    )
-    messages: List[Dict[str, Any]] = [{"role": "system", "content": sys_prompt}]
-    if isinstance(hist, list):
-        for m in hist[-16:]:
-            if isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str):
-                messages.append({"role": m["role"], "content": m["content"]})
-    messages.append({"role": "user", "content": msg})
+# Proxies in front of the app that append to X-Forwarded-For. Anything left
+# of them is whatever the client sent, so only the hop the outermost trusted
+# proxy saw counts; with none, the socket peer does.
+try:
+    TRUSTED_PROXY_HOPS = max(0, int(os.getenv("TRUSTED_PROXY_HOPS") or ("1" if os.getenv("VERCEL") else "0")))
+except ValueError:
+    TRUSTED_PROXY_HOPS = 0
+
+def _client_key(req: Request, p: Optional[Dict[str, Any]]) -> str:
+    if p and p.get("student_id"):
+        return "student:" + str(p["student_id"])
+    addr = req.client.host if req.client else "unknown"
+    if TRUSTED_PROXY_HOPS:
+        hops = [h.strip() for h in req.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if hops:
+            addr = hops[max(0, len(hops) - TRUSTED_PROXY_HOPS)]
+    return "ip:" + addr
+
+def _admit(req: Request, p: Optional[Dict[str, Any]]) -> None:
+    # Raises admission.Overloaded (429) when the caller's bucket is empty.
+    if not admission.ENABLED:
+        return
+    plan = _effective_plan(p)
+    ADMISSION_BUCKETS.take(_client_key(req, p), plan)
+    admission.set_plan(plan)
+
+@app.exception_handler(admission.Overloaded)
+async def overloaded(_, exc: admission.Overloaded):
+    return JSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
+def _retrieval_context(student_id: Optional[str], msg: str, turns: List[Dict[str, str]]) -> Optional[str]:
+    # Top BM25 snippets from the student's notes and older history that fit
+    # RAG_TOKEN_BUDGET; turns already in the prompt are not repeated.
+    if not RAG_ENABLED or not student_id or RAG_TOKEN_BUDGET <= 0:
+        return None
+    try:
+        hits = SEARCH.search(student_id, msg, k=RAG_TOP_K * 2)
+    except Exception as e:
+        print(f"Retrieval failed: {e}")
+        return None
+    # History hits read "role: content", so recent turns are skipped in both forms.
+    recent = {m["content"] for m in turns if m.get("content")}
+    recent |= {search_index.history_text(m) for m in turns if m.get("content")}
+    snippets = search_index.select_snippets(hits, RAG_TOKEN_BUDGET, recent)[:RAG_TOP_K]
+    return search_index.format_snippets(snippets) if snippets else None
+
+async def _chat_messages(msg: str, hist: Any, subject: str, plan: str, student_id: Optional[str] = None, summarize: bool = True) -> List[Dict[str, Any]]:
+    # Shared by /api/chat and /api/chat/stream; see api/prompts.py for the layout.
+    turns = await CONTEXT.pack(hist, plan, student_id, summarize)
+    context = await asyncio.to_thread(_retrieval_context, student_id, msg, turns) if student_id else None
+    return prompts.build(plan, subject, msg, turns, context)
+
+async def _build_chat_reply(msg: str, hist: Any, subject: str, plan: str, use_cache: bool = True, student_id: Optional[str] = None) -> Dict[str, Any]:
+    if not OPENAI_ENABLED or not upstream.available():
+        return {"reply": prompts.demo_reply(msg), "plan": plan}
+
+    messages = await _chat_messages(msg, hist, subject, plan, student_id)
+
+    # Only history-free prompts are shared between students, so only those are cached.
+    key = cache.make_key(OPENAI_MODEL, 0.7, messages) if use_cache and len(messages) == 2 else None
+    if key:
+        hit = CHAT_CACHE.get(key)
+        if not cache.is_missing(hit):
+            return {"reply": hit, "plan": plan, "cached": True}
 
     try:
-        out = client.chat.completions.create(model=OPENAI_MODEL, messages=cast(Any, messages), temperature=0.7)
-        txt = (out.choices[0].message.content or "").strip()
+        flight = key or cache.make_key(OPENAI_MODEL, 0.7, messages)
+        txt = await CHAT_FLIGHTS.do(flight, lambda: upstream.chat_completion(OPENAI_MODEL, messages, 0.7))
+        if key and txt:
+            CHAT_CACHE.set(key, txt)
         return {"reply": txt, "plan": plan}
+    except admission.Overloaded:
+        raise
     except Exception as e:
         print(f"OpenAI chat request failed: {e}")
         return {
-            "reply": f"(Demo) Dr. Botnotic heard: {msg}",
+            "reply": prompts.demo_reply(msg),
             "plan": plan,
             "error": "openai_request_failed"
         }
 
 @app.post("/api/chat", include_in_schema=False)
-async def api_chat(req: Request):
+async def api_chat(req: Request, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
     body = await req.json()
     msg = (body.get("message") or "").strip()
     if not msg:
@@ -196,69 +455,129 @@ async def api_chat(req: Request):
     hist = body.get("history") or []
     subject = (body.get("subject") or "General").strip()
     plan = (body.get("plan") or "associates").strip().lower()
-    return _build_chat_reply(msg, hist, subject, plan)
+    use_cache = not cache.bypass_requested(req.headers.get("cache-control", ""))
+    _admit(req, p)
+    return await _build_chat_reply(msg, hist, subject, plan, use_cache, (p or {}).get("student_id"))
 
 @app.get("/api/chat", include_in_schema=False)
-async def api_chat_get(req: Request, message: str = "", subject: str = "General", plan: str = "associates"):
+async def api_chat_get(req: Request, message: str = "", subject: str = "General", plan: str = "associates", p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
     msg = (message or "").strip()
     if not msg:
         raise HTTPException(status_code=400, detail="Missing message")
-    return _build_chat_reply(msg, [], (subject or "General").strip(), (plan or "associates").strip().lower())
+    _admit(req, p)
+    use_cache = not cache.bypass_requested(req.headers.get("cache-control", ""))
+    return await _build_chat_reply(msg, [], (subject or "General").strip(), (plan or "associates").strip().lower(), use_cache)
+
+# flight -> reservation (or None when refused) of the request that will start
+# it, so identical requests arriving before its stream begins join it too.
+_CHAT_LEADERS: Dict[str, "asyncio.Future[Optional[upstream.Reservation]]"] = {}
+
+async def _reserve_flight(flight: str) -> Optional[upstream.Reservation]:
+    # -> a slot for a request that starts `flight`, None for one that joins it.
+    while not CHAT_STREAMS.running(flight):
+        pending = _CHAT_LEADERS.get(flight)
+        if pending is None:
+            break
+        leader = await asyncio.shield(pending)
+        if leader is not None and leader.state == "held":
+            return None
+        if _CHAT_LEADERS.get(flight) is pending:
+            del _CHAT_LEADERS[flight]
+    else:
+        return None
+    mine = asyncio.get_running_loop().create_future()
+    _CHAT_LEADERS[flight] = mine
+    try:
+        reservation = await upstream.reserve()
+    except BaseException:
+        mine.set_result(None)
+        if _CHAT_LEADERS.get(flight) is mine:
+            del _CHAT_LEADERS[flight]
+        raise
+    mine.set_result(reservation)
+    return reservation
+
+def _forget_flight(flight: str, reservation: Optional[upstream.Reservation]) -> None:
+    pending = _CHAT_LEADERS.get(flight)
+    if pending is not None and pending.done() and pending.result() is reservation:
+        del _CHAT_LEADERS[flight]
 
 @app.post("/api/chat/stream", include_in_schema=False)
-async def api_chat_stream(req: Request):
+async def api_chat_stream(req: Request, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
+    started = time.perf_counter()
     body = await req.json()
+    student_id = (p or {}).get("student_id")
+    # A reconnect continues the answer it lost from the replay buffer (or the
+    # still-running upstream stream); if that is gone it starts over.
+    resume = sse.parse_event_id(req.headers.get("last-event-id") or body.get("last_event_id"))
+    if resume and CHAT_REPLAY.can_resume(resume[0], student_id, resume[1]):
+        return sse.response(sse.stream(req, CHAT_REPLAY.subscribe(*resume), CHAT_STREAM_METRICS, started, *resume))
     msg = (body.get("message") or "").strip()
     if not msg:
         raise HTTPException(status_code=400, detail="Missing message")
     hist = body.get("history") or []
     subject = (body.get("subject") or "General").strip()
     plan = (body.get("plan") or "associates").strip().lower()
-
-    sys_prompt = (
-        "You are Dr. Botonic, a 72-year-old sophisticated Harvard graduate yeti professor. "
-        "You speak calm, soft English with a subtle accent. "
-        "You are the smartest AI tutor in the industry. "
-        "Be concise yet deeply insightful, use earthy, scholarly tone, and optionally a tasteful gentle joke. "
-        "Adapt depth to the student's plan: Associates = foundational guidance, Bachelors = deeper explanations and structured steps, Masters = elite coaching with advanced insights, references, and study strategies. "
-        "Subject: " + subject
-    )
-
-    messages: List[Dict[str, Any]] = [{"role": "system", "content": sys_prompt}]
-    if isinstance(hist, list):
-        for m in hist[-16:]:
-            if isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str):
-                messages.append({"role": m["role"], "content": m["content"]})
-    messages.append({"role": "user", "content": msg})
-
-    async def event_stream():
-        if not OPENAI_ENABLED or client is None:
-            demo = f"(Demo) Dr. Botnotic heard: {msg}"
-            yield f"data: {json.dumps({'delta': demo})}\n\n"
-            yield f"data: {json.dumps({'done': True, 'plan': plan})}\n\n"
+    # Only clients that ask for it get event ids and a grace period to reconnect.
+    resumable = bool(body.get("resumable"))
+    speak = bool(body.get("speak"))
+    voice = str(body.get("voice") or "alloy").strip().lower()
+    if voice not in TTS_VOICES:
+        raise HTTPException(status_code=400, detail="Unknown voice")
+    _admit(req, p)
+
+    live = OPENAI_ENABLED and upstream.available()
+    messages = await _chat_messages(msg, hist, subject, plan, student_id, live)
+
+    # Identical in-flight prompts share one upstream stream.
+    flight = cache.make_key(OPENAI_MODEL, 0.7, messages)
+    # Once the response starts it can no longer become a 429, so the upstream
+    # slot is taken (or refused) now and handed to the stream's first call.
+    # A request that will join a stream already in flight needs no slot.
+    reservation = await _reserve_flight(flight) if live else None
+
+    async def events():
+        if not live:
+            yield {"delta": prompts.demo_reply(msg)}
+            yield {"done": True, "plan": plan}
             return
 
+        # An identical stream may have started while this one waited for its
+        # slot; joining it leaves the slot unused.
+        if reservation is not None and CHAT_STREAMS.running(flight):
+            reservation.release()
         try:
-            stream = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=cast(Any, messages),
-                temperature=0.7,
-                stream=True,
-            )
-            for chunk in stream:
-                try:
-                    delta = chunk.choices[0].delta.content
-                except Exception:
-                    delta = None
-                if delta:
-                    yield f"data: {json.dumps({'delta': delta})}\n\n"
-            yield f"data: {json.dumps({'done': True, 'plan': plan})}\n\n"
+            async with aclosing(CHAT_STREAMS.subscribe(flight, lambda: upstream.chat_stream(OPENAI_MODEL, messages, 0.7))) as deltas:
+                if not speak:
+                    async for delta in deltas:
+                        yield {"delta": delta}
+                else:
+                    # Audio for each finished sentence is interleaved with the text deltas.
+                    async for ev in speech.speak_along(deltas, lambda s: _speak_sentence(s, voice), TTS_PIPELINE_PARALLEL):
+                        if "delta" in ev:
+                            yield {"delta": ev["delta"]}
+                        elif ev["audio"] is not None:
+                            yield {"audio": base64.b64encode(ev["audio"]).decode("utf-8"), "seq": ev["seq"], "text": ev["text"]}
+            yield {"done": True, "plan": plan}
         except Exception as e:
             print(f"OpenAI stream request failed: {e}")
-            yield f"data: {json.dumps({'error': 'openai_request_failed'})}\n\n"
-            yield f"data: {json.dumps({'done': True, 'plan': plan})}\n\n"
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+            yield {"error": "openai_request_failed"}
+            yield {"done": True, "plan": plan}
+        finally:
+            if reservation is not None:
+                reservation.release()
+                _forget_flight(flight, reservation)
+
+    if reservation is not None:
+        upstream.use_reservation(reservation)
+    # Only resumable streams get a replay buffer; the rest (and any that find
+    # the buffer table full of live streams) go straight to the client.
+    stream_id = CHAT_REPLAY.start(events, student_id, SSE_RESUME_GRACE) if resumable else None
+    if stream_id is None:
+        return sse.response(sse.stream(req, events(), CHAT_STREAM_METRICS, started))
+    return sse.response(sse.stream(req, CHAT_REPLAY.subscribe(stream_id), CHAT_STREAM_METRICS, started, stream_id))
+
+LEMON_SQUEEZY_API_BASE = (os.getenv("LEMON_SQUEEZY_API_BASE") or "https://api.lemonsqueezy.com/v1").rstrip("/")
 
 def _get_base_url(req: Request) -> str:
     origin = req.headers.get("origin") or ""
@@ -382,12 +701,8 @@ async def api_lemonsqueezy_checkout(req: Request):
     }
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.lemonsqueezy.com/v1/checkouts",
-                headers=headers,
-                json=payload,
-            )
+        # Not idempotent, so only retried when the request never went out.
+        response = await outbound.request("lemonsqueezy", "POST", f"{LEMON_SQUEEZY_API_BASE}/checkouts", headers=headers, json=payload)
         if response.status_code >= 400:
             detail = response.text or "Lemon Squeezy checkout creation failed."
             raise HTTPException(status_code=400, detail=detail)
@@ -420,33 +735,22 @@ def _ensure_dirs() -> None:
         pass
 
 @app.get("/api/announcements", include_in_schema=False)
-def api_announcements():
-    try:
-        if ANNOUNCEMENTS_FILE.exists():
-            data = json.loads(ANNOUNCEMENTS_FILE.read_text("utf-8"))
-            items = data if isinstance(data, list) else data.get("items") or []
-        else:
-            items = [
-                {"text": "Welcome to Botnology101 — your premium AI tutor."},
-                {"text": "Forest-green chat panes are now live across the site."},
-                {"text": "Study Hall notes now have a lighter pane for readability."}
-            ]
-        cleaned: List[Dict[str, Any]] = []
-        for it in items:
-            if isinstance(it, str):
-                cleaned.append({"text": it})
-            elif isinstance(it, dict) and it.get("text"):
-                cleaned.append({"text": str(it.get("text")), "date": it.get("date")})
-        return {"items": cleaned[:50]}
-    except Exception:
-        return {"items": []}
+def api_announcements(req: Request, cursor: str = ""):
+    page = ANNOUNCEMENTS.page(cursor)
+    if page is None:
+        raise HTTPException(status_code=400, detail="Unknown cursor")
+    body, etag = page
+    # Short and shared: a new announcement shows up within a minute everywhere.
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=30, stale-while-revalidate=30"}
+    if httputil.etag_matches(req.headers.get("if-none-match", ""), etag):
+        ANNOUNCEMENTS.counters["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    ANNOUNCEMENTS.counters["served"] += 1
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.post("/api/announcements", include_in_schema=False)
-async def api_announcements_post(req: Request):
+async def api_announcements_post(req: Request, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
     plan = str(p.get("plan") or "associates").strip().lower()
     if plan != "masters":
         raise HTTPException(status_code=403, detail="Masters plan required")
@@ -456,70 +760,74 @@ async def api_announcements_post(req: Request):
     if not text or len(text) < 3:
         raise HTTPException(status_code=400, detail="Announcement text required")
     try:
-        items: List[Dict[str, Any]] = []
-        if ANNOUNCEMENTS_FILE.exists():
-            try:
-                data = json.loads(ANNOUNCEMENTS_FILE.read_text("utf-8"))
-                if isinstance(data, list):
-                    items = data
-                elif isinstance(data, dict):
-                    items = data.get("items") or []
-            except Exception:
-                items = []
         new_item = {"text": text, "date": date or datetime.utcnow().isoformat()}
-        items = [new_item] + [it for it in items if isinstance(it, dict) and isinstance(it.get("text"), str)]
-        items = items[:100]
-        ANNOUNCEMENTS_FILE.write_text(json.dumps(items, ensure_ascii=False, separators=(",", ":")), "utf-8")
-        return {"saved": True, "count": len(items)}
+        count = await asyncio.to_thread(DATA.announcement_add, new_item, keep=100)
+        await asyncio.to_thread(ANNOUNCEMENTS.refresh)
+        return {"saved": True, "count": count}
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to save announcement")
 
-def _history_path(student_id: str) -> Path:
-    safe = "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
-    return HISTORY_DIR / f"{safe}.json"
+def _opt_int(v: Optional[str]) -> Optional[int]:
+    try:
+        return int(v) if v not in (None, "") else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _history_item(m: Dict[str, Any]) -> Dict[str, Any]:
+    item = {"role": m.get("role"), "content": str(m.get("content", "")), "seq": m.get("seq")}
+    if m.get("id"):
+        item["id"] = m["id"]
+    return item
 
 @app.get("/api/history", include_in_schema=False)
-def api_history_get(req: Request):
+def api_history_get(req: Request, since: Optional[str] = None, before: Optional[str] = None, limit: int = 200, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
     _ensure_dirs()
-    p = bearer_payload(req)
     if not p:
         return {"history": []}
-    fp = _history_path(p.get("student_id") or "BN-UNKNOWN")
-    if not fp.exists():
-        return {"history": []}
     try:
-        data = json.loads(fp.read_text("utf-8"))
-        items = data if isinstance(data, list) else data.get("history") or []
-        cleaned: List[Dict[str, Any]] = [
-            {"role": m.get("role"), "content": str(m.get("content", ""))}
-            for m in items
-            if isinstance(m, dict) and m.get("role") in ("user", "assistant")
-        ]
-        return {"history": cleaned[-200:]}
+        items, cursor, has_more = DATA.history_read(p.get("student_id") or "BN-UNKNOWN", _opt_int(since), _opt_int(before), limit)
+    except HTTPException:
+        raise
     except Exception:
         return {"history": []}
+    return {"history": [_history_item(m) for m in items], "cursor": cursor, "has_more": has_more}
+
+@app.post("/api/history/append", include_in_schema=False)
+async def api_history_append(req: Request, p: Dict[str, Any] = Depends(require_auth)):
+    _ensure_dirs()
+    body = await req.json()
+    items = body.get("messages") or []
+    if not isinstance(items, list) or len(items) > 500:
+        raise HTTPException(status_code=400, detail="Invalid messages")
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    try:
+        appended, cursor = await asyncio.to_thread(DATA.history_append, student_id, items)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to save history")
+    if appended:
+        await asyncio.to_thread(SEARCH.refresh, student_id)
+    out: Dict[str, Any] = {"appended": appended, "cursor": cursor}
+    # Clients that send their last cursor get back whatever other tabs wrote meanwhile.
+    since = body.get("since")
+    if isinstance(since, int):
+        missed, cursor, has_more = await asyncio.to_thread(DATA.history_read, student_id, since=since)
+        out.update({"history": [_history_item(m) for m in missed], "cursor": cursor, "has_more": has_more})
+    return out
 
 @app.post("/api/history", include_in_schema=False)
-async def api_history_post(req: Request):
+async def api_history_post(req: Request, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
     body = await req.json()
     items = body.get("history") or []
     if not isinstance(items, list):
         raise HTTPException(status_code=400, detail="Invalid history")
-    cleaned: List[Dict[str, Any]] = [
-        {"role": m.get("role"), "content": str(m.get("content", ""))}
-        for m in items
-        if isinstance(m, dict) and m.get("role") in ("user", "assistant")
-    ]
-    fp = _history_path(p.get("student_id") or "BN-UNKNOWN")
+    student_id = p.get("student_id") or "BN-UNKNOWN"
     try:
-        fp.write_text(json.dumps(cleaned[-200:], ensure_ascii=False, separators=(",", ":")), "utf-8")
+        saved = await asyncio.to_thread(DATA.history_replace, student_id, items[-200:])
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to save history")
-    return {"saved": len(cleaned[-200:])}
+    await asyncio.to_thread(SEARCH.reset_history, student_id)
+    return {"saved": saved}
 
 @app.get("/api/music", include_in_schema=False)
 def api_music_root_disabled():
@@ -529,28 +837,17 @@ def api_music_root_disabled():
 def api_music_disabled(path: str):
     raise HTTPException(status_code=404, detail="Not Found")
 
-def _subs_path(student_id: str) -> Path:
-    safe = "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
-    return SUBS_DIR / f"{safe}.json"
-
 @app.get("/api/subscription", include_in_schema=False)
-def api_subscription(req: Request):
+def api_subscription(req: Request, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    fp = _subs_path(p.get("student_id") or "BN-UNKNOWN")
-    if not fp.exists():
-        return {"status": "none"}
     try:
-        data = json.loads(fp.read_text("utf-8"))
+        data = SUBS.get(p.get("student_id") or "BN-UNKNOWN")
         return data if isinstance(data, dict) else {"status": "none"}
     except Exception:
         return {"status": "none"}
 
 @app.post("/api/lemonsqueezy/webhook", include_in_schema=False)
 async def api_lemonsqueezy_webhook(req: Request):
-    _ensure_dirs()
     secret = os.getenv("LEMON_SQUEEZY_WEBHOOK_SECRET")
     if not secret:
         raise HTTPException(status_code=400, detail="Missing LEMON_SQUEEZY_WEBHOOK_SECRET")
@@ -565,205 +862,675 @@ async def api_lemonsqueezy_webhook(req: Request):
         event = json.loads(payload.decode("utf-8"))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid webhook payload: {e}")
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
 
-    etype = str(event.get("meta", {}).get("event_name") or "").strip().lower()
-    attrs = event.get("data", {}).get("attributes", {})
-    custom = attrs.get("custom_data") or event.get("meta", {}).get("custom_data") or {}
+    # Persisted before answering, applied by the inbox worker (see api/webhook_inbox.py).
+    await asyncio.to_thread(WEBHOOKS.append, webhook_inbox.event_id(event, payload), payload)
+    if WEBHOOK_ASYNC:
+        WEBHOOKS.kick()
+    else:
+        await asyncio.to_thread(WEBHOOKS.drain)
+    return {"received": True}
 
-    student_id = str(
-        custom.get("student_id")
-        or attrs.get("user_email")
-        or "BN-UNKNOWN"
-    )
-    plan = str(custom.get("plan") or "associates").strip().lower()
-    cadence = str(custom.get("cadence") or "monthly").strip().lower()
-
-    status = "active"
-    if etype in ("subscription_cancelled", "subscription_expired", "subscription_paused"):
-        status = "cancelled"
-    elif etype == "subscription_payment_failed":
-        status = "past_due"
-    elif etype in ("subscription_created", "subscription_updated", "subscription_resumed", "order_created"):
-        status = "active"
-
-    if etype:
+# ---------- Photos ----------
+# Raw image bytes in and out; the base64 JSON endpoints are kept as shims.
+
+PHOTO_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif", "image/avif")
+try:
+    PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES") or 5 * 1024 * 1024)
+except ValueError:
+    PHOTO_MAX_BYTES = 5 * 1024 * 1024
+
+def _photo_version(updated: float) -> str:
+    return format(int(updated * 1000), "x")
+
+def _check_photo(data: bytes, content_type: str) -> None:
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty photo")
+    if len(data) > PHOTO_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Photo larger than {PHOTO_MAX_BYTES} bytes")
+    if content_type and content_type not in PHOTO_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported photo type: {content_type}")
+    # The declared type is only a hint; the bytes have to agree.
+    if images.sniff(data) not in PHOTO_TYPES:
+        raise HTTPException(status_code=415, detail="Photo is not a supported image")
+
+async def _read_photo_upload(req: Request) -> bytes:
+    content_type = (req.headers.get("content-type") or "").split(";")[0].strip().lower()
+    length = req.headers.get("content-length") or ""
+    # Multipart framing adds a little on top of the file itself.
+    if length.isdigit() and int(length) > PHOTO_MAX_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"Photo larger than {PHOTO_MAX_BYTES} bytes")
+    if content_type == "multipart/form-data":
         try:
-            fp = _subs_path(student_id)
-            current: Dict[str, Any] = {}
-            if fp.exists():
-                try:
-                    current = json.loads(fp.read_text("utf-8"))
-                except Exception:
-                    current = {}
-
-            current.update({
-                "status": status,
-                "plan": plan,
-                "cadence": cadence,
-                "provider": "lemonsqueezy",
-                "event": etype,
-                "updated_at": datetime.utcnow().isoformat() + "Z",
-            })
-            if attrs.get("order_id"):
-                current["order_id"] = attrs.get("order_id")
-            if attrs.get("subscription_id"):
-                current["subscription_id"] = attrs.get("subscription_id")
-
-            fp.write_text(json.dumps({
-                **current,
-            }, ensure_ascii=False, separators=(",", ":")), "utf-8")
+            form = await req.form()
         except Exception:
-            pass
-
-    return {"received": True}
-
-def _photo_path(student_id: str) -> Path:
-    safe = "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
-    return PHOTOS_DIR / f"{safe}.png"
+            raise HTTPException(status_code=400, detail="Invalid multipart body")
+        try:
+            upload = form.get("photo") or form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Missing photo file field")
+            data = await upload.read(PHOTO_MAX_BYTES + 1)
+            _check_photo(data, (upload.content_type or "").lower())
+            return data
+        finally:
+            await form.close()
+    chunks: List[bytes] = []
+    size = 0
+    async for chunk in req.stream():
+        size += len(chunk)
+        if size > PHOTO_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Photo larger than {PHOTO_MAX_BYTES} bytes")
+        chunks.append(chunk)
+    data = b"".join(chunks)
+    _check_photo(data, content_type)
+    return data
+
+async def _save_photo(student_id: str, raw: bytes) -> Dict[str, Any]:
+    variants: Dict[str, bytes] = {}
+    if images.available():
+        # Resizing and AVIF encoding are CPU-bound; keep them off the event loop.
+        try:
+            variants = await asyncio.to_thread(images.make_variants, raw, images.PHOTO_WIDTHS, None, images.THUMB_SIZES)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid photo")
+    try:
+        await asyncio.to_thread(DATA.photo_put, student_id, raw, variants)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Could not save photo")
+    version = _photo_version(await asyncio.to_thread(DATA.photo_updated, student_id) or time.time())
+    return {"saved": True, "version": version, "url": f"/api/photo/image?v={version}", "variants": sorted(variants)}
+
+@app.get("/api/photo/image", include_in_schema=False)
+def api_get_photo_image(req: Request, w: Optional[str] = None, thumb: Optional[str] = None, v: Optional[str] = None, p: Dict[str, Any] = Depends(require_auth)):
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    updated = DATA.photo_updated(student_id)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="No photo")
+    version = _photo_version(updated)
+    kind = "t" if thumb not in (None, "", "0", "false") else "w"
+    name = images.pick(DATA.photo_variants(student_id), req.headers.get("accept", ""), images.parse_width(w), kind)
+    headers = {
+        "ETag": f'"{version}-{name or "orig"}"',
+        "Last-Modified": httputil.http_date(updated),
+        "Vary": "Accept",
+        # ?v= URLs name one exact upload, so they never need revalidating.
+        "Cache-Control": "private, max-age=31536000, immutable" if v == version else "private, no-cache",
+    }
+    inm = req.headers.get("if-none-match")
+    if httputil.etag_matches(inm or "", headers["ETag"]) or (not inm and httputil.not_modified_since(req.headers.get("if-modified-since") or "", updated)):
+        return Response(status_code=304, headers=headers)
+    data = DATA.photo_variant_get(student_id, name) if name else None
+    if data is not None:
+        return Response(content=data, media_type=images.media_type(name), headers=headers)
+    data = DATA.photo_get(student_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="No photo")
+    headers["ETag"] = f'"{version}-orig"'
+    return Response(content=data, media_type=images.sniff(data), headers=headers)
+
+@app.post("/api/photo/image", include_in_schema=False)
+@app.put("/api/photo/image", include_in_schema=False)
+async def api_put_photo_image(req: Request, p: Dict[str, Any] = Depends(require_auth)):
+    _ensure_dirs()
+    raw = await _read_photo_upload(req)
+    return await _save_photo(p.get("student_id") or "BN-UNKNOWN", raw)
 
 @app.get("/api/photo", include_in_schema=False)
-def api_get_photo(req: Request):
+def api_get_photo(req: Request, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    fp = _photo_path(p.get("student_id") or "BN-UNKNOWN")
-    if not fp.exists():
-        return {"photo_base64": None}
     try:
-        data = fp.read_bytes()
+        data = DATA.photo_get(p.get("student_id") or "BN-UNKNOWN")
+        if data is None:
+            return {"photo_base64": None}
         return {"photo_base64": base64.b64encode(data).decode("utf-8")}
     except Exception:
         return {"photo_base64": None}
 
 @app.post("/api/photo", include_in_schema=False)
-async def api_set_photo(req: Request):
+async def api_set_photo(req: Request, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
     body = await req.json()
     photo_b64 = (body.get("photo_base64") or "").strip()
     if not photo_b64:
         raise HTTPException(status_code=400, detail="Missing photo_base64")
+    # Accept canvas.toDataURL() output as-is.
+    if photo_b64.startswith("data:") and "," in photo_b64:
+        photo_b64 = photo_b64.split(",", 1)[1]
     try:
         raw = base64.b64decode(photo_b64)
-        fp = _photo_path(p.get("student_id") or "BN-UNKNOWN")
-        fp.write_bytes(raw)
-        return {"saved": True}
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid photo")
+    _check_photo(raw, "")
+    return await _save_photo(p.get("student_id") or "BN-UNKNOWN", raw)
 
-def _storage_root(student_id: str) -> Path:
-    safe = "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
-    return STORAGE_DIR / safe
+# ---------- Storage ----------
 
-def _safe_path(student_id: str, rel: str) -> Path:
-    base = _storage_root(student_id)
-    p = (base / (rel or "")).resolve()
-    if not str(p).startswith(str(base.resolve())):
+try:
+    STORAGE_BATCH_MAX = int(os.getenv("STORAGE_BATCH_MAX") or 200)
+except ValueError:
+    STORAGE_BATCH_MAX = 200
+# Larger files only travel through /api/storage/download and uploads, never
+# whole inside a JSON body.
+STORAGE_INLINE_MAX = 4 * 1024 * 1024
+
+def _storage_path(student_id: str, rel: str) -> Tuple[str, Path]:
+    try:
+        return STORAGE.resolve(student_id, rel)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid path")
-    return p
+
+def _storage_content(data: bytes) -> Dict[str, Any]:
+    # UTF-8 text goes out as-is; anything else as base64 with "encoding".
+    try:
+        return {"content": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+
+def _storage_bytes(item: Dict[str, Any]) -> bytes:
+    content = item.get("content") or ""
+    if str(item.get("encoding") or "").lower() == "base64":
+        try:
+            return base64.b64decode(str(content), validate=True)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid base64 content")
+    return str(content).encode("utf-8")
+
+def _storage_call(fn: Any, *args: Any) -> Any:
+    try:
+        return fn(*args)
+    except storage_store.StorageError as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/storage/list", include_in_schema=False)
-def api_storage_list(req: Request):
+def api_storage_list(req: Request, prefix: str = "", cursor: str = "", limit: Optional[str] = None, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    root = _storage_root(p.get("student_id") or "BN-UNKNOWN")
-    if not root.exists():
-        return {"files": []}
-    try:
-        files = [str(f.relative_to(root)) for f in root.rglob("*") if f.is_file()]
-        return {"files": files}
-    except Exception:
-        return {"files": []}
+    page, next_cursor = STORAGE.list(p.get("student_id") or "BN-UNKNOWN", prefix.lstrip("/"), cursor, _opt_int(limit) or 200)
+    return {"files": [e["path"] for e in page], "entries": page, "cursor": next_cursor, "has_more": next_cursor is not None}
 
 @app.get("/api/storage/read", include_in_schema=False)
-def api_storage_read(req: Request, path: str = ""):
+def api_storage_read(req: Request, path: str = "", p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    fp = _safe_path(p.get("student_id") or "BN-UNKNOWN", path)
-    if not fp.exists():
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    rel, _ = _storage_path(student_id, path)
+    entry = STORAGE.stat(student_id, rel)
+    if entry is not None and entry["size"] > STORAGE_INLINE_MAX:
+        raise HTTPException(status_code=413, detail="File too large to inline; use /api/storage/download")
+    data = STORAGE.read(student_id, rel)
+    if data is None:
         raise HTTPException(status_code=404, detail="Not found")
-    try:
-        return {"content": fp.read_text("utf-8")}
-    except Exception:
-        raise HTTPException(status_code=400, detail="Cannot read file")
+    return {**_storage_content(data), "hash": storage_store.hash_bytes(data)}
 
 @app.post("/api/storage/write", include_in_schema=False)
-async def api_storage_write(req: Request):
+async def api_storage_write(req: Request, p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
     body = await req.json()
     path = (body.get("path") or "").strip()
-    content = body.get("content") or ""
     if not path:
         raise HTTPException(status_code=400, detail="Missing path")
-    fp = _safe_path(p.get("student_id") or "BN-UNKNOWN", path)
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    rel, _ = _storage_path(student_id, path)
+    data = _storage_bytes(body)
+    if len(data) > min(STORAGE.max_file_bytes, STORAGE_INLINE_MAX):
+        raise HTTPException(status_code=413, detail="File too large to inline; use /api/storage/uploads")
     try:
-        fp.parent.mkdir(parents=True, exist_ok=True)
-        fp.write_text(str(content), "utf-8")
-        return {"saved": True}
+        res = await asyncio.to_thread(STORAGE.write, student_id, rel, data)
+        await asyncio.to_thread(SEARCH.refresh, student_id)
+        return {"saved": True, "hash": res["hash"], "unchanged": bool(res.get("skipped"))}
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to write")
 
 @app.delete("/api/storage/delete", include_in_schema=False)
-async def api_storage_delete(req: Request, path: str = ""):
+async def api_storage_delete(req: Request, path: str = "", p: Dict[str, Any] = Depends(require_auth)):
     _ensure_dirs()
-    p = bearer_payload(req)
-    if not p:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    fp = _safe_path(p.get("student_id") or "BN-UNKNOWN", path)
-    if not fp.exists():
-        raise HTTPException(status_code=404, detail="Not found")
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    rel, _ = _storage_path(student_id, path)
     try:
-        fp.unlink()
-        return {"deleted": True}
+        deleted = await asyncio.to_thread(STORAGE.delete, student_id, rel)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to delete")
+    await asyncio.to_thread(SEARCH.refresh, student_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Not found")
+    return {"deleted": True}
+
+def _storage_batch(student_id: str, files: List[Tuple[str, bytes]], doomed: List[str], wanted: List[Tuple[str, Optional[str]]]) -> Dict[str, List[Dict[str, Any]]]:
+    out: Dict[str, List[Dict[str, Any]]] = {"read": [], "write": [], "delete": []}
+    if files:
+        out["write"] = STORAGE.write_many(student_id, files)
+    if doomed:
+        out["delete"] = STORAGE.delete_many(student_id, doomed)
+    if files or doomed:
+        SEARCH.refresh(student_id)
+    for rel, known in wanted:
+        entry = STORAGE.stat(student_id, rel)
+        if entry is None:
+            out["read"].append({"path": rel, "error": "not_found"})
+            continue
+        if known and known == entry["hash"]:
+            out["read"].append({"path": rel, "hash": entry["hash"], "unchanged": True})
+            continue
+        if entry["size"] > STORAGE_INLINE_MAX:
+            out["read"].append({"path": rel, "hash": entry["hash"], "size": entry["size"], "error": "too_large"})
+            continue
+        data = STORAGE.read(student_id, rel)
+        if data is None:
+            out["read"].append({"path": rel, "error": "not_found"})
+            continue
+        out["read"].append({"path": rel, "hash": storage_store.hash_bytes(data), "size": len(data), **_storage_content(data)})
+    return out
+
+@app.post("/api/storage/batch", include_in_schema=False)
+async def api_storage_batch(req: Request, p: Dict[str, Any] = Depends(require_auth)):
+    # {"read": [{"path", "hash"?}], "write": [{"path", "content"}], "delete": [path]}
+    # Reads whose `hash` matches the stored file come back as unchanged
+    # without content; writes whose content matches are skipped.
+    _ensure_dirs()
+    body = await req.json()
+    reads = body.get("read") or []
+    writes = body.get("write") or []
+    deletes = body.get("delete") or []
+    if not all(isinstance(x, list) for x in (reads, writes, deletes)):
+        raise HTTPException(status_code=400, detail="read, write and delete must be lists")
+    if len(reads) + len(writes) + len(deletes) > STORAGE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {STORAGE_BATCH_MAX} operations per batch")
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+
+    files: List[Tuple[str, bytes]] = []
+    for item in writes:
+        if not isinstance(item, dict) or not str(item.get("path") or "").strip():
+            raise HTTPException(status_code=400, detail="Each write needs a path")
+        rel, _ = _storage_path(student_id, str(item["path"]))
+        data = _storage_bytes(item)
+        if len(data) > min(STORAGE.max_file_bytes, STORAGE_INLINE_MAX):
+            raise HTTPException(status_code=413, detail=f"{rel}: file too large to inline; use /api/storage/uploads")
+        files.append((rel, data))
+    doomed = [_storage_path(student_id, str(x.get("path") if isinstance(x, dict) else x))[0] for x in deletes]
+    # Paths are all validated before anything is written.
+    wanted: List[Tuple[str, Optional[str]]] = []
+    for item in reads:
+        raw_path = item.get("path") if isinstance(item, dict) else item
+        wanted.append((_storage_path(student_id, str(raw_path or ""))[0], item.get("hash") if isinstance(item, dict) else None))
+
+    return await asyncio.to_thread(_storage_batch, student_id, files, doomed, wanted)
+
+@app.get("/api/storage/download", include_in_schema=False)
+def api_storage_download(req: Request, path: str = "", p: Dict[str, Any] = Depends(require_auth)):
+    found = _storage_call(STORAGE.open_file, p.get("student_id") or "BN-UNKNOWN", path)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    fp, entry = found
+    etag = f'"{entry["hash"]}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": httputil.http_date(entry["mtime"]),
+        "Cache-Control": "private, no-cache",
+        "Accept-Ranges": "bytes",
+    }
+    if httputil.etag_matches(req.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    media_type = mimetypes.guess_type(fp.name)[0] or "application/octet-stream"
+    return _file_response(req, fp, int(entry["size"]), media_type, headers)
+
+async def _stream_into(req: Request, student_id: str, upload_id: str, offset: int) -> int:
+    # Appends the request body chunk by chunk; memory stays at one chunk.
+    try:
+        with STORAGE.append_upload(student_id, upload_id, offset) as out:
+            async for chunk in req.stream():
+                if chunk:
+                    out.write(chunk)
+    except storage_store.StorageError as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    return offset + out.written
+
+def _upload_headers(meta: Dict[str, Any]) -> Dict[str, str]:
+    headers = {"Upload-Offset": str(meta["offset"]), "Cache-Control": "no-store"}
+    if meta.get("length") is not None:
+        headers["Upload-Length"] = str(meta["length"])
+    return headers
+
+@app.put("/api/storage/file", include_in_schema=False)
+async def api_storage_put_file(req: Request, path: str = "", p: Dict[str, Any] = Depends(require_auth)):
+    # One-shot streaming upload of any size up to STORAGE_MAX_FILE_MB.
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    length = _opt_int(req.headers.get("content-length"))
+    meta = await asyncio.to_thread(_storage_call, STORAGE.create_upload, student_id, path, length)
+    try:
+        await _stream_into(req, student_id, meta["id"], 0)
+        done = await asyncio.to_thread(_storage_call, STORAGE.finish_upload, student_id, meta["id"])
+        await asyncio.to_thread(SEARCH.refresh, student_id)
+        return done
+    except BaseException:
+        try:
+            await asyncio.to_thread(STORAGE.abort_upload, student_id, meta["id"])
+        except storage_store.StorageError:
+            pass
+        raise
+
+@app.post("/api/storage/uploads", include_in_schema=False)
+async def api_storage_upload_create(req: Request, p: Dict[str, Any] = Depends(require_auth)):
+    # {"path", "length"?} -> upload session; then PATCH bytes at Upload-Offset.
+    body = await req.json()
+    length = body.get("length")
+    if length is not None and not isinstance(length, int):
+        raise HTTPException(status_code=400, detail="length must be an integer")
+    meta = await asyncio.to_thread(_storage_call, STORAGE.create_upload, p.get("student_id") or "BN-UNKNOWN", str(body.get("path") or ""), length)
+    url = f"/api/storage/uploads/{meta['id']}"
+    return JSONResponse({**meta, "url": url}, status_code=201, headers={**_upload_headers(meta), "Location": url})
+
+@app.api_route("/api/storage/uploads/{upload_id}", methods=["GET", "HEAD"], include_in_schema=False)
+def api_storage_upload_status(upload_id: str, req: Request, p: Dict[str, Any] = Depends(require_auth)):
+    meta = _storage_call(STORAGE.upload_status, p.get("student_id") or "BN-UNKNOWN", upload_id)
+    if req.method == "HEAD":
+        return Response(status_code=200, headers=_upload_headers(meta))
+    return JSONResponse(meta, headers=_upload_headers(meta))
+
+@app.patch("/api/storage/uploads/{upload_id}", include_in_schema=False)
+async def api_storage_upload_patch(upload_id: str, req: Request, p: Dict[str, Any] = Depends(require_auth)):
+    # Body bytes are appended at Upload-Offset, which must equal the bytes
+    # received so far (409 otherwise; HEAD tells a client where to resume).
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    offset = _opt_int(req.headers.get("upload-offset"))
+    if offset is None:
+        raise HTTPException(status_code=400, detail="Missing Upload-Offset header")
+    await _stream_into(req, student_id, upload_id, offset)
+    meta = await asyncio.to_thread(_storage_call, STORAGE.upload_status, student_id, upload_id)
+    if meta.get("length") is not None and meta["offset"] == meta["length"]:
+        done = await asyncio.to_thread(_storage_call, STORAGE.finish_upload, student_id, upload_id)
+        await asyncio.to_thread(SEARCH.refresh, student_id)
+        return JSONResponse({**meta, "complete": True, "hash": done["hash"]}, headers=_upload_headers(meta))
+    return JSONResponse({**meta, "complete": False}, headers=_upload_headers(meta))
+
+@app.post("/api/storage/uploads/{upload_id}/complete", include_in_schema=False)
+def api_storage_upload_complete(upload_id: str, p: Dict[str, Any] = Depends(require_auth)):
+    # For sessions created without a length.
+    student_id = p.get("student_id") or "BN-UNKNOWN"
+    done = _storage_call(STORAGE.finish_upload, student_id, upload_id)
+    SEARCH.refresh(student_id)
+    return done
+
+@app.get("/api/search", include_in_schema=False)
+def api_search(q: str = "", k: Optional[str] = None, source: str = "", p: Dict[str, Any] = Depends(require_auth)):
+    # BM25 over the student's storage files and chat history.
+    q = (q or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing q")
+    if source not in ("", "file", "history"):
+        raise HTTPException(status_code=400, detail="source must be file or history")
+    t0 = time.perf_counter()
+    hits = SEARCH.search(p.get("student_id") or "BN-UNKNOWN", q, max(1, min(_opt_int(k) or 10, 50)), source or None)
+    return {"results": hits, "took_ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+@app.delete("/api/storage/uploads/{upload_id}", include_in_schema=False)
+def api_storage_upload_abort(upload_id: str, p: Dict[str, Any] = Depends(require_auth)):
+    _storage_call(STORAGE.abort_upload, p.get("student_id") or "BN-UNKNOWN", upload_id)
+    return {"aborted": True}
+
+async def _speak_sentence(text: str, voice: str) -> bytes:
+    key = tts_cache.audio_key(TTS_MODEL, voice, text)
+    fp = TTS_CACHE.lookup(key)
+    if fp is not None:
+        try:
+            return fp.read_bytes()
+        except Exception:
+            pass
+    audio_bytes = await upstream.speech(TTS_MODEL, text, voice)
+    TTS_CACHE.put(key, audio_bytes)
+    return audio_bytes
 
 @app.post("/api/tts", include_in_schema=False)
-async def api_tts(req: Request):
+async def api_tts(req: Request, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
     body = await req.json()
     text = (body.get("text") or "").strip()
     if not text:
         raise HTTPException(status_code=400, detail="Missing text")
-    if not OPENAI_ENABLED or client is None:
+    if not OPENAI_ENABLED or not upstream.available():
         return {"audio_base64": None, "demo": True}
+    if TTS_CACHE.lookup(tts_cache.audio_key(TTS_MODEL, "alloy", text)) is None:
+        _admit(req, p)
     try:
-        response = client.audio.speech.create(model=TTS_MODEL, voice="alloy", input=text)
-        audio_bytes = response.content
+        audio_bytes = await _speak_sentence(text, "alloy")
         return {"audio_base64": base64.b64encode(audio_bytes).decode("utf-8")}
+    except admission.Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _tts_stream_and_cache(key: str, text: str, voice: str):
+    # Forward upstream MP3 chunks as they arrive and keep a copy; the copy only
+    # lands in the cache if the whole clip made it through.
+    tmp = TTS_CACHE.temp_path(key)
+    complete = False
+    try:
+        with tmp.open("wb") as out:
+            async for chunk in upstream.speech_stream(TTS_MODEL, text, voice):
+                out.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        if complete:
+            TTS_CACHE.commit(key, tmp)
+        else:
+            try:
+                tmp.unlink()
+            except Exception:
+                pass
+
+def _file_response(req: Request, fp: Path, size: int, media_type: str, headers: Dict[str, str]) -> Response:
+    # Streams `fp` in bounded chunks, honoring a single-range Range header.
+    try:
+        rng = httputil.parse_range(req.headers.get("range", ""), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if rng is None:
+        return StreamingResponse(httputil.iter_file(fp), media_type=media_type, headers={**headers, "Content-Length": str(size)})
+    start, end = rng
+    return StreamingResponse(
+        httputil.iter_file(fp, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)},
+    )
+
+@app.api_route("/api/tts/audio", methods=["GET", "POST"], include_in_schema=False)
+async def api_tts_audio(req: Request, text: str = "", voice: str = "alloy", p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
+    if req.method == "POST":
+        body = await req.json()
+        text = body.get("text") or text
+        voice = body.get("voice") or voice
+    text = (text or "").strip()
+    voice = (voice or "alloy").strip().lower()
+    if not text:
+        raise HTTPException(status_code=400, detail="Missing text")
+    if voice not in TTS_VOICES:
+        raise HTTPException(status_code=400, detail="Unknown voice")
+
+    key = tts_cache.audio_key(TTS_MODEL, voice, text)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400", "Accept-Ranges": "bytes"}
+    if httputil.etag_matches(req.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    fp = TTS_CACHE.lookup(key)
+    if fp is not None:
+        return _file_response(req, fp, fp.stat().st_size, "audio/mpeg", headers)
+
+    if not OPENAI_ENABLED or not upstream.available():
+        raise HTTPException(status_code=503, detail="TTS not configured")
+    _admit(req, p)
+    # Not cached yet: any Range is ignored and the full clip is streamed (200).
+    # Wait for the first chunk so an upstream failure still becomes a clean error.
+    chunks = _tts_stream_and_cache(key, text, voice)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except admission.Overloaded:
+        raise
+    except Exception as e:
+        print(f"OpenAI speech stream failed: {e}")
+        raise HTTPException(status_code=502, detail="TTS upstream failed")
+
+    async def body():
+        if first:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="audio/mpeg", headers=headers)
+
+def _quiz_messages(topic: str, level: str, n: int = 5, lines: bool = False) -> List[Dict[str, Any]]:
+    # `lines` asks for JSON Lines, so questions can be parsed as they stream in.
+    shape = (
+        "Return JSON Lines: one JSON object per line with keys 'q' and 'a', and nothing else."
+        if lines else "Return JSON array with keys 'q' and 'a'."
+    )
+    prompt = (
+        f"Create {n} rigorous study questions with concise ideal answers for topic: "
+        + topic + ". Depth level: " + level + ". " + shape
+    )
+    return [{"role": "system", "content": "You produce only valid JSON."}, {"role": "user", "content": prompt}]
+
+# Live quizzes use 0.2. A refill sends the same prompt for a pool batch after
+# batch and only questions the pool does not have yet are kept, so at 0.2 most
+# of each batch would come back as repeats and the pool would stop growing.
+QUIZ_BANK_TEMPERATURE = 0.7
+
+async def _quiz_batch(topic: str, level: str, n: int) -> List[Dict[str, str]]:
+    # Quiz bank refills queue behind every student's request.
+    admission.set_plan(admission.BACKGROUND)
+    return quiz_bank.parse_questions(await upstream.chat_completion(OPENAI_MODEL, _quiz_messages(topic, level, n), QUIZ_BANK_TEMPERATURE))
+
 @app.post("/api/quiz/generate", include_in_schema=False)
-async def api_quiz_generate(req: Request):
+async def api_quiz_generate(req: Request, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
     body = await req.json()
     topic = (body.get("topic") or "General Knowledge").strip()
     level = (body.get("level") or "intermediate").strip()
-    if not OPENAI_ENABLED or client is None:
+    bypass = cache.bypass_requested(req.headers.get("cache-control", ""))
+    if QUIZ_BANK_ENABLED and not bypass:
+        banked = QUIZ_BANK.sample(topic, level, 5, _client_key(req, p))
+        if banked:
+            return {"questions": banked, "bank": True}
+    if not OPENAI_ENABLED or not upstream.available():
         return {"questions": []}
-    prompt = (
-        "Create 5 rigorous study questions with concise ideal answers for topic: "
-        + topic + ". Depth level: " + level + ". Return JSON array with keys 'q' and 'a'."
-    )
+    messages = _quiz_messages(topic, level)
+    key = None if bypass else cache.make_key(OPENAI_MODEL, 0.2, messages)
+    if key:
+        hit = QUIZ_CACHE.get(key)
+        if not cache.is_missing(hit):
+            return {"questions": hit, "cached": True}
+    _admit(req, p)
+
+    async def generate() -> List[Any]:
+        txt = await upstream.chat_completion(OPENAI_MODEL, messages, 0.2)
+        data = quiz_bank.parse_questions(txt)
+        if not data:
+            print(f"Quiz generation for {topic!r} returned no usable questions")
+        return data
+
     try:
-        out = client.chat.completions.create(model=OPENAI_MODEL, messages=[{"role": "system", "content": "You produce only valid JSON."}, {"role": "user", "content": prompt}], temperature=0.2)
-        txt = (out.choices[0].message.content or "[]").strip()
-        data = json.loads(txt)
-        if isinstance(data, list):
-            return {"questions": data}
-        return {"questions": []}
+        data = await QUIZ_FLIGHTS.do(key or cache.make_key(OPENAI_MODEL, 0.2, messages), generate)
+        if key and data:
+            QUIZ_CACHE.set(key, data)
+        if QUIZ_BANK_ENABLED and data:
+            # The next quiz on this topic comes from the bank.
+            QUIZ_BANK.add(topic, level, data, _client_key(req, p))
+        return {"questions": data}
+    except admission.Overloaded:
+        raise
     except Exception:
         return {"questions": []}
 
+@app.post("/api/quiz/generate/stream", include_in_schema=False)
+async def api_quiz_generate_stream(req: Request, p: Optional[Dict[str, Any]] = Depends(bearer_payload)):
+    # Same request as /api/quiz/generate, but each question is sent as soon as
+    # the model has finished it: {"question": {...}, "index": i} events, then
+    # {"done": ...}. SSE by default, NDJSON with Accept: application/x-ndjson.
+    started = time.perf_counter()
+    body = await req.json()
+    topic = (body.get("topic") or "General Knowledge").strip()
+    level = (body.get("level") or "intermediate").strip()
+    bypass = cache.bypass_requested(req.headers.get("cache-control", ""))
+    student = _client_key(req, p)
+    ready: Optional[List[Any]] = None
+    source = "live"
+    if QUIZ_BANK_ENABLED and not bypass:
+        ready = QUIZ_BANK.sample(topic, level, 5, student)
+        if ready is not None:
+            source = "bank"
+    messages = _quiz_messages(topic, level, lines=True)
+    key = None if bypass else cache.make_key(OPENAI_MODEL, 0.2, messages)
+    if ready is None and key:
+        hit = QUIZ_CACHE.get(key)
+        if not cache.is_missing(hit):
+            ready, source = hit, "cache"
+    live = ready is None and OPENAI_ENABLED and upstream.available()
+    reservation = None
+    if live:
+        _admit(req, p)
+        # As for chat streams: a 429 has to happen before the response starts.
+        reservation = await upstream.reserve()
+
+    async def events():
+        first_ms: Optional[float] = None
+        sent: List[Dict[str, Any]] = []
+        dropped = 0
+        if not live:
+            for q in ready or []:
+                if first_ms is None:
+                    first_ms = round((time.perf_counter() - started) * 1000, 1)
+                yield {"question": q, "index": len(sent)}
+                sent.append(q)
+        else:
+            upstream.use_reservation(reservation)
+            parser = quiz_bank.LineParser()
+            failed = False
+            try:
+                async with aclosing(upstream.chat_stream(OPENAI_MODEL, messages, 0.2)) as deltas:
+                    async for delta in deltas:
+                        for q in parser.feed(delta):
+                            if first_ms is None:
+                                first_ms = round((time.perf_counter() - started) * 1000, 1)
+                            yield {"question": q, "index": len(sent)}
+                            sent.append(q)
+                for q in parser.close():
+                    if first_ms is None:
+                        first_ms = round((time.perf_counter() - started) * 1000, 1)
+                    yield {"question": q, "index": len(sent)}
+                    sent.append(q)
+            except Exception as e:
+                print(f"OpenAI quiz stream failed: {e}")
+                failed = True
+                yield {"error": "openai_request_failed"}
+            dropped = parser.dropped
+            if parser.dropped:
+                print(f"Quiz stream for {topic!r} dropped {parser.dropped} malformed lines")
+            if sent and key and not failed:
+                QUIZ_CACHE.set(key, sent)
+            if sent and QUIZ_BANK_ENABLED:
+                QUIZ_BANK.add(topic, level, sent, student)
+        yield {"done": True, "count": len(sent), "source": source, "dropped": dropped, "first_question_ms": first_ms}
+
+    # Runs once the response is over, even if the stream never started.
+    background = BackgroundTask(reservation.release) if reservation is not None else None
+    if "application/x-ndjson" in req.headers.get("accept", ""):
+        async def ndjson():
+            async for ev in events():
+                yield json.dumps(ev, separators=(",", ":")) + "\n"
+
+        return StreamingResponse(
+            ndjson(),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+            background=background,
+        )
+    response = sse.response(sse.stream(req, events(), QUIZ_STREAM_METRICS, started))
+    response.background = background
+    return response
+
 @app.post("/api/quiz/grade", include_in_schema=False)
 async def api_quiz_grade(req: Request):
     body = await req.json()
@@ -781,43 +1548,38 @@ async def api_quiz_grade(req: Request):
             score += 1
     return {"score": score, "total": total}
 
-# Mount static files LAST for Railway (after all API routes)
-if PUBLIC_DIR.exists() and not os.getenv("VERCEL"):
-    app.mount("/", StaticFiles(directory=str(PUBLIC_DIR), html=True), name="static")
-
-# Static file serving for Vercel (must be last)
+# Static files are served from the in-memory asset manifest (must be last)
 @app.get("/", include_in_schema=False)
-async def serve_root():
+async def serve_root(req: Request):
     try:
-        index_path = PUBLIC_DIR / "index.html"
-        if index_path.exists():
-            return FileResponse(index_path, media_type="text/html")
+        asset = STATIC.lookup("/")
+        if asset is not None:
+            return STATIC.respond(asset, req.headers)
         return {
             "message": "Botnology API", 
             "public_dir": str(PUBLIC_DIR),
             "public_exists": PUBLIC_DIR.exists(),
-            "index_exists": index_path.exists()
+            "index_exists": False
         }
     except Exception as e:
         return {"error": str(e), "public_dir": str(PUBLIC_DIR)}
 
 @app.get("/{file_path:path}", include_in_schema=False)
-async def serve_static_files(file_path: str):
+async def serve_static_files(file_path: str, req: Request):
     try:
         # Don't serve API routes through static handler
         if file_path.startswith("api"):
             raise HTTPException(status_code=404, detail="Not Found")
         
-        # Handle specific file extensions
-        file = PUBLIC_DIR / file_path
-        if file.exists() and file.is_file():
-            return FileResponse(file)
+        asset = STATIC.lookup(file_path)
+        if asset is not None:
+            return STATIC.respond(asset, req.headers, images.parse_width(req.query_params.get("w")))
         
         # Fallback to index.html for SPA routing
         if not file_path or "/" in file_path:
-            index_path = PUBLIC_DIR / "index.html"
-            if index_path.exists():
-                return FileResponse(index_path, media_type="text/html")
+            index = STATIC.lookup("/")
+            if index is not None:
+                return STATIC.respond(index, req.headers)
         
         raise HTTPException(status_code=404, detail="Not Found")
     except HTTPException:
@@ -0,0 +1,121 @@
+import os
+import random
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+import httpx
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+except Exception:
+    h2 = None
+
+# ---------- Outbound HTTP ----------
+# One keep-alive pool per provider, so calls to the same host reuse warm
+# TCP+TLS connections instead of handshaking each time. Pools are opened in
+# the app lifespan (or lazily on first use) and closed on shutdown. HTTP/2 is
+# negotiated when the h2 package is installed and the server supports it.
+#
+# request() retries transient failures with jittered exponential backoff:
+# always when the request never left (connect errors, pool timeouts), and on
+# timeouts and 429/502/503/504 too when the call is idempotent.
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RETRY_STATUSES = (429, 502, 503, 504)
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 5.0
+
+# service -> (connect timeout, read timeout, max connections, keep-alive connections)
+SERVICES: Dict[str, Tuple[float, float, int, int]] = {
+    "openai": (10.0, 60.0, 100, 32),
+    "lemonsqueezy": (5.0, 30.0, 20, 10),
+}
+KEEPALIVE_EXPIRY = 30.0
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+HTTP2 = h2 is not None and (os.getenv("OUTBOUND_HTTP2") or "1").strip().lower() not in ("0", "false", "no", "off")
+RETRIES = max(0, int(_env_float("OUTBOUND_RETRIES", 2)))
+
+def settings(service: str) -> Tuple[float, float, int, int]:
+    # OUTBOUND_<SERVICE>_CONNECT_TIMEOUT / _READ_TIMEOUT / _MAX_CONNECTIONS / _KEEPALIVE
+    connect, read, conns, keep = SERVICES.get(service, SERVICES["lemonsqueezy"])
+    key = f"OUTBOUND_{service.upper()}_"
+    return (
+        _env_float(key + "CONNECT_TIMEOUT", connect),
+        _env_float(key + "READ_TIMEOUT", read),
+        max(1, int(_env_float(key + "MAX_CONNECTIONS", conns))),
+        max(0, int(_env_float(key + "KEEPALIVE", keep))),
+    )
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+def client(service: str) -> httpx.AsyncClient:
+    c = _clients.get(service)
+    if c is None or c.is_closed:
+        connect, read, conns, keep = settings(service)
+        c = _clients[service] = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=conns, max_keepalive_connections=keep, keepalive_expiry=KEEPALIVE_EXPIRY),
+        )
+        _stats.setdefault(service, {"requests": 0, "retries": 0, "failures": 0, "opened": 0})["opened"] += 1
+    return c
+
+def open_all() -> None:
+    for service in SERVICES:
+        client(service)
+
+async def aclose() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for c in clients:
+        try:
+            await c.aclose()
+        except Exception:
+            pass
+
+def backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    # Full jitter, or the server's Retry-After (seconds) when it sent one.
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+async def request(service: str, method: str, url: str, idempotent: Optional[bool] = None, retries: Optional[int] = None, **kwargs: Any) -> httpx.Response:
+    # Like httpx.AsyncClient.request on the service's pool, plus retries.
+    c = client(service)
+    st = _stats[service]
+    safe = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+    attempts = 1 + (RETRIES if retries is None else max(0, retries))
+    for attempt in range(attempts):
+        st["requests"] += 1
+        last = attempt == attempts - 1
+        try:
+            response = await c.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            if last:
+                st["failures"] += 1
+                raise
+        except (httpx.ReadTimeout, httpx.RemoteProtocolError, httpx.ReadError):
+            if last or not safe:
+                st["failures"] += 1
+                raise
+        else:
+            if not safe or last or response.status_code not in RETRY_STATUSES:
+                return response
+            await response.aclose()
+            st["retries"] += 1
+            await asyncio.sleep(backoff(attempt, response.headers.get("retry-after")))
+            continue
+        st["retries"] += 1
+        await asyncio.sleep(backoff(attempt))
+    raise RuntimeError("unreachable")
+
+def stats() -> Dict[str, Any]:
+    return {"http2": HTTP2, "retries": RETRIES, "services": {name: {"open": name in _clients, **s} for name, s in _stats.items()}}
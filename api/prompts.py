@@ -0,0 +1,54 @@
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# ---------- Chat prompt assembly ----------
+# /api/chat and /api/chat/stream build their messages here. The layout puts
+# the most stable parts first so upstream prompt caching can reuse the longest
+# possible prefix from one request to the next:
+#   1. system prompt: persona, then plan, then subject (interned per pair)
+#   2. history summary, when older turns were summarized
+#   3. history turns, append-only between summaries
+#   4. retrieval snippets, which change with every question
+#   5. the new user message
+
+PERSONA = (
+    "You are Dr. Botnotic, a 72-year-old sophisticated Harvard graduate yeti professor. "
+    "You speak calm, soft English with a deep London accent. "
+    "You are the smartest AI tutor in the industry. "
+    "Be concise yet deeply insightful, use earthy, scholarly tone, and optionally a tasteful gentle joke. "
+    "Adapt depth to the student's plan: Associates = foundational guidance, Bachelors = deeper explanations and structured steps, Masters = elite coaching with advanced insights, references, and study strategies. "
+)
+PLANS = ("associates", "bachelors", "masters")
+MAX_SUBJECT_CHARS = 80
+
+# Persona + plan, built once at import.
+_PLAN_PREFIX = {plan: sys.intern(PERSONA + f"The student's plan: {plan.capitalize()}. ") for plan in PLANS}
+
+def normalize_subject(subject: Any) -> str:
+    return " ".join(str(subject or "").split())[:MAX_SUBJECT_CHARS] or "General"
+
+@lru_cache(maxsize=1024)
+def system_prompt(plan: str, subject: str) -> str:
+    # Keyed on the raw (plan, subject), so repeat requests skip normalizing too.
+    # Unknown plans get the Associates prompt; subjects are client text, so the
+    # cache is bounded.
+    prefix = _PLAN_PREFIX.get(plan) or _PLAN_PREFIX["associates"]
+    return sys.intern(prefix + "Subject: " + normalize_subject(subject))
+
+def demo_reply(msg: str) -> str:
+    return f"(Demo) Dr. Botnotic heard: {msg}"
+
+def build(plan: str, subject: str, msg: str, turns: List[Dict[str, str]], context: Optional[str] = None) -> List[Dict[str, Any]]:
+    # `turns` is already validated (see context_pack.ContextPacker.pack),
+    # summary message first.
+    messages: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt(plan, subject)}]
+    messages.extend(turns)
+    if context:
+        messages.append({"role": "system", "content": context})
+    messages.append({"role": "user", "content": msg})
+    return messages
+
+def stats() -> Dict[str, Any]:
+    info = system_prompt.cache_info()
+    return {"interned": info.currsize, "hits": info.hits, "misses": info.misses}
@@ -0,0 +1,454 @@
+import os
+import re
+import json
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+# ---------- Quiz bank ----------
+# Generated quiz questions are kept in pools keyed by (normalized topic,
+# level), one JSON file per pool, so a quiz for a known topic is a random
+# sample from memory instead of a multi-second LLM call. Each student (or
+# client address) is not shown a question again from a pool until they have
+# seen all of it.
+#
+# A background worker tops pools up to `target` questions, but only catalog
+# pools and pools that have served a quiz: a topic seen once in a live
+# generation keeps what that generation produced and costs nothing more. A
+# pool a student has worked through grows up to `max_size`. Model output is repaired (code
+# fences, trailing commas, smart quotes, stray prose) and each question is
+# validated before it is stored.
+
+# Course catalog categories (public/courses.html) x quiz levels.
+CATALOG_TOPICS = ("Anatomy", "Mathematics", "Physics", "Chemistry", "Biology")
+CATALOG_LEVELS = ("intermediate", "associates", "bachelors", "masters")
+TARGET = 40
+BATCH = 10
+MAX_QUESTION_CHARS = 500
+MAX_ANSWER_CHARS = 1500
+MAX_POOLS = 500
+MAX_STUDENTS = 20000
+
+def normalize_topic(topic: Any) -> str:
+    t = re.sub(r"\s+", " ", str(topic or "")).strip().strip(".!?:;,").strip().lower()
+    return t[:120] or "general knowledge"
+
+def normalize_level(level: Any) -> str:
+    return re.sub(r"\s+", " ", str(level or "")).strip().lower()[:40] or "intermediate"
+
+def pool_key(topic: Any, level: Any) -> Tuple[str, str]:
+    return normalize_topic(topic), normalize_level(level)
+
+def _question_id(q: Dict[str, str]) -> str:
+    text = re.sub(r"[^a-z0-9]+", " ", q["q"].lower()).strip()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def clean_question(item: Any) -> Optional[Dict[str, str]]:
+    # -> {"q", "a"}, or None when `item` is not a usable question.
+    if not isinstance(item, dict):
+        return None
+    q = item.get("q") or item.get("question")
+    a = item.get("a") or item.get("answer")
+    if not isinstance(q, str) or not isinstance(a, (str, int, float)):
+        return None
+    q, a = q.strip(), str(a).strip()
+    if len(q) < 5 or not a or len(q) > MAX_QUESTION_CHARS or len(a) > MAX_ANSWER_CHARS:
+        return None
+    return {"q": q, "a": a}
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+def _objects(text: str) -> List[str]:
+    # Top-level {...} spans in `text`, skipping braces inside strings.
+    out: List[str] = []
+    depth = 0
+    start = -1
+    in_str = False
+    esc = False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                out.append(text[start:i + 1])
+    return out
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+    except ValueError:
+        return None
+
+def parse_questions(text: str) -> List[Dict[str, str]]:
+    # Model output -> validated questions; [] when nothing usable is in it.
+    text = (text or "").strip()
+    m = _FENCE.search(text)
+    if m:
+        text = m.group(1).strip()
+    data = _loads(text)
+    if data is None:
+        text = text.translate(_SMART_QUOTES)
+        lo, hi = text.find("["), text.rfind("]")
+        data = _loads(text[lo:hi + 1]) if 0 <= lo < hi else None
+    if data is None:
+        # Salvage whatever complete objects there are (e.g. a truncated array).
+        data = [d for d in (_loads(s) for s in _objects(text)) if d is not None]
+    if isinstance(data, dict):
+        data = data.get("questions") if isinstance(data.get("questions"), list) else [data]
+    if not isinstance(data, list):
+        return []
+    out: List[Dict[str, str]] = []
+    seen: Set[str] = set()
+    for item in data:
+        q = clean_question(item)
+        if q is not None and _question_id(q) not in seen:
+            seen.add(_question_id(q))
+            out.append(q)
+    return out
+
+class LineParser:
+    # Incremental parser for JSON Lines quiz output (one {"q", "a"} object per
+    # line), fed streamed text. Each question comes out as soon as its line is
+    # complete. Lines that do not hold a valid question are dropped and
+    # counted, and array brackets, separators and code fences around the
+    # lines are tolerated. If no line parsed at all (the model answered with
+    # a pretty-printed array, say), close() falls back to parse_questions()
+    # on the whole text.
+    def __init__(self) -> None:
+        self._buf = ""
+        self._text: List[str] = []
+        self._seen: Set[str] = set()
+        self.parsed = 0
+        self.dropped = 0
+
+    def _line(self, line: str) -> Optional[Dict[str, str]]:
+        line = line.strip().lstrip("[").rstrip("],").strip()
+        if not line or line.startswith("```"):
+            return None
+        if not line.startswith("{"):
+            # Prose around the questions is not a malformed question.
+            return None
+        q = clean_question(_loads(line.translate(_SMART_QUOTES)))
+        if q is None:
+            self.dropped += 1
+            return None
+        qid = _question_id(q)
+        if qid in self._seen:
+            return None
+        self._seen.add(qid)
+        self.parsed += 1
+        return q
+
+    def feed(self, text: str) -> List[Dict[str, str]]:
+        self._text.append(text)
+        self._buf += text
+        out: List[Dict[str, str]] = []
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            q = self._line(line)
+            if q is not None:
+                out.append(q)
+        return out
+
+    def close(self) -> List[Dict[str, str]]:
+        line, self._buf = self._buf, ""
+        q = self._line(line)
+        if q is not None:
+            return [q]
+        if self.parsed:
+            return []
+        out = [q for q in parse_questions("".join(self._text)) if _question_id(q) not in self._seen]
+        if out:
+            self.dropped = 0
+        self.parsed += len(out)
+        return out
+
+def _atomic_write(fp: Path, data: bytes) -> None:
+    tmp = fp.with_name(f".{fp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(fp)
+
+class _Pool:
+    __slots__ = ("topic", "level", "questions", "ids", "mtime", "served")
+
+    def __init__(self, topic: str, level: str):
+        self.topic = topic
+        self.level = level
+        self.questions: List[Dict[str, str]] = []
+        self.ids: Dict[str, int] = {}
+        self.mtime = 0
+        self.served = 0
+
+    def add(self, questions: List[Dict[str, str]]) -> int:
+        added = 0
+        for q in questions:
+            qid = _question_id(q)
+            if qid not in self.ids:
+                self.ids[qid] = len(self.questions)
+                self.questions.append(q)
+                added += 1
+        return added
+
+# `generate(topic, level, n)` -> questions; raises when generation is unavailable.
+Generator = Callable[[str, str, int], Awaitable[List[Dict[str, str]]]]
+
+class QuizBank:
+    def __init__(
+        self,
+        directory: Path,
+        generate: Optional[Generator] = None,
+        target: int = TARGET,
+        batch: int = BATCH,
+        max_size: Optional[int] = None,
+        max_pools: int = MAX_POOLS,
+    ):
+        self.dir = directory
+        self.generate = generate
+        self.target = max(1, target)
+        self.batch = max(1, batch)
+        self.max_size = max(self.target, max_size or self.target * 4)
+        self.max_pools = max(1, max_pools)
+        self._pools: Dict[Tuple[str, str], _Pool] = {}
+        # (student, pool) -> ids of questions already served to them
+        self._seen: "OrderedDict[Tuple[str, Tuple[str, str]], Set[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # pool -> size to fill it to
+        self._wanted: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._catalog: Set[Tuple[str, str]] = set()
+        self._prefill_lock: Optional[Any] = None
+        self.counters: Dict[str, int] = {
+            "served": 0, "misses": 0, "resets": 0, "generated": 0, "added": 0, "refills": 0, "failures": 0,
+        }
+        self._load()
+
+    def _path(self, key: Tuple[str, str]) -> Path:
+        return self.dir / (hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:24] + ".json")
+
+    def _read(self, fp: Path) -> Optional[_Pool]:
+        try:
+            raw = json.loads(fp.read_text("utf-8"))
+            pool = _Pool(normalize_topic(raw["topic"]), normalize_level(raw["level"]))
+            pool.add([q for q in (clean_question(it) for it in raw.get("questions") or []) if q is not None])
+            pool.mtime = fp.stat().st_mtime_ns
+            return pool
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Quiz bank pool {fp.name} unreadable: {e}")
+            return None
+
+    def _load(self) -> None:
+        try:
+            files = sorted(self.dir.glob("*.json"))
+        except Exception:
+            return
+        for fp in files:
+            pool = self._read(fp)
+            if pool is not None:
+                self._pools[(pool.topic, pool.level)] = pool
+
+    def _reload(self, key: Tuple[str, str]) -> Optional[_Pool]:
+        # Picks up questions another worker wrote to the pool's file.
+        fp = self._path(key)
+        pool = self._pools.get(key)
+        try:
+            mtime = fp.stat().st_mtime_ns
+        except OSError:
+            return pool
+        if pool is not None and pool.mtime == mtime:
+            return pool
+        fresh = self._read(fp)
+        if fresh is None:
+            return pool
+        with self._lock:
+            if pool is not None:
+                fresh.add(pool.questions)
+                fresh.served = pool.served
+            self._pools[key] = fresh
+        return fresh
+
+    def _save(self, pool: _Pool) -> None:
+        fp = self._path((pool.topic, pool.level))
+        body = {"topic": pool.topic, "level": pool.level, "questions": pool.questions}
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            _atomic_write(fp, json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            pool.mtime = fp.stat().st_mtime_ns
+        except Exception as e:
+            print(f"Quiz bank write failed: {e}")
+
+    def size(self, topic: Any, level: Any) -> int:
+        pool = self._pools.get(pool_key(topic, level))
+        return len(pool.questions) if pool else 0
+
+    def sample(self, topic: Any, level: Any, n: int, student: str) -> Optional[List[Dict[str, str]]]:
+        # -> n questions `student` has not had from this pool yet, or None when
+        # the pool cannot supply n (the caller generates live instead).
+        key = pool_key(topic, level)
+        pool = self._reload(key)
+        if pool is None or len(pool.questions) < n:
+            self.counters["misses"] += 1
+            if pool is not None:
+                self.want(key[0], key[1])
+            return None
+        with self._lock:
+            seen_key = (student, key)
+            seen = self._seen.pop(seen_key, None) or set()
+            unseen = [i for qid, i in pool.ids.items() if qid not in seen]
+            if len(unseen) < n:
+                # Worked through the pool: start over, and grow it.
+                self.counters["resets"] += 1
+                left = set(unseen)
+                picks = unseen + random.sample([i for i in range(len(pool.questions)) if i not in left], n - len(unseen))
+                random.shuffle(picks)
+                seen = set()
+                grow = True
+            else:
+                picks = random.sample(unseen, n)
+                grow = False
+            out = [dict(pool.questions[i]) for i in picks]
+            seen.update(_question_id(q) for q in out)
+            self._seen[seen_key] = seen
+            while len(self._seen) > MAX_STUDENTS:
+                self._seen.popitem(last=False)
+            self.counters["served"] += 1
+            pool.served += 1
+        if grow:
+            self.want(key[0], key[1], min(self.max_size, len(pool.questions) + self.batch))
+        elif len(pool.questions) < self.target:
+            self.want(key[0], key[1])
+        return out
+
+    def add(self, topic: Any, level: Any, questions: List[Any], student: Optional[str] = None) -> int:
+        # Stores validated questions (e.g. from a live generation) -> number
+        # new. With `student`, they count as already served to them.
+        key = pool_key(topic, level)
+        clean = [q for q in (clean_question(it) for it in questions) if q is not None]
+        pool = self._reload(key)
+        with self._lock:
+            if pool is None:
+                if len(self._pools) >= self.max_pools:
+                    return 0
+                pool = self._pools[key] = _Pool(key[0], key[1])
+            added = pool.add(clean)
+            if student is not None:
+                seen = self._seen.pop((student, key), None) or set()
+                seen.update(_question_id(q) for q in clean)
+                self._seen[(student, key)] = seen
+        if added:
+            self._save(pool)
+            self.counters["added"] += added
+        return added
+
+    def want(self, topic: Any, level: Any, size: Optional[int] = None) -> None:
+        # Queues the pool to be filled to `size` (default target) in the
+        # background, if it is in the catalog or has served a quiz.
+        if self.generate is None:
+            return
+        key = pool_key(topic, level)
+        pool = self._pools.get(key)
+        if key not in self._catalog and (pool is None or not pool.served):
+            return
+        if pool is None and len(self._pools) >= self.max_pools:
+            return
+        size = min(self.max_size, size or self.target)
+        if self.size(*key) >= size:
+            return
+        self._wanted[key] = max(size, self._wanted.get(key, 0))
+        self.kick()
+
+    def _claim_prefill(self) -> bool:
+        # Workers on one host share the directory; the first to get the lock
+        # does the startup fill and keeps the lock until it exits.
+        if fcntl is None:
+            return True
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            lf = (self.dir / "prefill.lock").open("a")
+        except OSError:
+            return True
+        try:
+            fcntl.flock(lf.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lf.close()
+            return False
+        self._prefill_lock = lf
+        return True
+
+    def prefill(self, topics: Optional[List[str]] = None, levels: Optional[List[str]] = None) -> bool:
+        # -> False, queueing nothing, when another worker is doing it.
+        keys = [pool_key(t, l) for t in topics or CATALOG_TOPICS for l in levels or CATALOG_LEVELS]
+        self._catalog.update(keys)
+        if not self._claim_prefill():
+            return False
+        for key in keys:
+            self.want(*key)
+        return True
+
+    def kick(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        # One generation at a time, so the refill never holds more than one
+        # upstream slot.
+        while self._wanted:
+            key, size = self._wanted.popitem(last=False)
+            if self.generate is None:
+                return
+            pool = self._reload(key)
+            have = len(pool.questions) if pool else 0
+            if have >= size:
+                continue
+            try:
+                questions = await self.generate(key[0], key[1], min(self.batch, size - have))
+            except Exception as e:
+                # The pool stays queued; the next kick retries it.
+                print(f"Quiz bank refill for {key} failed: {e}")
+                self.counters["failures"] += 1
+                self._wanted[key] = max(size, self._wanted.get(key, 0))
+                return
+            self.counters["refills"] += 1
+            self.counters["generated"] += len(questions)
+            # Stops when a batch brings nothing new rather than asking forever.
+            if self.add(key[0], key[1], questions) and self.size(*key) < size:
+                self._wanted[key] = max(size, self._wanted.get(key, 0))
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = [len(p.questions) for p in self._pools.values()]
+        return {
+            "pools": len(sizes),
+            "questions": sum(sizes),
+            # Under target and eligible for a refill.
+            "low": sum(1 for k, p in self._pools.items() if len(p.questions) < self.target and (k in self._catalog or p.served)),
+            "queued": len(self._wanted),
+            "worker_running": self._task is not None and not self._task.done(),
+            **self.counters,
+        }
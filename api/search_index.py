@@ -0,0 +1,269 @@
+import math
+import re
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# ---------- Per-student full-text search ----------
+# An in-memory BM25 inverted index over each student's storage files (split
+# into passages) and chat history. Indexes are built on first use and then
+# kept current incrementally: files are re-indexed only when their manifest
+# hash changes, history only from the last indexed seq onwards. Both checks
+# are cheap, so they run before every query and after every write.
+
+TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from had has have he her his how i if in into is it its "
+    "me my no not of on or our she so than that the their them then there these they this to was we "
+    "were what when where which who why will with you your".split()
+)
+K1 = 1.2
+B = 0.75
+PASSAGE_WORDS = 120
+# Terms in more than 1/COMMON_DF of the documents are only used for re-ranking.
+COMMON_DF = 20
+# Notes bigger than this are not indexed (PDFs, exports, binaries).
+MAX_INDEX_BYTES = 1024 * 1024
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if len(t) > 1 and t not in STOPWORDS]
+
+def history_text(m: Dict[str, Any]) -> str:
+    # How a chat message is indexed, and so how a history hit reads.
+    return f"{m.get('role')}: {m.get('content') or ''}"
+
+def approx_tokens(text: str) -> int:
+    # ~4 characters per token for English; good enough for budgeting.
+    return max(1, len(text) // 4)
+
+def passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    # Paragraphs packed greedily into passages of at most `max_words` words.
+    out: List[str] = []
+    buf: List[str] = []
+    for para in re.split(r"\n\s*\n", text or ""):
+        words = para.split()
+        while words:
+            room = max_words - len(buf)
+            if room <= 0:
+                out.append(" ".join(buf))
+                buf = []
+                continue
+            buf.extend(words[:room])
+            words = words[room:]
+        if len(buf) >= max_words // 2:
+            out.append(" ".join(buf))
+            buf = []
+    if buf:
+        out.append(" ".join(buf))
+    return out
+
+class _Doc:
+    __slots__ = ("source", "key", "text", "terms", "length")
+
+    def __init__(self, source: str, key: Any, text: str, terms: Dict[str, int], length: int) -> None:
+        self.source = source
+        self.key = key
+        self.text = text
+        self.terms = terms
+        self.length = length
+
+class StudentIndex:
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.docs: Dict[int, _Doc] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_len = 0
+        self._next = 0
+        self.files: Dict[str, Tuple[str, List[int]]] = {}  # path -> (hash, doc ids)
+        self.files_version: Any = None
+        self.history_seq = 0
+        self.lock = threading.Lock()
+
+    def add(self, source: str, key: Any, text: str) -> Optional[int]:
+        toks = tokenize(text)
+        if not toks:
+            return None
+        terms: Dict[str, int] = {}
+        for t in toks:
+            terms[t] = terms.get(t, 0) + 1
+        doc_id = self._next
+        self._next += 1
+        self.docs[doc_id] = _Doc(source, key, text, terms, len(toks))
+        self.lengths[doc_id] = len(toks)
+        self.total_len += len(toks)
+        for t, tf in terms.items():
+            self.postings.setdefault(t, {})[doc_id] = tf
+        return doc_id
+
+    def remove(self, doc_id: int) -> None:
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        del self.lengths[doc_id]
+        self.total_len -= doc.length
+        for t in doc.terms:
+            plist = self.postings.get(t)
+            if plist is not None:
+                plist.pop(doc_id, None)
+                if not plist:
+                    del self.postings[t]
+
+    def set_file(self, path: str, digest: str, text: Optional[str]) -> None:
+        self.drop_file(path)
+        ids: List[int] = []
+        for i, passage in enumerate(passages(text or "")):
+            doc_id = self.add("file", (path, i), passage)
+            if doc_id is not None:
+                ids.append(doc_id)
+        self.files[path] = (digest, ids)
+
+    def drop_file(self, path: str) -> None:
+        old = self.files.pop(path, None)
+        if old:
+            for doc_id in old[1]:
+                self.remove(doc_id)
+
+    def search(self, query: str, k: int = 5, source: Optional[str] = None) -> List[Tuple[float, _Doc]]:
+        n = len(self.docs)
+        if not n:
+            return []
+        # Rarest terms first. Terms in over half the documents barely move
+        # BM25, so they are dropped unless nothing else matched; other common
+        # terms only re-rank documents the rarer terms already found.
+        terms = sorted((self.postings[t] for t in set(tokenize(query)) if t in self.postings), key=len)
+        terms = [plist for plist in terms if len(plist) * 2 <= n] or terms
+        c1 = K1 * (1 - B)
+        c2 = K1 * B * n / max(1, self.total_len)
+        lengths = self.lengths
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for plist in terms:
+            df = len(plist)
+            w = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (K1 + 1)
+            if scores and df * COMMON_DF > n:
+                for doc_id in list(scores):
+                    tf = plist.get(doc_id)
+                    if tf:
+                        scores[doc_id] += w * tf / (tf + c1 + c2 * lengths[doc_id])
+                continue
+            for doc_id, tf in plist.items():
+                scores[doc_id] = get(doc_id, 0.0) + w * tf / (tf + c1 + c2 * lengths[doc_id])
+        if source:
+            scores = {d: sc for d, sc in scores.items() if self.docs[d].source == source}
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [(score, self.docs[doc_id]) for doc_id, score in best]
+
+class SearchIndex:
+    # `files` returns (version, {path: entry} or None when unchanged) and
+    # `read_file(student_id, path)` the bytes; `history(student_id, since)`
+    # returns messages with `seq` after `since`.
+    def __init__(
+        self,
+        files: Callable[[str, Any], Tuple[Any, Optional[Dict[str, Dict[str, Any]]]]],
+        read_file: Callable[[str, str], Optional[bytes]],
+        history: Callable[[str, int], List[Dict[str, Any]]],
+        cache_students: int = 64,
+    ):
+        self._files = files
+        self._read_file = read_file
+        self._history = history
+        self.cache_students = max(1, cache_students)
+        self._indexes: "OrderedDict[str, StudentIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, student_id: str, create: bool = True) -> Optional[StudentIndex]:
+        with self._lock:
+            idx = self._indexes.get(student_id)
+            if idx is None:
+                if not create:
+                    return None
+                idx = self._indexes[student_id] = StudentIndex()
+            self._indexes.move_to_end(student_id)
+            while len(self._indexes) > self.cache_students:
+                self._indexes.popitem(last=False)
+            return idx
+
+    def _sync(self, student_id: str, idx: StudentIndex) -> None:
+        version, entries = self._files(student_id, idx.files_version)
+        if entries is not None:
+            for path in [p for p in idx.files if p not in entries]:
+                idx.drop_file(path)
+            for path, entry in entries.items():
+                digest = str(entry.get("hash") or "")
+                if idx.files.get(path, ("",))[0] == digest:
+                    continue
+                text = None
+                if int(entry.get("size") or 0) <= MAX_INDEX_BYTES:
+                    data = self._read_file(student_id, path)
+                    try:
+                        text = data.decode("utf-8") if data is not None else None
+                    except UnicodeDecodeError:
+                        text = None
+                idx.set_file(path, digest, text)
+            idx.files_version = version
+        for m in self._history(student_id, idx.history_seq):
+            seq = int(m.get("seq") or 0)
+            idx.history_seq = max(idx.history_seq, seq)
+            idx.add("history", seq, history_text(m))
+
+    def refresh(self, student_id: str) -> None:
+        # Called after writes; only indexes that are already loaded are updated.
+        idx = self._get(student_id, create=False)
+        if idx is not None:
+            with idx.lock:
+                self._sync(student_id, idx)
+
+    def reset_history(self, student_id: str) -> None:
+        # History was replaced wholesale, so seqs may have been reused.
+        idx = self._get(student_id, create=False)
+        if idx is None:
+            return
+        with idx.lock:
+            for doc_id in [d for d, doc in idx.docs.items() if doc.source == "history"]:
+                idx.remove(doc_id)
+            idx.history_seq = 0
+            self._sync(student_id, idx)
+
+    def search(self, student_id: str, query: str, k: int = 5, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        idx = self._get(student_id)
+        with idx.lock:
+            self._sync(student_id, idx)
+            hits = idx.search(query, k, source)
+        out: List[Dict[str, Any]] = []
+        for score, doc in hits:
+            hit: Dict[str, Any] = {"source": doc.source, "score": round(score, 4), "text": doc.text}
+            if doc.source == "file":
+                hit["path"], hit["passage"] = doc.key
+            else:
+                hit["seq"] = doc.key
+            out.append(hit)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = list(self._indexes.values())
+        return {"students": len(loaded), "docs": sum(len(i.docs) for i in loaded), "terms": sum(len(i.postings) for i in loaded)}
+
+def select_snippets(hits: Iterable[Dict[str, Any]], budget_tokens: int, skip: Set[str] = frozenset(), max_chars: int = 800) -> List[Dict[str, Any]]:
+    # Best-first hits that fit the token budget, skipping text already in the
+    # prompt; `skip` holds raw texts, and messages in history_text() form.
+    out: List[Dict[str, Any]] = []
+    used = 0
+    for hit in hits:
+        text = hit["text"][:max_chars]
+        if text in skip or any(text in s for s in skip):
+            continue
+        cost = approx_tokens(text) + 8
+        if used + cost > budget_tokens:
+            continue
+        used += cost
+        out.append(dict(hit, text=text))
+    return out
+
+def format_snippets(snippets: List[Dict[str, Any]]) -> str:
+    lines = ["Relevant excerpts from the student's own notes and earlier conversations (use them if they help):"]
+    for s in snippets:
+        label = f"file {s['path']}" if s["source"] == "file" else f"earlier chat #{s['seq']}"
+        lines.append(f"[{label}] {s['text']}")
+    return "\n".join(lines)
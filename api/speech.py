@@ -0,0 +1,97 @@
+import re
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+# ---------- Sentence-pipelined TTS ----------
+# Splits streamed chat deltas into sentences and synthesizes each one while
+# the rest of the answer is still arriving. Audio comes back in sentence
+# order, interleaved with the text deltas.
+
+_SENTENCE_END = re.compile(r"[.!?…][\"')\]]*\s+|\n+")
+
+class SentenceSplitter:
+    def __init__(self, min_chars: int = 24):
+        self.min_chars = min_chars
+        self._buf = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self._buf += delta
+        out: List[str] = []
+        start = 0
+        for m in _SENTENCE_END.finditer(self._buf):
+            # Very short fragments ("Hi.", "1.") are held back and merged with
+            # the next sentence so we do not pay a TTS round trip for each.
+            if m.end() - start < self.min_chars:
+                continue
+            sentence = self._buf[start:m.end()].strip()
+            if sentence:
+                out.append(sentence)
+            start = m.end()
+        self._buf = self._buf[start:]
+        return out
+
+    def flush(self) -> Optional[str]:
+        tail = self._buf.strip()
+        self._buf = ""
+        return tail or None
+
+async def speak_along(
+    deltas: AsyncIterator[str],
+    synth: Callable[[str], Awaitable[bytes]],
+    max_parallel: int = 3,
+) -> AsyncIterator[Dict[str, Any]]:
+    # Yields {"delta": str} as text arrives and {"seq", "text", "audio"} once
+    # each sentence's audio is ready and every earlier sentence has been sent.
+    splitter = SentenceSplitter()
+    sem = asyncio.Semaphore(max(1, max_parallel))
+    pending: Deque[Tuple[int, str, "asyncio.Task[bytes]"]] = deque()
+    seq = 0
+
+    async def run(sentence: str) -> bytes:
+        async with sem:
+            return await synth(sentence)
+
+    def launch(sentence: str) -> None:
+        nonlocal seq
+        pending.append((seq, sentence, asyncio.ensure_future(run(sentence))))
+        seq += 1
+
+    it = deltas.__aiter__()
+    next_delta: Optional["asyncio.Future[str]"] = asyncio.ensure_future(it.__anext__())
+    try:
+        while next_delta is not None or pending:
+            waits: set = set()
+            if next_delta is not None:
+                waits.add(next_delta)
+            if pending:
+                waits.add(pending[0][2])
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+
+            while pending and pending[0][2].done():
+                n, sentence, task = pending.popleft()
+                try:
+                    audio: Optional[bytes] = task.result()
+                except Exception as e:
+                    print(f"Sentence TTS failed: {e}")
+                    audio = None
+                yield {"seq": n, "text": sentence, "audio": audio}
+
+            if next_delta is not None and next_delta.done():
+                try:
+                    delta = next_delta.result()
+                except StopAsyncIteration:
+                    next_delta = None
+                    tail = splitter.flush()
+                    if tail:
+                        launch(tail)
+                    continue
+                yield {"delta": delta}
+                for sentence in splitter.feed(delta):
+                    launch(sentence)
+                next_delta = asyncio.ensure_future(it.__anext__())
+    finally:
+        if next_delta is not None and not next_delta.done():
+            next_delta.cancel()
+        for _, _, task in pending:
+            task.cancel()
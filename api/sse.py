@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+# ---------- Server-sent event streaming ----------
+# Turns an async iterator of event dicts into SSE frames. Text deltas are
+# batched into one frame per COALESCE_MS or COALESCE_CHARS, whichever comes
+# first (the first delta goes out at once), idle streams get a comment every
+# HEARTBEAT seconds so proxies keep them open, and a client disconnect closes
+# the source right away so the upstream call stops too. Streams that can be
+# resumed carry "id: <stream>:<seq>" on every frame, seq being the last event
+# the frame includes, for the client to send back as Last-Event-ID.
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+HEARTBEAT = max(1.0, _env_float("SSE_HEARTBEAT_SECONDS", 15.0))
+COALESCE_MS = max(0.0, _env_float("SSE_COALESCE_MS", 40.0))
+COALESCE_CHARS = max(1, int(_env_float("SSE_COALESCE_CHARS", 200)))
+# How often the client connection is checked while waiting on the source.
+DISCONNECT_POLL = 0.25
+PING = ": ping\n\n"
+
+def frame(data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}data: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def parse_event_id(raw: Optional[str]) -> Optional[Tuple[str, int]]:
+    # "<stream>:<seq>" -> (stream, seq)
+    sid, _, seq = (raw or "").strip().rpartition(":")
+    try:
+        return (sid, int(seq)) if sid else None
+    except ValueError:
+        return None
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+class StreamMetrics:
+    # Counters plus time to first delta and total time over the last `window` streams.
+    def __init__(self, name: str, window: int = 512):
+        self.name = name
+        self.active = 0
+        self._ttft: Deque[float] = deque(maxlen=window)
+        self._total: Deque[float] = deque(maxlen=window)
+        self.counters: Dict[str, int] = {"streams": 0, "completed": 0, "disconnected": 0, "errors": 0, "frames": 0, "deltas": 0, "heartbeats": 0}
+
+    def record(self, outcome: str, ttft_ms: Optional[float], total_ms: float) -> None:
+        self.counters[outcome] += 1
+        if ttft_ms is not None:
+            self._ttft.append(ttft_ms)
+        self._total.append(total_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        ttft, total = list(self._ttft), list(self._total)
+        return {
+            "active": self.active,
+            **self.counters,
+            "ttft_ms": {"p50": _pct(ttft, 0.5), "p95": _pct(ttft, 0.95)},
+            "total_ms": {"p50": _pct(total, 0.5), "p95": _pct(total, 0.95)},
+        }
+
+async def _wait_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL)
+
+async def stream(
+    request: Optional[Request],
+    events: AsyncIterator[Dict[str, Any]],
+    metrics: StreamMetrics,
+    started: Optional[float] = None,
+    stream_id: Optional[str] = None,
+    after: int = 0,
+) -> AsyncIterator[str]:
+    # `events` yields {"delta": str} and any other event dicts; a {"done": ...}
+    # event gets this stream's timings added. `started` is a perf_counter()
+    # taken when the request arrived. With `stream_id`, the events are
+    # numbered from `after` + 1 and a {"stream": id} frame goes first.
+    t0 = started if started is not None else time.perf_counter()
+    ttft: Optional[float] = None
+    outcome = "completed"
+    it = events.__aiter__()
+    nxt: Optional["asyncio.Future[Dict[str, Any]]"] = None
+    watcher = asyncio.ensure_future(_wait_disconnect(request)) if request is not None else None
+    buf: List[str] = []
+    buf_len = 0
+    buf_since = 0.0
+    last_write = time.monotonic()
+    max_delay = COALESCE_MS / 1000.0
+    seq = after
+    buf_seq = after
+    metrics.active += 1
+    metrics.counters["streams"] += 1
+
+    def event_id(n: int) -> Optional[str]:
+        return f"{stream_id}:{n}" if stream_id else None
+
+    def flush() -> str:
+        nonlocal buf, buf_len, last_write
+        text = "".join(buf)
+        buf, buf_len = [], 0
+        last_write = time.monotonic()
+        metrics.counters["frames"] += 1
+        return frame({"delta": text}, event_id(buf_seq))
+
+    try:
+        if stream_id:
+            yield frame({"stream": stream_id, "resumed": after > 0}, event_id(after))
+        while True:
+            if nxt is None:
+                nxt = asyncio.ensure_future(it.__anext__())
+            now = time.monotonic()
+            deadline = last_write + HEARTBEAT
+            if buf:
+                deadline = min(deadline, buf_since + max_delay)
+            waits = {nxt, watcher} if watcher is not None else {nxt}
+            done, _ = await asyncio.wait(waits, timeout=max(0.0, deadline - now), return_when=asyncio.FIRST_COMPLETED)
+
+            if watcher is not None and watcher in done:
+                outcome = "disconnected"
+                return
+            if nxt not in done:
+                if buf:
+                    yield flush()
+                elif time.monotonic() - last_write >= HEARTBEAT:
+                    metrics.counters["heartbeats"] += 1
+                    last_write = time.monotonic()
+                    yield PING
+                continue
+
+            try:
+                ev = nxt.result()
+            except StopAsyncIteration:
+                nxt = None
+                if buf:
+                    yield flush()
+                return
+            nxt = None
+            seq += 1
+
+            if "delta" in ev and len(ev) == 1:
+                metrics.counters["deltas"] += 1
+                if not ev["delta"]:
+                    continue
+                buf.append(ev["delta"])
+                buf_len += len(ev["delta"])
+                buf_seq = seq
+                if ttft is None:
+                    ttft = (time.perf_counter() - t0) * 1000
+                    yield flush()
+                elif buf_len >= COALESCE_CHARS:
+                    yield flush()
+                elif len(buf) == 1:
+                    buf_since = time.monotonic()
+                continue
+
+            # Anything else keeps its place after the text before it.
+            if buf:
+                yield flush()
+            if ev.get("error"):
+                outcome = "errors"
+            if ev.get("done"):
+                ev = dict(ev, timing={"ttft_ms": round(ttft, 1) if ttft is not None else None, "total_ms": round((time.perf_counter() - t0) * 1000, 1)})
+            metrics.counters["frames"] += 1
+            last_write = time.monotonic()
+            yield frame(ev, event_id(seq))
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "disconnected"
+        raise
+    except Exception:
+        outcome = "errors"
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        # Cancelling the pending read unwinds the source, which cancels the
+        # upstream stream once nobody else is reading it.
+        if nxt is not None and not nxt.done():
+            nxt.cancel()
+        elif nxt is None and hasattr(it, "aclose"):
+            asyncio.ensure_future(it.aclose())
+        metrics.active -= 1
+        metrics.record(outcome, ttft, (time.perf_counter() - t0) * 1000)
+
+def response(body: AsyncIterator[str]) -> StreamingResponse:
+    # no-transform and X-Accel-Buffering keep proxies from buffering frames.
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,143 @@
+import json
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import os
+
+from fastapi.responses import FileResponse, Response
+
+from api import httputil
+from api import images
+
+# ---------- Static assets ----------
+# Route resolution comes from an in-memory manifest built once at startup,
+# so serving a file costs no stat calls. When scripts/build_assets.py has
+# produced dist/, its fingerprinted and precompressed output is served;
+# otherwise public/ is indexed as-is.
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+SHORT = "public, max-age=3600"
+
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+class _Asset:
+    __slots__ = ("path", "etag", "media_type", "cache_control", "variants", "images")
+
+    def __init__(self, path: Path, digest: str, media_type: str, cache_control: str):
+        self.path = path
+        self.etag = f'"{digest[:32]}"'
+        self.media_type = media_type
+        self.cache_control = cache_control
+        # encoding -> (file, stat); "identity" is always present.
+        self.variants: Dict[str, Tuple[Path, os.stat_result]] = {}
+        # Resized image variant name ("w640.webp") -> URL of that file.
+        self.images: Dict[str, str] = {}
+
+def _accepted(header: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            out[name.strip().lower()] = q
+    return out
+
+class StaticSite:
+    def __init__(self, public_dir: Path, dist_dir: Optional[Path] = None):
+        self.public_dir = public_dir
+        self.dist_dir = dist_dir
+        self.root = public_dir
+        self.built = False
+        self.assets: Dict[str, _Asset] = {}
+
+    def load(self) -> None:
+        manifest = self.dist_dir / "asset-manifest.json" if self.dist_dir else None
+        if manifest is not None and manifest.exists():
+            self._load_dist(manifest)
+        elif self.public_dir.exists():
+            self._index_public()
+
+    def _add(self, url: str, fp: Path, digest: str, media_type: str, cache_control: str, encodings: Tuple[str, ...] = ()) -> _Asset:
+        asset = _Asset(fp, digest, media_type, cache_control)
+        asset.variants["identity"] = (fp, fp.stat())
+        for enc in encodings:
+            suffix = {"br": ".br", "gzip": ".gz"}.get(enc)
+            vfp = fp.with_name(fp.name + suffix) if suffix else None
+            if vfp is not None and vfp.exists():
+                asset.variants[enc] = (vfp, vfp.stat())
+        self.assets[url] = asset
+        return asset
+
+    def _load_dist(self, manifest: Path) -> None:
+        data = json.loads(manifest.read_text("utf-8"))
+        self.root = manifest.parent
+        self.built = True
+        for url, info in (data.get("files") or {}).items():
+            fp = self.root / url.lstrip("/")
+            if not fp.exists():
+                continue
+            cache_control = IMMUTABLE if info.get("immutable") else (REVALIDATE if url.endswith((".html", "sw.js")) else SHORT)
+            asset = self._add(url, fp, str(info.get("hash") or ""), str(info.get("type") or "application/octet-stream"), cache_control, tuple(info.get("encodings") or ()))
+            asset.images = dict(info.get("images") or {})
+        # Old un-hashed URLs keep working, with revalidation instead of immutable.
+        for orig, hashed in (data.get("assets") or {}).items():
+            src = self.assets.get(hashed)
+            if src is not None and orig not in self.assets:
+                alias = _Asset(src.path, src.etag.strip('"'), src.media_type, SHORT)
+                alias.etag = src.etag
+                alias.variants = src.variants
+                alias.images = src.images
+                self.assets[orig] = alias
+
+    def _index_public(self) -> None:
+        self.root = self.public_dir
+        for fp in self.public_dir.rglob("*"):
+            if not fp.is_file() or fp.name.startswith("."):
+                continue
+            url = "/" + fp.relative_to(self.public_dir).as_posix()
+            digest = hashlib.sha256(fp.read_bytes()).hexdigest()
+            media_type = mimetypes.guess_type(fp.name)[0] or "application/octet-stream"
+            self._add(url, fp, digest, media_type, REVALIDATE if url.endswith((".html", "sw.js")) else SHORT)
+
+    def lookup(self, path: str) -> Optional[_Asset]:
+        url = "/" + path.lstrip("/")
+        if url.endswith("/"):
+            url += "index.html"
+        return self.assets.get(url)
+
+    def respond(self, asset: _Asset, headers: Dict[str, str], width: Optional[int] = None) -> Response:
+        if asset.images:
+            # Same URL, different bytes per Accept/?w=, so caches must key on Accept.
+            name = images.pick(asset.images, headers.get("accept", ""), width)
+            target = self.assets.get(asset.images[name]) if name else None
+            if target is not None:
+                return self._send(target, headers, asset.cache_control, "Accept")
+            return self._send(asset, headers, asset.cache_control, "Accept")
+        return self._send(asset, headers, asset.cache_control, "Accept-Encoding")
+
+    def _send(self, asset: _Asset, headers: Dict[str, str], cache_control: str, vary: str) -> Response:
+        common = {"Cache-Control": cache_control, "Vary": vary}
+        accepted = _accepted(headers.get("accept-encoding", ""))
+        encoding = "identity"
+        for enc in ("br", "gzip"):
+            if enc in asset.variants and accepted.get(enc, 0.0) > 0:
+                encoding = enc
+                break
+        # Each encoding is a different byte sequence, so it gets its own strong ETag.
+        etag = asset.etag if encoding == "identity" else f'{asset.etag[:-1]}-{encoding}"'
+        if httputil.etag_matches(headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers={**common, "ETag": etag})
+        fp, st = asset.variants[encoding]
+        out = {**common, "ETag": etag}
+        if encoding != "identity":
+            out["Content-Encoding"] = encoding
+        return FileResponse(fp, media_type=asset.media_type, headers=out, stat_result=st)
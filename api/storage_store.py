@@ -0,0 +1,398 @@
+import os
+import time
+import bisect
+import json
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+# ---------- Per-student file storage ----------
+# Files live under `<root>/<id>/`, as before. Each student also has a
+# manifest (`<root>/.index/<id>.json`: path -> size, mtime, sha256) that
+# writes and deletes keep up to date, so listing never walks the tree and
+# clients can skip files whose hash they already have. A missing manifest
+# is rebuilt from one scan of the student's directory.
+#
+# Large files arrive through resumable upload sessions (offset-based, like
+# tus): bytes are appended to `<root>/.uploads/<id>/<upload>.part` in
+# whatever chunks the client sends, and the finished file is moved into
+# place, so nothing is ever held in memory whole.
+
+INDEX_DIR = ".index"
+UPLOADS_DIR = ".uploads"
+UPLOAD_TTL = 24 * 3600
+CHUNK_SIZE = 1 << 20
+
+class StorageError(Exception):
+    status = 400
+
+class NotFound(StorageError):
+    status = 404
+
+class Conflict(StorageError):
+    status = 409
+
+class TooLarge(StorageError):
+    status = 413
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(fp: Path) -> str:
+    h = hashlib.sha256()
+    with fp.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class _Manifest:
+    def __init__(self, entries: Dict[str, Dict[str, Any]], stamp: Tuple[int, int]) -> None:
+        self.entries = entries
+        self.paths = sorted(entries)
+        self.stamp = stamp
+
+    def put(self, rel: str, entry: Dict[str, Any]) -> None:
+        if rel not in self.entries:
+            bisect.insort(self.paths, rel)
+        self.entries[rel] = entry
+
+    def remove(self, rel: str) -> bool:
+        if self.entries.pop(rel, None) is None:
+            return False
+        i = bisect.bisect_left(self.paths, rel)
+        if i < len(self.paths) and self.paths[i] == rel:
+            del self.paths[i]
+        return True
+
+class StorageStore:
+    def __init__(self, root: Path, cache_students: int = 256, max_file_bytes: int = 100 * 1024 * 1024):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        self.cache_students = max(1, cache_students)
+        self._manifests: "OrderedDict[str, _Manifest]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def safe_id(student_id: str) -> str:
+        return "".join(c for c in (student_id or "BN-UNKNOWN") if c.isalnum() or c in ("-", "_"))
+
+    def student_dir(self, student_id: str) -> Path:
+        return self.root / self.safe_id(student_id)
+
+    def manifest_path(self, student_id: str) -> Path:
+        return self.root / INDEX_DIR / f"{self.safe_id(student_id)}.json"
+
+    def resolve(self, student_id: str, rel: str) -> Tuple[str, Path]:
+        # -> (normalized relative path, absolute file path); ValueError when
+        # the path is empty or escapes the student's directory.
+        base = self.student_dir(student_id).resolve()
+        fp = (base / (rel or "").strip().lstrip("/")).resolve()
+        if fp == base or base not in fp.parents:
+            raise ValueError("Invalid path")
+        return fp.relative_to(base).as_posix(), fp
+
+    @contextmanager
+    def _locked(self, student_id: str) -> Iterator[None]:
+        # Same scheme as the history log: thread lock plus a flock sidecar so
+        # several workers can share one data directory.
+        lock_dir = self.root / INDEX_DIR
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with (lock_dir / f"{self.safe_id(student_id)}.lock").open("a") as lf:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stamp(fp: Path) -> Tuple[int, int]:
+        try:
+            st = fp.stat()
+            return st.st_mtime_ns, st.st_ino
+        except FileNotFoundError:
+            return 0, 0
+
+    def _entry(self, fp: Path, digest: str) -> Dict[str, Any]:
+        st = fp.stat()
+        return {"size": st.st_size, "mtime": st.st_mtime, "hash": digest}
+
+    def _scan(self, student_id: str) -> Dict[str, Dict[str, Any]]:
+        base = self.student_dir(student_id)
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not base.exists():
+            return entries
+        for fp in base.rglob("*"):
+            if not fp.is_file() or (fp.name.startswith(".") and fp.name.endswith(".tmp")):
+                continue
+            entries[fp.relative_to(base).as_posix()] = self._entry(fp, hash_file(fp))
+        return entries
+
+    def _save(self, student_id: str, man: _Manifest) -> None:
+        mp = self.manifest_path(student_id)
+        tmp = mp.with_name(f".{mp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(man.entries, ensure_ascii=False, separators=(",", ":")), "utf-8")
+        tmp.replace(mp)
+        man.stamp = self._stamp(mp)
+
+    def _manifest(self, student_id: str) -> _Manifest:
+        # Callers hold the lock. The cached copy is reused while the manifest
+        # file is unchanged, i.e. no other worker has written since.
+        sid = self.safe_id(student_id)
+        mp = self.manifest_path(student_id)
+        stamp = self._stamp(mp)
+        man = self._manifests.get(sid)
+        if man is not None and man.stamp == stamp and stamp != (0, 0):
+            self._manifests.move_to_end(sid)
+            return man
+        entries: Optional[Dict[str, Dict[str, Any]]] = None
+        if stamp != (0, 0):
+            try:
+                entries = json.loads(mp.read_text("utf-8"))
+            except Exception:
+                entries = None
+        man = _Manifest(entries if isinstance(entries, dict) else self._scan(student_id), stamp)
+        if entries is None and man.entries:
+            # A student with no files gets no manifest; rescanning a missing
+            # directory costs nothing.
+            self._save(student_id, man)
+        self._manifests[sid] = man
+        self._manifests.move_to_end(sid)
+        while len(self._manifests) > self.cache_students:
+            self._manifests.popitem(last=False)
+        return man
+
+    def _empty(self, student_id: str) -> bool:
+        # Reads for students who never stored anything (every chat asks) skip
+        # the lock, so they leave no files behind.
+        return not self.manifest_path(student_id).exists() and not self.student_dir(student_id).exists()
+
+    def list(self, student_id: str, prefix: str = "", cursor: str = "", limit: int = 200) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        # Paths sorted lexically; `cursor` is the last path of the previous
+        # page. Returns (entries, next cursor or None).
+        limit = max(1, min(int(limit), 1000))
+        if self._empty(student_id):
+            return [], None
+        with self._locked(student_id):
+            man = self._manifest(student_id)
+            start = max(bisect.bisect_left(man.paths, prefix), bisect.bisect_right(man.paths, cursor) if cursor else 0)
+            page: List[Dict[str, Any]] = []
+            for rel in man.paths[start:]:
+                if not rel.startswith(prefix):
+                    break
+                if len(page) == limit:
+                    return page, page[-1]["path"]
+                page.append({"path": rel, **man.entries[rel]})
+        return page, None
+
+    def snapshot(self, student_id: str, since: Any = None) -> Tuple[Any, Optional[Dict[str, Dict[str, Any]]]]:
+        # -> (version, path -> entry); entries is None when the manifest is
+        # unchanged since `since`, so pollers can skip the diff.
+        if self._empty(student_id):
+            return (0, 0), None if since == (0, 0) else {}
+        with self._locked(student_id):
+            man = self._manifest(student_id)
+            if since is not None and since == man.stamp:
+                return man.stamp, None
+            return man.stamp, {rel: dict(e) for rel, e in man.entries.items()}
+
+    def stat(self, student_id: str, rel: str) -> Optional[Dict[str, Any]]:
+        rel, _ = self.resolve(student_id, rel)
+        if self._empty(student_id):
+            return None
+        with self._locked(student_id):
+            entry = self._manifest(student_id).entries.get(rel)
+        return dict(entry, path=rel) if entry else None
+
+    def open_file(self, student_id: str, rel: str) -> Optional[Tuple[Path, Dict[str, Any]]]:
+        # -> (file path, manifest entry) for streaming reads.
+        rel, fp = self.resolve(student_id, rel)
+        entry = self.stat(student_id, rel)
+        if entry is None or not fp.is_file():
+            return None
+        return fp, entry
+
+    def read(self, student_id: str, rel: str) -> Optional[bytes]:
+        _, fp = self.resolve(student_id, rel)
+        try:
+            return fp.read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def write_many(self, student_id: str, files: Iterable[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+        # Files whose content already matches the manifest hash are not
+        # rewritten. The manifest is saved once for the whole batch.
+        resolved = [(self.resolve(student_id, rel), data) for rel, data in files]
+        out: List[Dict[str, Any]] = []
+        with self._locked(student_id):
+            man = self._manifest(student_id)
+            changed = False
+            for (rel, fp), data in resolved:
+                digest = hash_bytes(data)
+                current = man.entries.get(rel)
+                if current is not None and current.get("hash") == digest and fp.exists():
+                    out.append({"path": rel, "hash": digest, "size": current["size"], "skipped": True})
+                    continue
+                fp.parent.mkdir(parents=True, exist_ok=True)
+                tmp = fp.with_name(f".{fp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                tmp.replace(fp)
+                entry = self._entry(fp, digest)
+                man.put(rel, entry)
+                changed = True
+                out.append({"path": rel, "hash": digest, "size": entry["size"], "saved": True})
+            if changed:
+                self._save(student_id, man)
+        return out
+
+    def write(self, student_id: str, rel: str, data: bytes) -> Dict[str, Any]:
+        return self.write_many(student_id, [(rel, data)])[0]
+
+    def commit_file(self, student_id: str, rel: str, src: Path, digest: Optional[str] = None) -> Dict[str, Any]:
+        # Moves an already-written file (same filesystem) into place.
+        rel, fp = self.resolve(student_id, rel)
+        digest = digest or hash_file(src)
+        with self._locked(student_id):
+            man = self._manifest(student_id)
+            fp.parent.mkdir(parents=True, exist_ok=True)
+            src.replace(fp)
+            entry = self._entry(fp, digest)
+            man.put(rel, entry)
+            self._save(student_id, man)
+        return {"path": rel, "hash": digest, "size": entry["size"], "saved": True}
+
+    def delete_many(self, student_id: str, rels: Iterable[str]) -> List[Dict[str, Any]]:
+        resolved = [self.resolve(student_id, rel) for rel in rels]
+        out: List[Dict[str, Any]] = []
+        with self._locked(student_id):
+            man = self._manifest(student_id)
+            changed = False
+            for rel, fp in resolved:
+                try:
+                    fp.unlink()
+                    existed = True
+                except FileNotFoundError:
+                    existed = False
+                if man.remove(rel):
+                    changed = True
+                out.append({"path": rel, "deleted": existed})
+            if changed:
+                self._save(student_id, man)
+        return out
+
+    def delete(self, student_id: str, rel: str) -> bool:
+        return bool(self.delete_many(student_id, [rel])[0]["deleted"])
+
+    def rebuild(self, student_id: str) -> int:
+        with self._locked(student_id):
+            man = _Manifest(self._scan(student_id), (0, 0))
+            self._save(student_id, man)
+            self._manifests[self.safe_id(student_id)] = man
+        return len(man.paths)
+
+    # ---------- Resumable uploads ----------
+
+    def _upload_dir(self, student_id: str) -> Path:
+        return self.root / UPLOADS_DIR / self.safe_id(student_id)
+
+    def _upload_paths(self, student_id: str, upload_id: str) -> Tuple[Path, Path]:
+        if not upload_id or not all(c.isalnum() or c in ("-", "_") for c in upload_id):
+            raise NotFound("Unknown upload")
+        d = self._upload_dir(student_id)
+        return d / f"{upload_id}.json", d / f"{upload_id}.part"
+
+    def _expire_uploads(self, student_id: str) -> None:
+        d = self._upload_dir(student_id)
+        if not d.exists():
+            return
+        cutoff = time.time() - UPLOAD_TTL
+        for fp in d.iterdir():
+            try:
+                if fp.stat().st_mtime < cutoff:
+                    fp.unlink()
+            except FileNotFoundError:
+                pass
+
+    def create_upload(self, student_id: str, rel: str, length: Optional[int] = None) -> Dict[str, Any]:
+        rel, _ = self.resolve(student_id, rel)
+        if length is not None and (length < 0 or length > self.max_file_bytes):
+            raise TooLarge(f"File larger than {self.max_file_bytes} bytes")
+        self._expire_uploads(student_id)
+        d = self._upload_dir(student_id)
+        d.mkdir(parents=True, exist_ok=True)
+        upload_id = secrets.token_urlsafe(12)
+        meta_fp, part_fp = self._upload_paths(student_id, upload_id)
+        meta = {"id": upload_id, "path": rel, "length": length, "created": time.time()}
+        part_fp.touch()
+        meta_fp.write_text(json.dumps(meta), "utf-8")
+        return dict(meta, offset=0)
+
+    def upload_status(self, student_id: str, upload_id: str) -> Dict[str, Any]:
+        meta_fp, part_fp = self._upload_paths(student_id, upload_id)
+        try:
+            meta = json.loads(meta_fp.read_text("utf-8"))
+            return dict(meta, offset=part_fp.stat().st_size)
+        except (FileNotFoundError, ValueError):
+            raise NotFound("Unknown upload")
+
+    @contextmanager
+    def append_upload(self, student_id: str, upload_id: str, offset: int) -> Iterator[Any]:
+        # Yields the .part file opened for append once `offset` is confirmed
+        # to be its current size. A second writer for the same upload gets
+        # Conflict instead of interleaving bytes.
+        meta = self.upload_status(student_id, upload_id)
+        _, part_fp = self._upload_paths(student_id, upload_id)
+        with part_fp.open("ab") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise Conflict("Upload is busy")
+            size = os.fstat(f.fileno()).st_size
+            if offset != size:
+                raise Conflict(f"Offset mismatch: upload is at {size}")
+            limit = meta["length"] if meta.get("length") is not None else self.max_file_bytes
+            yield _BoundedWriter(f, limit - size)
+
+    def finish_upload(self, student_id: str, upload_id: str) -> Dict[str, Any]:
+        meta = self.upload_status(student_id, upload_id)
+        if meta.get("length") is not None and meta["offset"] != meta["length"]:
+            raise Conflict(f"Upload incomplete: {meta['offset']} of {meta['length']} bytes")
+        meta_fp, part_fp = self._upload_paths(student_id, upload_id)
+        out = self.commit_file(student_id, meta["path"], part_fp)
+        meta_fp.unlink()
+        return out
+
+    def abort_upload(self, student_id: str, upload_id: str) -> None:
+        meta_fp, part_fp = self._upload_paths(student_id, upload_id)
+        if not meta_fp.exists():
+            raise NotFound("Unknown upload")
+        for fp in (part_fp, meta_fp):
+            try:
+                fp.unlink()
+            except FileNotFoundError:
+                pass
+
+class _BoundedWriter:
+    def __init__(self, f: Any, remaining: int) -> None:
+        self.f = f
+        self.remaining = remaining
+        self.written = 0
+
+    def write(self, data: bytes) -> None:
+        if len(data) > self.remaining:
+            raise TooLarge("Upload exceeds its declared length or the size limit")
+        self.f.write(data)
+        self.remaining -= len(data)
+        self.written += len(data)
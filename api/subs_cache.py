@@ -0,0 +1,64 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from api.datastore import DataStore, safe_id
+
+# ---------- Subscription cache ----------
+# /api/me runs on every page load. Parsed subscription records (including
+# "no subscription") stay in memory; the handler that writes a record updates
+# it in place, and writes from other workers are picked up by polling the
+# store's cheap version stamp at most once per `recheck` seconds.
+
+class SubscriptionCache:
+    def __init__(self, store: DataStore, max_entries: int = 4096, recheck: float = 2.0):
+        self.store = store
+        self.max_entries = max(1, max_entries)
+        self.recheck = recheck
+        self._entries: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._version: Any = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _maybe_invalidate(self) -> None:
+        now = time.monotonic()
+        if now - self._checked < self.recheck:
+            return
+        self._checked = now
+        try:
+            version = self.store.sub_version()
+        except Exception:
+            version = None
+        if version != self._version:
+            with self._lock:
+                self._entries.clear()
+                self._version = version
+                self.counters["invalidations"] += 1
+
+    def get(self, student_id: str) -> Optional[Dict[str, Any]]:
+        sid = safe_id(student_id)
+        self._maybe_invalidate()
+        with self._lock:
+            if sid in self._entries:
+                self._entries.move_to_end(sid)
+                self.counters["hits"] += 1
+                rec = self._entries[sid]
+                return dict(rec) if rec is not None else None
+            self.counters["misses"] += 1
+        rec = self.store.sub_get(sid)
+        self.put(sid, rec)
+        return dict(rec) if rec is not None else None
+
+    def put(self, student_id: str, rec: Optional[Dict[str, Any]]) -> None:
+        sid = safe_id(student_id)
+        with self._lock:
+            self._entries[sid] = dict(rec) if rec is not None else None
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), **self.counters}
@@ -0,0 +1,100 @@
+import os
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# ---------- Content-addressed TTS audio cache ----------
+# MP3s live on disk as <sha256(model, voice, text)>.mp3. Least recently played
+# clips are evicted once the directory grows past the size cap.
+
+def audio_key(model: str, voice: str, text: str) -> str:
+    raw = "\x1f".join([model, voice, " ".join(text.split())])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class AudioCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index: "Optional[OrderedDict[str, int]]" = None
+        self._total = 0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.mp3"
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        # Rebuilt once per process from the files on disk, oldest first.
+        if self._index is None:
+            entries = []
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                for fp in self.root.glob("*.mp3"):
+                    st = fp.stat()
+                    entries.append((st.st_mtime, fp.stem, st.st_size))
+            except Exception:
+                pass
+            entries.sort()
+            self._index = OrderedDict((k, size) for _, k, size in entries)
+            self._total = sum(self._index.values())
+        return self._index
+
+    def lookup(self, key: str) -> Optional[Path]:
+        fp = self.path(key)
+        with self._lock:
+            index = self._load_index()
+            if key in index and fp.exists():
+                index.move_to_end(key)
+                self.counters["hits"] += 1
+                try:
+                    os.utime(fp)
+                except Exception:
+                    pass
+                return fp
+            if key in index:
+                self._total -= index.pop(key)
+            self.counters["misses"] += 1
+        return None
+
+    def temp_path(self, key: str) -> Path:
+        # Unique per call: concurrent misses for one clip run on the same
+        # event-loop thread, and each needs its own file.
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f"{key}.{os.getpid()}.{secrets.token_hex(8)}.part"
+
+    def commit(self, key: str, tmp: Path) -> None:
+        try:
+            size = tmp.stat().st_size
+            tmp.replace(self.path(key))
+        except Exception:
+            return
+        with self._lock:
+            index = self._load_index()
+            self._total -= index.pop(key, 0)
+            index[key] = size
+            self._total += size
+            self.counters["stores"] += 1
+            while self._total > self.max_bytes and len(index) > 1:
+                old, old_size = index.popitem(last=False)
+                self._total -= old_size
+                self.counters["evictions"] += 1
+                try:
+                    self.path(old).unlink()
+                except Exception:
+                    pass
+
+    def put(self, key: str, data: bytes) -> None:
+        tmp = self.temp_path(key)
+        try:
+            tmp.write_bytes(data)
+        except Exception:
+            return
+        self.commit(key, tmp)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._load_index()
+            return {"entries": len(index), "bytes": self._total, "max_bytes": self.max_bytes, **self.counters}
@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import httpx
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional, cast
+try:
+    from openai import AsyncOpenAI
+except Exception:
+    AsyncOpenAI = None
+
+from api import admission
+from api import outbound
+
+# ---------- Async OpenAI upstream ----------
+# Every handler goes through this module so no upstream call ever blocks the
+# event loop, and the number of concurrent OpenAI requests stays bounded.
+# Slots are handed out by api/admission.py in plan priority order.
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except ValueError:
+        return default
+
+MAX_CONCURRENCY = _env_int("OPENAI_MAX_CONCURRENCY", 16)
+CHAT_TIMEOUT = _env_float("OPENAI_CHAT_TIMEOUT", 60.0)
+STREAM_TIMEOUT = _env_float("OPENAI_STREAM_TIMEOUT", 30.0)
+TTS_TIMEOUT = _env_float("OPENAI_TTS_TIMEOUT", 60.0)
+MAX_RETRIES = _env_int("OPENAI_MAX_RETRIES", 2)
+
+_client: Any = None
+_client_http: Optional[httpx.AsyncClient] = None
+_gate: Optional[admission.PriorityGate] = None
+_reservation: ContextVar[Optional["Reservation"]] = ContextVar("upstream_reservation", default=None)
+_stats: Dict[str, int] = {"in_flight": 0, "calls": 0, "timeouts": 0, "errors": 0}
+
+class UpstreamTimeout(Exception):
+    pass
+
+def get_client() -> Any:
+    # Rides on the shared "openai" pool (see api/outbound.py) and is rebuilt
+    # when that pool is reopened. The SDK retries with its own backoff.
+    global _client, _client_http
+    if AsyncOpenAI is None or not os.getenv("OPENAI_API_KEY"):
+        return None
+    http = outbound.client("openai")
+    if _client is None or _client_http is not http:
+        try:
+            _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=MAX_RETRIES, http_client=http)
+            _client_http = http
+        except Exception:
+            _client = None
+    return _client
+
+def available() -> bool:
+    return get_client() is not None
+
+def gate() -> admission.PriorityGate:
+    global _gate
+    if _gate is None:
+        _, limits = admission.settings_from_env()
+        _gate = admission.PriorityGate(MAX_CONCURRENCY, limits, prioritize=admission.ENABLED)
+    return _gate
+
+def stats() -> Dict[str, Any]:
+    return {"max_concurrency": MAX_CONCURRENCY, **_stats, "admission": gate().stats()}
+
+class Reservation:
+    # A slot taken ahead of time so a request can be refused (429) before it
+    # commits to a response; the first upstream call made under it uses it.
+    def __init__(self) -> None:
+        self.state = "held"
+
+    def release(self) -> None:
+        if self.state == "held":
+            self.state = "released"
+            gate().release()
+
+async def reserve() -> Reservation:
+    # Raises admission.Overloaded when no slot frees up in time.
+    await gate().acquire(admission.current_plan())
+    return Reservation()
+
+def use_reservation(r: Reservation) -> None:
+    # Upstream calls from this context, and tasks started from it, use `r`.
+    _reservation.set(r)
+
+class _Slot:
+    # Holds one concurrency slot and keeps the in-flight counters honest.
+    async def __aenter__(self) -> "_Slot":
+        r = _reservation.get()
+        if r is not None and r.state == "held":
+            r.state = "used"
+        else:
+            await gate().acquire(admission.current_plan())
+        self._t0 = time.monotonic()
+        _stats["in_flight"] += 1
+        _stats["calls"] += 1
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        _stats["in_flight"] -= 1
+        if exc_type is not None:
+            _stats["timeouts" if exc_type in (asyncio.TimeoutError, UpstreamTimeout) else "errors"] += 1
+        gate().release(time.monotonic() - self._t0)
+
+async def chat_completion(model: str, messages: List[Dict[str, Any]], temperature: float, timeout: Optional[float] = None) -> str:
+    cl = get_client()
+    if cl is None:
+        raise RuntimeError("OpenAI client not configured")
+    limit = timeout or CHAT_TIMEOUT
+    async with _Slot():
+        try:
+            out = await asyncio.wait_for(
+                cl.chat.completions.create(model=model, messages=cast(Any, messages), temperature=temperature, timeout=limit),
+                timeout=limit,
+            )
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout(f"chat completion exceeded {limit:.0f}s")
+    return (out.choices[0].message.content or "").strip()
+
+async def chat_stream(model: str, messages: List[Dict[str, Any]], temperature: float, timeout: Optional[float] = None) -> AsyncIterator[str]:
+    # `timeout` bounds the wait for each chunk, not the whole answer.
+    cl = get_client()
+    if cl is None:
+        raise RuntimeError("OpenAI client not configured")
+    limit = timeout or STREAM_TIMEOUT
+    async with _Slot():
+        try:
+            stream = await asyncio.wait_for(
+                cl.chat.completions.create(model=model, messages=cast(Any, messages), temperature=temperature, stream=True, timeout=limit),
+                timeout=limit,
+            )
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout(f"chat stream did not start within {limit:.0f}s")
+        try:
+            it = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(it.__anext__(), timeout=limit)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise UpstreamTimeout(f"chat stream stalled for {limit:.0f}s")
+                try:
+                    delta = chunk.choices[0].delta.content
+                except Exception:
+                    delta = None
+                if delta:
+                    yield delta
+        finally:
+            try:
+                await stream.close()
+            except Exception:
+                pass
+
+async def speech(model: str, text: str, voice: str = "alloy", timeout: Optional[float] = None) -> bytes:
+    cl = get_client()
+    if cl is None:
+        raise RuntimeError("OpenAI client not configured")
+    limit = timeout or TTS_TIMEOUT
+    async with _Slot():
+        try:
+            response = await asyncio.wait_for(
+                cl.audio.speech.create(model=model, voice=cast(Any, voice), input=text, timeout=limit),
+                timeout=limit,
+            )
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout(f"speech synthesis exceeded {limit:.0f}s")
+    return response.content
+
+async def speech_stream(model: str, text: str, voice: str = "alloy", timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+    # The SDK buffers the whole clip, so talk to /audio/speech directly and
+    # hand MP3 bytes on as soon as they arrive.
+    cl = get_client()
+    if cl is None:
+        raise RuntimeError("OpenAI client not configured")
+    limit = timeout or TTS_TIMEOUT
+    url = str(cl.base_url).rstrip("/") + "/audio/speech"
+    headers = {"Authorization": f"Bearer {cl.api_key}"}
+    body = {"model": model, "voice": voice, "input": text, "response_format": "mp3"}
+    async with _Slot():
+        async with outbound.client("openai").stream("POST", url, headers=headers, json=body, timeout=limit) as response:
+            if response.status_code >= 400:
+                detail = (await response.aread()).decode("utf-8", "replace")
+                raise RuntimeError(f"speech request failed ({response.status_code}): {detail[:200]}")
+            async for chunk in response.aiter_bytes():
+                if chunk:
+                    yield chunk
@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+from api.datastore import DataStore
+
+# ---------- Webhook inbox ----------
+# The webhook handler only verifies the signature and appends the raw event to
+# an append-only log (inbox.jsonl, fsynced), then returns. Events are applied
+# to subscription records later, in batches:
+#   - duplicates (same event id, i.e. a retry or replay) are dropped,
+#   - each student's events are applied oldest first by the event's own
+#     updated_at, and one older than what the record already reflects is
+#     skipped, so late or reordered deliveries cannot roll a record back,
+#   - all of a student's events in a batch land in one atomic record write.
+# Progress (log offset plus recently seen ids) is checkpointed after each
+# batch. A crash before the checkpoint only re-applies that batch, which the
+# updated_at check makes harmless. Appends and batches take file locks, so
+# several uvicorn workers can share one inbox directory.
+
+BATCH_SIZE = 500
+SEEN_IDS = 20000
+# A fully applied log is rotated out once it grows past this.
+ROTATE_BYTES = 4 * 1024 * 1024
+KEEP_SEGMENTS = 3
+# Delay before the worker's first batch, so a burst lands in one batch.
+BATCH_DELAY = 0.05
+
+CANCELLED = ("subscription_cancelled", "subscription_expired", "subscription_paused")
+
+def event_id(event: Dict[str, Any], body: bytes) -> str:
+    # Lemon Squeezy has no delivery id; a resource at a given updated_at,
+    # named by the event, identifies one event. Anything else is keyed by
+    # its exact bytes.
+    meta = event.get("meta") or {}
+    data = event.get("data") or {}
+    attrs = data.get("attributes") or {}
+    if meta.get("event_name") and data.get("id") and attrs.get("updated_at"):
+        return f"{meta['event_name']}:{data.get('type')}:{data['id']}:{attrs['updated_at']}"
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+def parse_event(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # -> the subscription change carried by `event`, or None to ignore it.
+    meta = event.get("meta") or {}
+    etype = str(meta.get("event_name") or "").strip().lower()
+    if not etype:
+        return None
+    attrs = (event.get("data") or {}).get("attributes") or {}
+    custom = attrs.get("custom_data") or meta.get("custom_data") or {}
+    status = "active"
+    if etype in CANCELLED:
+        status = "cancelled"
+    elif etype == "subscription_payment_failed":
+        status = "past_due"
+    change = {
+        "student_id": str(custom.get("student_id") or attrs.get("user_email") or "BN-UNKNOWN"),
+        "status": status,
+        "plan": str(custom.get("plan") or "associates").strip().lower(),
+        "cadence": str(custom.get("cadence") or "monthly").strip().lower(),
+        "event": etype,
+        "event_updated_at": str(attrs.get("updated_at") or ""),
+    }
+    if attrs.get("order_id"):
+        change["order_id"] = attrs.get("order_id")
+    if attrs.get("subscription_id"):
+        change["subscription_id"] = attrs.get("subscription_id")
+    return change
+
+class _Batch:
+    __slots__ = ("lines", "done", "error")
+
+    def __init__(self) -> None:
+        self.lines: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+def _atomic_write(fp: Path, data: bytes) -> None:
+    tmp = fp.with_name(f".{fp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(fp)
+
+class WebhookInbox:
+    # `on_applied(student_id, record)` runs after each record write (from a
+    # worker thread).
+    def __init__(
+        self,
+        directory: Path,
+        store: DataStore,
+        on_applied: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        batch_size: int = BATCH_SIZE,
+    ):
+        self.dir = directory
+        self.path = directory / "inbox.jsonl"
+        self.state_path = directory / "inbox.state.json"
+        self.store = store
+        self.on_applied = on_applied
+        self.batch_size = max(1, batch_size)
+        self._append_lock = threading.Lock()
+        # Group commit: appends arriving while a write+fsync is in progress
+        # are written together by the next one.
+        self._cv = threading.Condition()
+        self._batch = _Batch()
+        self._flushing = False
+        self._apply_lock = threading.Lock()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._again = False
+        self.counters: Dict[str, int] = {
+            "received": 0, "fsyncs": 0, "applied": 0, "duplicates": 0, "stale": 0, "ignored": 0, "invalid": 0, "batches": 0, "writes": 0, "failures": 0,
+        }
+
+    @contextmanager
+    def _locked(self, name: str, lock: threading.Lock) -> Iterator[None]:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with (self.dir / name).open("a") as lf:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    def _write(self, lines: List[bytes]) -> None:
+        with self._locked("append.lock", self._append_lock):
+            with self.path.open("ab") as f:
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+        self.counters["fsyncs"] += 1
+
+    def append(self, eid: str, body: bytes) -> None:
+        # Blocking; the event is durable once this returns.
+        line = json.dumps({"id": eid, "at": time.time(), "body": body.decode("utf-8")}, ensure_ascii=False, separators=(",", ":"))
+        with self._cv:
+            batch = self._batch
+            batch.lines.append(line.encode("utf-8") + b"\n")
+            while not batch.done:
+                if self._flushing:
+                    self._cv.wait()
+                    continue
+                # Nobody is writing: this caller writes everything queued so far.
+                self._flushing = True
+                self._batch = _Batch()
+                self._cv.release()
+                try:
+                    self._write(batch.lines)
+                except Exception as e:
+                    batch.error = e
+                finally:
+                    self._cv.acquire()
+                    self._flushing = False
+                    batch.done = True
+                    self._cv.notify_all()
+            if batch.error is not None:
+                raise batch.error
+        self.counters["received"] += 1
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            state = json.loads(self.state_path.read_text("utf-8"))
+            if isinstance(state, dict):
+                return {"offset": int(state.get("offset") or 0), "seen": list(state.get("seen") or [])}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Webhook inbox state unreadable, starting over: {e}")
+        return {"offset": 0, "seen": []}
+
+    def _read(self, offset: int) -> Tuple[List[Tuple[int, bytes]], int]:
+        # Complete lines from `offset`, at most batch_size -> ([(seq, line)], new offset).
+        out: List[Tuple[int, bytes]] = []
+        try:
+            f = self.path.open("rb")
+        except FileNotFoundError:
+            return out, offset
+        with f:
+            f.seek(offset)
+            while len(out) < self.batch_size:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # end of log, or an append still in progress
+                out.append((offset, line))
+                offset += len(line)
+        return out, offset
+
+    def _apply_student(self, student_id: str, changes: List[Dict[str, Any]]) -> None:
+        def fold(current: Dict[str, Any]) -> Dict[str, Any]:
+            for ch in changes:
+                last = str(current.get("event_updated_at") or "")
+                if ch["event_updated_at"] and last and ch["event_updated_at"] < last:
+                    self.counters["stale"] += 1
+                    continue
+                fields = dict(ch)
+                del fields["student_id"]
+                if not fields["event_updated_at"]:
+                    del fields["event_updated_at"]
+                current.update(fields)
+                current["provider"] = "lemonsqueezy"
+                current["updated_at"] = datetime.utcnow().isoformat() + "Z"
+                self.counters["applied"] += 1
+            return current
+
+        rec = self.store.sub_update(student_id, fold)
+        self.counters["writes"] += 1
+        if self.on_applied is not None:
+            self.on_applied(student_id, rec)
+
+    def apply_pending(self) -> int:
+        # Applies one batch; -> number of log lines consumed.
+        with self._locked("apply.lock", self._apply_lock):
+            state = self._load_state()
+            lines, end = self._read(state["offset"])
+            if not lines:
+                self._maybe_rotate(state)
+                return 0
+            seen = set(state["seen"])
+            new_ids: List[str] = []
+            by_student: Dict[str, List[Tuple[str, int, Dict[str, Any]]]] = {}
+            for seq, raw in lines:
+                try:
+                    entry = json.loads(raw)
+                    eid = str(entry["id"])
+                    event = json.loads(entry["body"])
+                except Exception:
+                    self.counters["invalid"] += 1
+                    continue
+                if eid in seen:
+                    self.counters["duplicates"] += 1
+                    continue
+                seen.add(eid)
+                new_ids.append(eid)
+                change = parse_event(event) if isinstance(event, dict) else None
+                if change is None:
+                    self.counters["ignored"] += 1
+                    continue
+                by_student.setdefault(change["student_id"], []).append((change["event_updated_at"], seq, change))
+            for student_id, items in by_student.items():
+                items.sort(key=lambda t: (t[0], t[1]))
+                self._apply_student(student_id, [ch for _, _, ch in items])
+            state["offset"] = end
+            state["seen"] = (state["seen"] + new_ids)[-SEEN_IDS:]
+            _atomic_write(self.state_path, json.dumps(state, separators=(",", ":")).encode("utf-8"))
+            self.counters["batches"] += 1
+            return len(lines)
+
+    def _maybe_rotate(self, state: Dict[str, Any]) -> None:
+        # Caller holds the apply lock; appends are paused while the fully
+        # applied log is renamed aside.
+        if state["offset"] < ROTATE_BYTES:
+            return
+        with self._locked("append.lock", self._append_lock):
+            try:
+                if self.path.stat().st_size != state["offset"]:
+                    return
+            except FileNotFoundError:
+                return
+            self.path.replace(self.dir / f"inbox.{time.time_ns()}.jsonl")
+            state["offset"] = 0
+            _atomic_write(self.state_path, json.dumps(state, separators=(",", ":")).encode("utf-8"))
+        for old in sorted(self.dir.glob("inbox.*[0-9].jsonl"))[:-KEEP_SEGMENTS]:
+            try:
+                old.unlink()
+            except Exception:
+                pass
+
+    def drain(self) -> int:
+        consumed = 0
+        while True:
+            n = self.apply_pending()
+            if n == 0:
+                return consumed
+            consumed += n
+
+    def kick(self) -> None:
+        # Starts the background worker, or tells the running one to look again.
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        else:
+            self._again = True
+
+    async def _run(self) -> None:
+        await asyncio.sleep(BATCH_DELAY)
+        while True:
+            self._again = False
+            try:
+                n = await asyncio.to_thread(self.apply_pending)
+            except Exception as e:
+                # The batch stays in the log; the next kick (or restart) retries it.
+                print(f"Webhook inbox batch failed: {e}")
+                self.counters["failures"] += 1
+                return
+            if n == 0 and not self._again:
+                return
+
+    def pending_bytes(self) -> int:
+        try:
+            return max(0, self.path.stat().st_size - self._load_state()["offset"])
+        except FileNotFoundError:
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending_bytes": self.pending_bytes(), "worker_running": self._task is not None and not self._task.done(), **self.counters}
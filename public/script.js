@@ -133,13 +133,16 @@ function renderHistory(messagesEl, history) {
   });
 }
 
-async function streamChatReply(payload, onDelta) {
+async function readChatStream(payload, lastEventId, onEvent) {
+  // Resolves true once the server sends `done`, false if the connection
+  // ends before that. `onEvent(id, data)` sees every event.
   const token = getAuthToken();
   const response = await fetch(apiUrl("/api/chat/stream"), {
     method: "POST",
     headers: {
       "Content-Type": "application/json",
-      ...(token ? { Authorization: `Bearer ${token}` } : {})
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+      ...(lastEventId ? { "Last-Event-ID": lastEventId } : {})
     },
     body: JSON.stringify(payload)
   });
@@ -154,32 +157,92 @@ async function streamChatReply(payload, onDelta) {
 
   while (true) {
     const { value, done } = await reader.read();
-    if (done) break;
+    if (done) return false;
     buffer += decoder.decode(value, { stream: true });
 
     let boundary = buffer.indexOf("\n\n");
     while (boundary !== -1) {
-      const chunk = buffer.slice(0, boundary).trim();
+      const block = buffer.slice(0, boundary);
       buffer = buffer.slice(boundary + 2);
-      if (chunk.startsWith("data:")) {
-        const jsonText = chunk.replace(/^data:\s*/, "");
-        try {
-          const data = JSON.parse(jsonText);
-          if (data.delta) {
-            onDelta(String(data.delta));
-          }
-          if (data.error) {
-            throw new Error(data.error);
-          }
-          if (data.done) {
-            return;
-          }
-        } catch (error) {
+      boundary = buffer.indexOf("\n\n");
+      let id = "";
+      let jsonText = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("id:")) id = line.slice(3).trim();
+        else if (line.startsWith("data:")) jsonText += line.replace(/^data:\s*/, "");
+      }
+      if (!jsonText) continue;
+      const data = JSON.parse(jsonText);
+      onEvent(id, data);
+      if (data.done) return true;
+    }
+  }
+}
+
+function createReplyPlayer() {
+  // Plays the per-sentence audio of a streamed answer in order, each clip as
+  // soon as the one before it ends.
+  const queue = [];
+  let current = null;
+
+  function playNext() {
+    if (current || !queue.length) return;
+    current = new Audio(`data:audio/mpeg;base64,${queue.shift()}`);
+    const advance = () => {
+      current = null;
+      playNext();
+    };
+    current.addEventListener("ended", advance);
+    current.addEventListener("error", advance);
+    current.play().catch(advance);
+  }
+
+  return {
+    enqueue(event) {
+      queue.push(event.audio);
+      playNext();
+    },
+    stop() {
+      queue.length = 0;
+      if (current) {
+        current.pause();
+        current = null;
+      }
+    }
+  };
+}
+
+async function streamChatReply(payload, onDelta, onAudio, onRestart) {
+  // A dropped connection is resumed from the last event received, so the
+  // answer continues where it stopped instead of being generated again.
+  // If the server could not resume, it starts over and `onRestart` runs.
+  let lastEventId = "";
+  for (let attempt = 0; ; attempt++) {
+    let finished = false;
+    try {
+      finished = await readChatStream({ ...payload, resumable: true }, lastEventId, (id, data) => {
+        if (data.stream && !data.resumed && lastEventId && typeof onRestart === "function") {
+          onRestart();
+        }
+        if (id) lastEventId = id;
+        if (data.error) {
+          const error = new Error(data.error);
+          error.fromServer = true;
           throw error;
         }
-      }
-      boundary = buffer.indexOf("\n\n");
+        if (data.delta) {
+          onDelta(String(data.delta));
+        }
+        if (data.audio && typeof onAudio === "function") {
+          onAudio(data);
+        }
+      });
+    } catch (error) {
+      if (error.fromServer || !lastEventId || attempt >= 3) throw error;
     }
+    if (finished) return;
+    if (!lastEventId || attempt >= 3) throw new Error("Stream ended early");
+    await new Promise((resolve) => setTimeout(resolve, 500 * (attempt + 1)));
   }
 }
 
@@ -241,6 +304,45 @@ function initAdminReset() {
   });
 }
 
+const BADGE_PHOTO_VERSION_KEY = "botnology_badge_photo_version";
+
+async function uploadBadgePhoto(blob) {
+  const token = getAuthToken();
+  if (!token) return false;
+  try {
+    const form = new FormData();
+    form.append("photo", blob, "badge");
+    const data = await apiFetchJson("/api/photo/image", {
+      method: "POST",
+      headers: { Authorization: `Bearer ${token}` },
+      body: form
+    });
+    if (data?.version) localStorage.setItem(BADGE_PHOTO_VERSION_KEY, data.version);
+    return true;
+  } catch (error) {
+    console.warn("Failed to upload photo:", error);
+    return false;
+  }
+}
+
+async function loadBadgePhoto(imgEl) {
+  // The versioned URL is served as immutable, so repeat loads come from the
+  // browser cache; a stale version just revalidates with the ETag.
+  const token = getAuthToken();
+  if (!token || !imgEl) return;
+  const version = localStorage.getItem(BADGE_PHOTO_VERSION_KEY) || "";
+  const width = Math.ceil((imgEl.clientWidth || 60) * (window.devicePixelRatio || 1));
+  try {
+    const response = await fetch(apiUrl(`/api/photo/image?thumb=1&w=${width}${version ? `&v=${version}` : ""}`), {
+      headers: { Authorization: `Bearer ${token}` }
+    });
+    if (!response.ok) return;
+    imgEl.src = URL.createObjectURL(await response.blob());
+  } catch (error) {
+    // Keep the locally saved photo.
+  }
+}
+
 async function fetchCloudHistory() {
   const token = getAuthToken();
   if (!token) return [];
@@ -272,6 +374,29 @@ async function syncHistoryToCloud(history) {
   }
 }
 
+function newMessageId() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+async function appendHistoryToCloud(messages) {
+  const token = getAuthToken();
+  if (!token) return false;
+  try {
+    await apiFetchJson("/api/history/append", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${token}`
+      },
+      body: JSON.stringify({ messages })
+    });
+    return true;
+  } catch (error) {
+    return false;
+  }
+}
+
 async function initProfileUI() {
   const planBadge = document.getElementById("planBadge");
   const whoami = document.getElementById("whoami");
@@ -363,6 +488,27 @@ function initChat() {
   let history = loadChatHistory();
   renderHistory(messagesEl, history);
 
+  // "Voice" reads answers aloud with audio the server synthesizes sentence by
+  // sentence while the answer streams.
+  let speakReplies = localStorage.getItem("botnology_speak_replies") === "true";
+  const player = createReplyPlayer();
+  const speakBtn = document.createElement("button");
+  speakBtn.type = "button";
+  speakBtn.className = "btn";
+  speakBtn.style.flex = "0 0 auto";
+  const renderSpeakBtn = () => {
+    speakBtn.textContent = speakReplies ? "Voice: ON" : "Voice: OFF";
+    speakBtn.setAttribute("aria-pressed", String(speakReplies));
+  };
+  renderSpeakBtn();
+  speakBtn.addEventListener("click", () => {
+    speakReplies = !speakReplies;
+    localStorage.setItem("botnology_speak_replies", String(speakReplies));
+    if (!speakReplies) player.stop();
+    renderSpeakBtn();
+  });
+  sendBtn.parentNode.insertBefore(speakBtn, sendBtn);
+
   if (subjectSelect && subjectLabel) {
     subjectLabel.textContent = subjectSelect.value || "General";
     subjectSelect.addEventListener("change", () => {
@@ -397,8 +543,10 @@ function initChat() {
     }
 
     inputEl.value = "";
+    player.stop();
     appendMessage(messagesEl, "user", text);
-    history.push({ role: "user", content: text });
+    const userMessage = { role: "user", content: text, id: newMessageId() };
+    history.push(userMessage);
     saveChatHistory(history);
 
     if (isFree) {
@@ -420,12 +568,20 @@ function initChat() {
 
     try {
       await streamChatReply(
-        { message: text, history, subject, plan },
+        { message: text, history, subject, plan, speak: speakReplies },
         (delta) => {
           assistantText += delta;
           assistantBubble.textContent = assistantText;
           assistantBubble.appendChild(typingIndicator);
           messagesEl.scrollTop = messagesEl.scrollHeight;
+        },
+        (event) => {
+          if (speakReplies) player.enqueue(event);
+        },
+        () => {
+          // The answer starts over, audio included.
+          assistantText = "";
+          player.stop();
         }
       );
 
@@ -451,10 +607,11 @@ function initChat() {
 
     typingIndicator.remove();
     if (assistantText.trim()) {
-      history.push({ role: "assistant", content: assistantText });
+      const assistantMessage = { role: "assistant", content: assistantText, id: newMessageId() };
+      history.push(assistantMessage);
       saveChatHistory(history);
       if (getSyncEnabled()) {
-        await syncHistoryToCloud(history);
+        await appendHistoryToCloud([userMessage, assistantMessage]);
       }
     }
   }
@@ -927,6 +1084,11 @@ function initBadgeModal() {
           console.warn("Failed to save photo to localStorage:", e);
         }
 
+        // Upload the raw image so other devices get it too
+        canvas.toBlob((blob) => {
+          if (blob) uploadBadgePhoto(blob);
+        }, `image/${format}`, quality);
+
         // Close modal
         badgeModal.style.display = "none";
         alert("✅ Badge photo updated!");
@@ -948,6 +1110,7 @@ function initBadgeModal() {
   } catch (e) {
     console.warn("Failed to load saved photo:", e);
   }
+  loadBadgePhoto(badgePhoto);
 
   // Initialize export preview
   updateExportPreview();
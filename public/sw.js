@@ -1,11 +1,12 @@
-const CACHE = "bn-cache-v2"; // Updated cache version
+// scripts/build_assets.py regenerates CACHE and ASSETS with fingerprinted URLs in dist/sw.js.
+const CACHE = "bn-cache-v2";
 const ASSETS = [
   "/",
   "/index.html",
   "/pricing.html",
   "/dashboard.html",
-  "/style.css?v=2", // Cache-busted
-  "/script.js?v=2", // Cache-busted
+  "/style.css",
+  "/script.js",
   "/dr-botonic.jpeg",
   "/manifest.json"
 ];
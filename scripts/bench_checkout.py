@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Checkout creation against a local HTTPS stand-in for the Lemon Squeezy API,
+# comparing a new httpx client per checkout (a TCP+TLS handshake every time)
+# with the shared keep-alive pool in api/outbound.py, then running checkouts
+# end to end through /api/lemonsqueezy/create-checkout. Reports latency per
+# checkout and how many connections the stand-in saw.
+#
+# Needs the openssl CLI for the stand-in's self-signed certificate; without it
+# the stand-in runs plain HTTP and only the TCP handshake is saved.
+#
+#   python scripts/bench_checkout.py --checkouts 200 --concurrency 10
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+def _standin(latency: float) -> Tuple[FastAPI, Set[Tuple[str, int]]]:
+    app = FastAPI()
+    conns: Set[Tuple[str, int]] = set()
+
+    @app.post("/v1/checkouts")
+    async def checkouts(req: Request) -> Dict[str, Any]:
+        conns.add(tuple(req.scope["client"]))
+        await req.body()
+        if latency:
+            await asyncio.sleep(latency)
+        return {"data": {"type": "checkouts", "id": "bench", "attributes": {"url": "https://checkout.example/bench"}}}
+
+    return app, conns
+
+def _certificate(tmp: Path) -> Optional[Tuple[str, str]]:
+    if shutil.which("openssl") is None:
+        return None
+    key, cert = tmp / "key.pem", tmp / "cert.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True,
+    )
+    return str(key), str(cert)
+
+async def _wait_ready(url: str, verify: Any = True, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(verify=verify) as c:
+        while time.monotonic() < deadline:
+            try:
+                r = await c.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+async def _timed(n: int, concurrency: int, call) -> Tuple[List[float], float]:
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - t0)
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    return latencies, time.perf_counter() - t_start
+
+def _report(name: str, latencies: List[float], elapsed: float, conns: int) -> None:
+    print(f"  {name:<26} mean {statistics.mean(latencies) * 1000:6.2f} ms  p50 {_pct(latencies, 50) * 1000:6.2f} ms  "
+          f"p99 {_pct(latencies, 99) * 1000:6.2f} ms  {len(latencies) / elapsed:6.0f}/s  {conns:4d} connections")
+
+async def _run(args: argparse.Namespace) -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="bench-checkout-"))
+    cert = _certificate(tmp)
+    scheme = "https" if cert else "http"
+    if cert:
+        # httpx (and so the app's pools) trust the stand-in through SSL_CERT_FILE.
+        os.environ["SSL_CERT_FILE"] = cert[1]
+    standin_app, conns = _standin(args.latency)
+    standin = uvicorn.Server(uvicorn.Config(
+        standin_app, host="127.0.0.1", port=args.standin_port, log_level="warning",
+        ssl_keyfile=cert[0] if cert else None, ssl_certfile=cert[1] if cert else None,
+    ))
+    standin_task = asyncio.create_task(standin.serve())
+    api_base = f"{scheme}://127.0.0.1:{args.standin_port}/v1"
+    app_proc = None
+    try:
+        await _wait_ready(f"{api_base}/checkouts", verify=cert[1] if cert else True)
+        from api import outbound
+
+        payload = {"data": {"type": "checkouts", "attributes": {"checkout_data": {"custom": {"student_id": "BN-BENCH"}}}}}
+        headers = {"Authorization": "Bearer bench", "Accept": "application/vnd.api+json", "Content-Type": "application/vnd.api+json"}
+        print(f"{args.checkouts} checkouts, {args.concurrency} in flight, stand-in over {scheme.upper()}")
+
+        async def per_call() -> None:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                (await client.post(f"{api_base}/checkouts", headers=headers, json=payload)).raise_for_status()
+
+        async def pooled() -> None:
+            (await outbound.request("lemonsqueezy", "POST", f"{api_base}/checkouts", headers=headers, json=payload)).raise_for_status()
+
+        results = {}
+        for name, call in (("new client per checkout", per_call), ("shared pool", pooled)):
+            conns.clear()
+            latencies, elapsed = await _timed(args.checkouts, args.concurrency, call)
+            _report(name, latencies, elapsed, len(conns))
+            results[name] = statistics.mean(latencies)
+        await outbound.aclose()
+        saved = results["new client per checkout"] - results["shared pool"]
+        print(f"  handshake savings per checkout: {saved * 1000:.2f} ms")
+
+        env = dict(os.environ)
+        env.update({
+            "LEMON_SQUEEZY_API_KEY": "bench",
+            "LEMON_SQUEEZY_API_BASE": api_base,
+            "LEMON_SQUEEZY_VARIANT_MASTERS_MONTHLY": "1",
+            "PYTHONPATH": str(ROOT),
+        })
+        app_proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+            cwd=str(ROOT), env=env,
+        )
+        base = f"http://127.0.0.1:{args.port}"
+        await _wait_ready(f"{base}/api/health")
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base, timeout=60.0, limits=limits) as c:
+            async def through_app() -> None:
+                r = await c.post("/api/lemonsqueezy/create-checkout", json={"plan": "masters", "cadence": "monthly", "student_id": "BN-BENCH"})
+                r.raise_for_status()
+
+            conns.clear()
+            latencies, elapsed = await _timed(args.checkouts, args.concurrency, through_app)
+            _report("app endpoint", latencies, elapsed, len(conns))
+            print(f"  outbound stats: {(await c.get('/api/health')).json()['outbound']['services'].get('lemonsqueezy')}")
+        return 0
+    finally:
+        if app_proc is not None:
+            app_proc.terminate()
+            app_proc.wait(timeout=10)
+        standin.should_exit = True
+        await standin_task
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Checkout creation with and without a shared connection pool.")
+    ap.add_argument("--checkouts", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--latency", type=float, default=0.0, help="stand-in processing time per checkout (seconds)")
+    ap.add_argument("--port", type=int, default=3051)
+    ap.add_argument("--standin-port", type=int, default=3098)
+    return asyncio.run(_run(ap.parse_args()))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Compares the legacy full-rewrite history sync with the append-only log at a
+# large history size: bytes moved per new message and per-call latency.
+#
+#   python scripts/bench_history.py --messages 10000 --rounds 200
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.history_store import HistoryStore
+
+def _msg(i: int) -> Dict[str, Any]:
+    role = "user" if i % 2 == 0 else "assistant"
+    return {"role": role, "content": f"Message {i}: " + "photosynthesis converts light into chemical energy. " * 3, "id": f"m{i}"}
+
+def _legacy_post(fp: Path, items: List[Dict[str, Any]]) -> int:
+    # Body of the old POST /api/history handler.
+    cleaned = [
+        {"role": m.get("role"), "content": str(m.get("content", ""))}
+        for m in items
+        if isinstance(m, dict) and m.get("role") in ("user", "assistant")
+    ]
+    out = json.dumps(cleaned[-200:], ensure_ascii=False, separators=(",", ":"))
+    fp.write_text(out, "utf-8")
+    return len(out.encode("utf-8"))
+
+def _legacy_get(fp: Path) -> int:
+    data = json.loads(fp.read_text("utf-8"))
+    cleaned = [{"role": m.get("role"), "content": str(m.get("content", ""))} for m in data if isinstance(m, dict)]
+    return len(json.dumps({"history": cleaned[-200:]}).encode("utf-8"))
+
+def _ms(samples: List[float]) -> str:
+    ordered = sorted(samples)
+    return f"p50 {ordered[len(ordered) // 2] * 1000:.2f} ms, p99 {ordered[int(len(ordered) * 0.99) - 1] * 1000:.2f} ms"
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Full-rewrite vs append-only history benchmark.")
+    ap.add_argument("--messages", type=int, default=10000)
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args()
+
+    history = [_msg(i) for i in range(args.messages)]
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+
+        legacy_fp = root / "legacy.json"
+        up_bytes = down_bytes = disk_bytes = 0
+        post_t: List[float] = []
+        get_t: List[float] = []
+        items = list(history)
+        for r in range(args.rounds):
+            items.append(_msg(args.messages + r))
+            body = json.dumps({"history": items}).encode("utf-8")
+            t0 = time.perf_counter()
+            disk_bytes += _legacy_post(legacy_fp, json.loads(body)["history"])
+            post_t.append(time.perf_counter() - t0)
+            up_bytes += len(body)
+            t0 = time.perf_counter()
+            down_bytes += _legacy_get(legacy_fp)
+            get_t.append(time.perf_counter() - t0)
+        print(f"full rewrite  : upload {up_bytes / args.rounds / 1024:.1f} KiB/msg, download {down_bytes / args.rounds / 1024:.1f} KiB/msg, disk {disk_bytes / args.rounds / 1024:.1f} KiB/msg")
+        print(f"                POST {_ms(post_t)}; GET {_ms(get_t)}")
+
+        store = HistoryStore(root / "log", max_messages=args.messages * 2)
+        store.append("bench", history)
+        _, cursor, _ = store.read("bench", limit=1)
+        up_bytes = down_bytes = 0
+        post_t, get_t = [], []
+        for r in range(args.rounds):
+            body = json.dumps({"messages": [_msg(args.messages + r)]}).encode("utf-8")
+            t0 = time.perf_counter()
+            store.append("bench", json.loads(body)["messages"])
+            post_t.append(time.perf_counter() - t0)
+            up_bytes += len(body)
+            t0 = time.perf_counter()
+            page, cursor, _ = store.read("bench", since=cursor)
+            down_bytes += len(json.dumps({"history": page, "cursor": cursor}).encode("utf-8"))
+            get_t.append(time.perf_counter() - t0)
+        print(f"append + since: upload {up_bytes / args.rounds / 1024:.2f} KiB/msg, download {down_bytes / args.rounds / 1024:.2f} KiB/msg, disk ~{up_bytes / args.rounds / 1024:.2f} KiB/msg")
+        print(f"                append {_ms(post_t)}; GET since {_ms(get_t)}")
+        print(f"(history size {args.messages} messages; the legacy path also truncates storage to 200)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
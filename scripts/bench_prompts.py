@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Per-request cost of chat prompt assembly, old inline builder against
+# api/prompts.py. tests/test_prompts.py checks that both chat endpoints send
+# the upstream byte-identical messages with a stable prefix.
+#
+#   python scripts/bench_prompts.py --turns 40 --iterations 20000
+import argparse
+import asyncio
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api import cache
+from api import context_pack
+from api import prompts
+
+def _old_build(msg: str, hist: Any, subject: str) -> List[Dict[str, Any]]:
+    # The builder as it was inlined in both endpoints.
+    sys_prompt = (
+        "You are Dr. Botnotic, a 72-year-old sophisticated Harvard graduate yeti professor. "
+        "You speak calm, soft English with a deep London accent. "
+        "You are the smartest AI tutor in the industry. "
+        "Be concise yet deeply insightful, use earthy, scholarly tone, and optionally a tasteful gentle joke. "
+        "Adapt depth to the student's plan: Associates = foundational guidance, Bachelors = deeper explanations and structured steps, Masters = elite coaching with advanced insights, references, and study strategies. "
+        "Subject: " + subject
+    )
+    messages: List[Dict[str, Any]] = [{"role": "system", "content": sys_prompt}]
+    if isinstance(hist, list):
+        for m in hist[-16:]:
+            if isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str):
+                messages.append({"role": m["role"], "content": m["content"]})
+    messages.append({"role": "user", "content": msg})
+    return messages
+
+def _history(turns: int) -> List[Dict[str, str]]:
+    hist = []
+    for i in range(turns):
+        hist.append({"role": "user", "content": f"Question {i}: how does step {i} of the proof follow from the lemma?"})
+        hist.append({"role": "assistant", "content": f"Step {i} follows because " + "the bound holds term by term; " * 6})
+    return hist
+
+def _bench(args: argparse.Namespace) -> None:
+    hist = _history(args.turns)
+    packer = context_pack.ContextPacker(lambda m: asyncio.sleep(0, ""), cache.ResponseCache("bench", enabled=False))
+
+    async def packed(n: int) -> None:
+        for _ in range(n):
+            turns = await packer.pack(hist, "bachelors", None, summarize=False)
+            prompts.build("bachelors", "Calculus", "next?", turns)
+
+    def sync(fn):
+        def run(n: int) -> None:
+            for _ in range(n):
+                fn()
+        return run
+
+    cases = [
+        ("old inline builder", sync(lambda: _old_build("next?", hist, "Calculus"))),
+        ("prompts.build, last 16", sync(lambda: prompts.build("bachelors", "Calculus", "next?", context_pack.clean_history(hist, 16)))),
+        ("pack to budget + build", lambda n: asyncio.run(packed(n))),
+    ]
+    print(f"{args.turns * 2} history messages, {args.iterations} iterations")
+    for name, fn in cases:
+        best = min(timeit.repeat(lambda: fn(args.iterations), number=1, repeat=3)) / args.iterations
+        print(f"  {name:<24} {best * 1e6:8.1f} us/request")
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Chat prompt assembly cost.")
+    ap.add_argument("--turns", type=int, default=40, help="user/assistant pairs in the history")
+    ap.add_argument("--iterations", type=int, default=20000)
+    args = ap.parse_args()
+    _bench(args)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
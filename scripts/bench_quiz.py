@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Quiz latency with and without the quiz bank, against a local fake OpenAI
+# server. First a round of live generations (Cache-Control: no-cache, which
+# skips the bank), blocking and then streamed through
+# /api/quiz/generate/stream, where the time to the first question is what the
+# student waits for. The fake upstream puts one malformed line in each
+# streamed answer, which has to be dropped. Then the app prefills a few catalog pools in the background
+# and signed-in students take several quizzes each from them. Reports latency
+# per quiz and checks that no student saw a question twice before working
+# through its pool. Exits 1 if one did, or if a banked quiz came back short.
+#
+# The bank lives in a temporary directory so data/ is not touched.
+#
+#   python scripts/bench_quiz.py --students 20 --quizzes 3
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+import httpx
+import uvicorn
+
+from fake_openai import build_app
+
+ROOT = Path(__file__).resolve().parents[1]
+TOPICS = ("Anatomy", "Physics")
+LEVEL = "associates"
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+async def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                r = await c.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+def _report(name: str, latencies: List[float]) -> None:
+    print(f"  {name:<12} mean {statistics.mean(latencies) * 1000:8.1f} ms  p50 {_pct(latencies, 50) * 1000:8.1f} ms  p99 {_pct(latencies, 99) * 1000:8.1f} ms")
+
+async def _run(args: argparse.Namespace) -> int:
+    fake = uvicorn.Server(uvicorn.Config(
+        build_app(args.latency, args.tokens, args.token_delay),
+        host="127.0.0.1", port=args.fake_port, log_level="warning",
+    ))
+    fake_task = asyncio.create_task(fake.serve())
+    tmp = tempfile.mkdtemp(prefix="bench-quiz-")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+        "ADMISSION_ENABLED": "0",
+        "QUIZ_BANK_DIR": str(Path(tmp) / "quiz_bank"),
+        "QUIZ_BANK_TARGET": str(args.target),
+        "QUIZ_BANK_TOPICS": ",".join(TOPICS),
+        "QUIZ_BANK_LEVELS": LEVEL,
+        "PYTHONPATH": str(ROOT),
+    })
+    env.pop("VERCEL", None)
+    app_proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        await _wait_ready(f"http://127.0.0.1:{args.fake_port}/_stats")
+        await _wait_ready(f"{base}/api/health")
+        short = 0
+        async with httpx.AsyncClient(base_url=base, timeout=120.0) as c:
+            print(f"upstream: {args.latency:.2f}s to first token, {args.token_delay * 1000:.0f} ms per token")
+            live: List[float] = []
+            for i in range(args.live):
+                t0 = time.perf_counter()
+                r = await c.post("/api/quiz/generate", json={"topic": f"Bench topic {i}", "level": LEVEL}, headers={"Cache-Control": "no-cache"})
+                live.append(time.perf_counter() - t0)
+                r.raise_for_status()
+            _report("live", live)
+
+            first: List[float] = []
+            total: List[float] = []
+            dropped = 0
+            for i in range(args.live):
+                t0 = time.perf_counter()
+                got = 0
+                async with c.stream(
+                    "POST", "/api/quiz/generate/stream", json={"topic": f"Bench stream topic {i}", "level": LEVEL},
+                    headers={"Cache-Control": "no-cache", "Accept": "application/x-ndjson"},
+                ) as r:
+                    async for line in r.aiter_lines():
+                        if not line.strip():
+                            continue
+                        ev = json.loads(line)
+                        if "question" in ev:
+                            got += 1
+                            if got == 1:
+                                first.append(time.perf_counter() - t0)
+                        elif ev.get("done"):
+                            dropped += ev.get("dropped") or 0
+                total.append(time.perf_counter() - t0)
+                if got != 5:
+                    short += 1
+            _report("stream 1st", first)
+            _report("stream all", total)
+            print(f"  first/total  {statistics.mean(first) / statistics.mean(total):.2f} ({dropped} malformed lines dropped)")
+
+            t_start = time.perf_counter()
+            while True:
+                bank: Dict[str, Any] = (await c.get("/api/health")).json()["quiz_bank"]
+                if not bank["queued"] and not bank["worker_running"] and bank["low"] == 0:
+                    break
+                if time.perf_counter() - t_start > 300:
+                    print("  prefill did not finish within 300s")
+                    return 1
+                await asyncio.sleep(0.1)
+            print(f"  prefill      {bank['pools']} pools, {bank['questions']} questions in {time.perf_counter() - t_start:.1f}s (background)")
+
+            banked: List[float] = []
+            repeats = 0
+
+            async def student(s: int) -> None:
+                nonlocal repeats, short
+                tok = (await c.post("/api/auth", json={"email": "bench@example.com", "student_id": f"BN-QUIZ-{s}"})).json()["token"]
+                seen: Dict[str, Set[str]] = {t: set() for t in TOPICS}
+                for q in range(args.quizzes):
+                    topic = TOPICS[(s + q) % len(TOPICS)]
+                    t0 = time.perf_counter()
+                    r = await c.post("/api/quiz/generate", json={"topic": topic, "level": LEVEL}, headers={"Authorization": f"Bearer {tok}"})
+                    banked.append(time.perf_counter() - t0)
+                    data = r.json()
+                    questions = [it["q"] for it in data.get("questions") or []]
+                    if len(questions) != 5 or not data.get("bank"):
+                        short += 1
+                    # A pool of `target` questions holds target // 5 repeat-free quizzes.
+                    if len(seen[topic]) + len(questions) <= args.target:
+                        repeats += len(seen[topic] & set(questions))
+                    seen[topic].update(questions)
+
+            await asyncio.gather(*(student(s) for s in range(args.students)))
+            _report("bank", banked)
+            print(f"  speedup      {statistics.mean(live) / statistics.mean(banked):.0f}x mean")
+            bank = (await c.get("/api/health")).json()["quiz_bank"]
+            print(f"  quizzes      {len(banked)}, {short} short or not from the bank, {repeats} repeated questions before a pool was used up")
+            print(f"  bank         served {bank['served']}, misses {bank['misses']}, refills {bank['refills']} ({bank['generated']} questions kept after repair and validation)")
+        return 0 if repeats == 0 and short == 0 else 1
+    finally:
+        app_proc.terminate()
+        app_proc.wait(timeout=10)
+        fake.should_exit = True
+        await fake_task
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Quiz latency with and without the quiz bank.")
+    ap.add_argument("--students", type=int, default=20)
+    ap.add_argument("--quizzes", type=int, default=3, help="quizzes per student")
+    ap.add_argument("--live", type=int, default=5, help="live generations to time")
+    ap.add_argument("--target", type=int, default=20, help="QUIZ_BANK_TARGET")
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--tokens", type=int, default=40, help="answer length (fake answers are tokens/2 words)")
+    ap.add_argument("--token-delay", type=float, default=0.005)
+    ap.add_argument("--port", type=int, default=3051)
+    ap.add_argument("--fake-port", type=int, default=3099)
+    return asyncio.run(_run(ap.parse_args()))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
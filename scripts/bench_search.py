@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# Query latency of the per-student BM25 index on a synthetic corpus with a
+# Zipf-distributed vocabulary (a few very common words, a long tail).
+#
+#   python scripts/bench_search.py --docs 30000 --queries 2000
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.search_index import StudentIndex
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="BM25 index build and query latency.")
+    ap.add_argument("--docs", type=int, default=30000)
+    ap.add_argument("--words", type=int, default=60, help="words per document")
+    ap.add_argument("--vocab", type=int, default=20000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    vocab = [f"w{i}x" for i in range(args.vocab)]
+    cum = list(itertools.accumulate(1.0 / (i + 1) for i in range(args.vocab)))
+
+    def words(n):
+        return rnd.choices(vocab, cum_weights=cum, k=n)
+
+    idx = StudentIndex()
+    t0 = time.perf_counter()
+    for d in range(args.docs):
+        source = "file" if d % 3 else "history"
+        idx.add(source, d, " ".join(words(args.words)))
+    build = time.perf_counter() - t0
+
+    lat = []
+    for _ in range(args.queries):
+        q = " ".join(words(rnd.randint(2, 5)))
+        t0 = time.perf_counter()
+        idx.search(q, 5)
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    print(f"docs {args.docs}, terms {len(idx.postings)}, build {build:.2f}s ({args.docs / build:.0f} docs/s)")
+    print(f"query ms: mean {statistics.mean(lat):.2f}  p50 {_pct(lat, 0.5):.2f}  p95 {_pct(lat, 0.95):.2f}  p99 {_pct(lat, 0.99):.2f}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
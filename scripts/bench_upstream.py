@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Fires N concurrent /api/chat requests at the app while it talks to a local
+# fake OpenAI server, and reports requests/second and latency percentiles.
+#
+#   python scripts/bench_upstream.py --concurrency 50 --requests 200
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+import uvicorn
+
+from fake_openai import build_app
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+async def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                r = await c.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+async def _run(args: argparse.Namespace) -> int:
+    fake = uvicorn.Server(uvicorn.Config(
+        build_app(args.latency, args.tokens, 0.0),
+        host="127.0.0.1", port=args.fake_port, log_level="warning",
+    ))
+    fake_task = asyncio.create_task(fake.serve())
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+        "OPENAI_MAX_CONCURRENCY": str(args.upstream_limit),
+        # Every request comes from one anonymous client; measure the upstream path, not its rate limit.
+        "ADMISSION_ENABLED": "0",
+        # Keep quiz bank refills out of the measured upstream traffic.
+        "QUIZ_BANK_PREFILL": "0",
+        "QUIZ_BANK_REFILL": "0",
+        "PYTHONPATH": str(ROOT),
+    })
+    app_proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        await _wait_ready(f"http://127.0.0.1:{args.fake_port}/_stats")
+        await _wait_ready(f"{base}/api/health")
+
+        latencies: List[float] = []
+        errors = 0
+        sem = asyncio.Semaphore(args.concurrency)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+        async with httpx.AsyncClient(base_url=base, timeout=120.0, limits=limits) as c:
+            async def one(i: int) -> None:
+                nonlocal errors
+                async with sem:
+                    t0 = time.perf_counter()
+                    r = await c.post("/api/chat", json={"message": f"question {i}", "subject": "Bench"})
+                    latencies.append(time.perf_counter() - t0)
+                    if r.status_code != 200 or "error" in r.json():
+                        errors += 1
+
+            t_start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - t_start
+
+        print(f"requests      : {args.requests} ({args.concurrency} in flight, upstream latency {args.latency:.2f}s)")
+        print(f"errors        : {errors}")
+        print(f"throughput    : {args.requests / elapsed:.1f} req/s")
+        print(f"latency p50   : {_pct(latencies, 50) * 1000:.0f} ms")
+        print(f"latency p99   : {_pct(latencies, 99) * 1000:.0f} ms")
+        return 0 if errors == 0 else 1
+    finally:
+        app_proc.terminate()
+        app_proc.wait(timeout=10)
+        fake.should_exit = True
+        await fake_task
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark /api/chat against a fake OpenAI upstream.")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--tokens", type=int, default=40)
+    ap.add_argument("--upstream-limit", type=int, default=64)
+    ap.add_argument("--port", type=int, default=3051)
+    ap.add_argument("--fake-port", type=int, default=3099)
+    return asyncio.run(_run(ap.parse_args()))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# Fires a burst of locally signed Lemon Squeezy webhooks at the app, several
+# events per subscription, shuffled (out of order) and with replayed
+# duplicates, once with the inbox drained inside each request
+# (WEBHOOK_ASYNC=0) and once with the background worker. Reports handler
+# latency, how long until every event is applied, and checks that each
+# subscription ends up reflecting its newest event. Exits 1 if one does not.
+#
+# Uses the SQLite backend in a temporary directory so data/ is not touched.
+#
+#   python scripts/bench_webhooks.py --subscriptions 200 --events 5 --duplicates 0.2
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+SECRET = "whsec-bench"
+FINAL = ("subscription_updated", "subscription_cancelled", "subscription_payment_failed", "subscription_resumed")
+STATUS = {"subscription_cancelled": "cancelled", "subscription_payment_failed": "past_due"}
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+async def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                r = await c.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+def _events(args: argparse.Namespace) -> Tuple[List[bytes], Dict[str, str]]:
+    # -> shuffled signed bodies, and student id -> status its newest event implies.
+    rnd = random.Random(args.seed)
+    bodies: List[bytes] = []
+    expected: Dict[str, str] = {}
+    for s in range(args.subscriptions):
+        student = f"BN-BENCH-{s}"
+        for e in range(args.events):
+            name = "subscription_created" if e == 0 else rnd.choice(FINAL)
+            event = {
+                "meta": {"event_name": name, "custom_data": {"student_id": student, "plan": "masters", "cadence": "monthly"}},
+                "data": {"type": "subscriptions", "id": str(1000 + s), "attributes": {
+                    "subscription_id": 1000 + s, "order_id": 5000 + s, "updated_at": f"2026-01-01T00:{e // 60:02d}:{e % 60:02d}.000000Z",
+                }},
+            }
+            bodies.append(json.dumps(event).encode("utf-8"))
+            expected[student] = STATUS.get(name, "active")
+    bodies += rnd.sample(bodies, int(len(bodies) * args.duplicates))
+    rnd.shuffle(bodies)
+    return bodies, expected
+
+async def _phase(args: argparse.Namespace, asynchronous: bool, bodies: List[bytes], expected: Dict[str, str]) -> bool:
+    tmp = tempfile.mkdtemp(prefix="bench-webhooks-")
+    env = dict(os.environ)
+    env.update({
+        "LEMON_SQUEEZY_WEBHOOK_SECRET": SECRET,
+        "DATA_BACKEND": "sqlite",
+        "SQLITE_PATH": str(Path(tmp) / "bench.db"),
+        "WEBHOOK_INBOX_DIR": str(Path(tmp) / "webhooks"),
+        "WEBHOOK_ASYNC": "1" if asynchronous else "0",
+        "PYTHONPATH": str(ROOT),
+    })
+    env.pop("VERCEL", None)
+    app_proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        await _wait_ready(f"{base}/api/health")
+        latencies: List[float] = []
+        errors = 0
+        sem = asyncio.Semaphore(args.concurrency)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base, timeout=120.0, limits=limits) as c:
+            async def one(body: bytes) -> None:
+                nonlocal errors
+                sig = hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+                async with sem:
+                    t0 = time.perf_counter()
+                    r = await c.post("/api/lemonsqueezy/webhook", content=body, headers={"X-Signature": sig, "Content-Type": "application/json"})
+                    latencies.append(time.perf_counter() - t0)
+                    if r.status_code != 200:
+                        errors += 1
+
+            t_start = time.perf_counter()
+            await asyncio.gather(*(one(b) for b in bodies))
+            accepted = time.perf_counter() - t_start
+            while True:
+                hooks: Dict[str, Any] = (await c.get("/api/health")).json()["webhooks"]
+                if hooks["pending_bytes"] == 0 and not hooks["worker_running"]:
+                    break
+                await asyncio.sleep(0.02)
+            applied = time.perf_counter() - t_start
+
+            wrong = 0
+            for student, status in expected.items():
+                tok = (await c.post("/api/auth", json={"email": "bench@example.com", "student_id": student})).json()["token"]
+                sub = (await c.get("/api/subscription", headers={"Authorization": f"Bearer {tok}"})).json()
+                if (sub or {}).get("status") != status:
+                    wrong += 1
+
+        print(f"  accepted      : {len(bodies)} in {accepted:.2f}s ({len(bodies) / accepted:.0f}/s), {errors} errors")
+        print(f"  handler p50   : {_pct(latencies, 50) * 1000:.1f} ms   p99: {_pct(latencies, 99) * 1000:.1f} ms")
+        print(f"  all applied   : {applied:.2f}s after the first event")
+        print(f"  inbox         : applied {hooks['applied']}, duplicates {hooks['duplicates']}, stale {hooks['stale']}, batches {hooks['batches']}, record writes {hooks['writes']}")
+        print(f"  final state   : {len(expected) - wrong}/{len(expected)} subscriptions match their newest event")
+        return wrong == 0 and errors == 0
+    finally:
+        app_proc.terminate()
+        app_proc.wait(timeout=10)
+
+async def _run(args: argparse.Namespace) -> int:
+    bodies, expected = _events(args)
+    print(f"{len(bodies)} webhooks for {args.subscriptions} subscriptions ({args.events} events each, {args.duplicates:.0%} replayed), {args.concurrency} in flight")
+    ok = True
+    for asynchronous in (False, True):
+        print(f"\n{'background worker' if asynchronous else 'drained in the request'} (WEBHOOK_ASYNC={int(asynchronous)}):")
+        ok = await _phase(args, asynchronous, bodies, expected) and ok
+    return 0 if ok else 1
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Burst benchmark for the Lemon Squeezy webhook inbox.")
+    ap.add_argument("--subscriptions", type=int, default=200)
+    ap.add_argument("--events", type=int, default=5, help="events per subscription")
+    ap.add_argument("--duplicates", type=float, default=0.2, help="fraction of events delivered twice")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--port", type=int, default=3051)
+    return asyncio.run(_run(ap.parse_args()))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Builds dist/ from public/: content-hashed copies of static assets, HTML and
+# CSS rewritten to point at them, gzip/brotli variants for text files, a
+# service-worker precache list, and dist/asset-manifest.json for the server.
+#
+#   python scripts/build_assets.py [--public public] [--out dist]
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import re
+import shutil
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api import images
+
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+# Served under fixed, well-known URLs, so never fingerprinted.
+FIXED_NAMES = {"sw.js", "manifest.json", "favicon.ico", "robots.txt"}
+COMPRESSIBLE = {".html", ".css", ".js", ".json", ".svg", ".txt", ".xml", ".map"}
+RESIZABLE = {".jpg", ".jpeg", ".png"}
+# Hand-maintained cache-busting suffixes like ?v=2 are dropped on rewrite;
+# ?w= image width hints are kept.
+REF_RE = re.compile(r'''(?P<attr>(?:src|href)=["']|url\(\s*["']?)(?P<path>/[^"')?#\s]+)(?P<query>\?[^"')#\s]*)?''')
+SW_ASSETS_RE = re.compile(r"const ASSETS = \[.*?\];", re.S)
+SW_CACHE_RE = re.compile(r'const CACHE = "[^"]*";[^\n]*')
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _url(rel: Path) -> str:
+    return "/" + rel.as_posix()
+
+def _hashed_name(rel: Path, digest: str) -> Path:
+    return rel.with_name(f"{rel.stem}.{digest[:10]}{rel.suffix}")
+
+def _rewrite_refs(text: str, mapping: Dict[str, str]) -> str:
+    def sub(m: "re.Match[str]") -> str:
+        target = mapping.get(m.group("path"))
+        if target is None:
+            return m.group(0)
+        query = m.group("query") or ""
+        return m.group("attr") + target + (query if query.startswith("?w=") else "")
+    return REF_RE.sub(sub, text)
+
+def _write_variants(fp: Path, data: bytes) -> list:
+    encodings = []
+    if fp.suffix.lower() not in COMPRESSIBLE or len(data) < 256:
+        return encodings
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            fp.with_name(fp.name + ".br").write_bytes(br)
+            encodings.append("br")
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        fp.with_name(fp.name + ".gz").write_bytes(gz)
+        encodings.append("gzip")
+    return encodings
+
+def main() -> int:
+    root = Path(__file__).resolve().parents[1]
+    ap = argparse.ArgumentParser(description="Fingerprint and precompress public/ into dist/.")
+    ap.add_argument("--public", default=str(root / "public"))
+    ap.add_argument("--out", default=str(root / "dist"))
+    args = ap.parse_args()
+
+    src = Path(args.public)
+    out = Path(args.out)
+    if not src.exists():
+        print(f"Missing public directory: {src}")
+        return 1
+    if out.exists():
+        shutil.rmtree(out)
+    out.mkdir(parents=True)
+
+    files = sorted(p for p in src.rglob("*") if p.is_file() and not p.name.startswith("."))
+    rels = [p.relative_to(src) for p in files]
+
+    # CSS can reference images, so images are hashed first, then CSS/JS (with
+    # rewritten references), then HTML and the service worker.
+    mapping: Dict[str, str] = {}
+    entries: Dict[str, Dict[str, object]] = {}
+
+    def emit(rel: Path, data: bytes, immutable: bool) -> str:
+        digest = _hash(data)
+        target = _hashed_name(rel, digest) if immutable else rel
+        fp = out / target
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        fp.write_bytes(data)
+        entries[_url(target)] = {
+            "hash": digest,
+            "type": mimetypes.guess_type(rel.name)[0] or "application/octet-stream",
+            "immutable": immutable,
+            "size": len(data),
+            "encodings": _write_variants(fp, data),
+        }
+        return _url(target)
+
+    def emit_images(rel: Path, url: str, data: bytes) -> Dict[str, str]:
+        # Fingerprinted siblings such as lecture-time.w640.3f2a9c01bd.webp; the
+        # server negotiates among them when the original URL is requested.
+        made: Dict[str, str] = {}
+        for name, blob in images.make_variants(data, images.WIDTHS).items():
+            made[name] = emit(rel.with_name(f"{rel.stem}.{name}"), blob, True)
+        return made
+
+    def rank(rel: Path) -> int:
+        ext = rel.suffix.lower()
+        if rel.name == "sw.js":
+            return 4
+        if ext == ".html":
+            return 3
+        if ext in (".css", ".js"):
+            return 2
+        return 1
+
+    for rel in sorted(rels, key=lambda r: (rank(r), r.as_posix())):
+        data = (src / rel).read_bytes()
+        ext = rel.suffix.lower()
+        if ext in (".css", ".js", ".html") and rel.name != "sw.js":
+            data = _rewrite_refs(data.decode("utf-8"), mapping).encode("utf-8")
+        if rel.name == "sw.js":
+            continue
+        immutable = ext != ".html" and rel.name not in FIXED_NAMES
+        url = emit(rel, data, immutable)
+        if immutable:
+            mapping[_url(rel)] = url
+        if ext in RESIZABLE and rel.name not in FIXED_NAMES and images.available():
+            entries[url]["images"] = emit_images(rel, url, data)
+
+    sw = next((r for r in rels if r.name == "sw.js" and r.parent == Path(".")), None)
+    if sw is not None:
+        precache = ["/"] + sorted(u for u, e in entries.items() if u.endswith(".html") or u == "/manifest.json")
+        precache += sorted(mapping[k] for k in mapping if k.endswith((".css", ".js")) or k == "/dr-botonic.jpeg")
+        listing = ",\n".join(f'  "{u}"' for u in precache)
+        text = (src / sw).read_text("utf-8")
+        text = SW_ASSETS_RE.sub(f"const ASSETS = [\n{listing}\n];", text)
+        text = SW_CACHE_RE.sub(f'const CACHE = "bn-cache-{_hash(listing.encode())[:10]}"; // generated by scripts/build_assets.py', text)
+        emit(sw, text.encode("utf-8"), False)
+
+    manifest = {
+        "version": 1,
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "assets": mapping,
+        "files": entries,
+    }
+    (out / "asset-manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n", "utf-8")
+
+    raw = sum(int(e["size"]) for e in entries.values())
+    print(f"Built {len(entries)} files ({raw / 1024:.0f} KiB) into {out}; {len(mapping)} fingerprinted.")
+    n_images = sum(len(e.get("images") or ()) for e in entries.values())
+    if n_images:
+        print(f"Resized image variants: {n_images} ({', '.join(images.formats())}).")
+    if brotli is None:
+        print("brotli not installed: wrote gzip variants only (pip install brotli for .br).")
+    if not images.available():
+        print("Pillow not installed: images are served at full size only (pip install Pillow).")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Minimal local stand-in for the OpenAI HTTP API, used by the benchmarks.
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+import argparse
+import asyncio
+import json
+import re
+import time
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    # ~4 characters per token plus per-message overhead, like the real count.
+    return sum(len(str(m.get("content") or "")) // 4 + 4 for m in body.get("messages") or [])
+
+def build_app(latency: float = 0.5, tokens: int = 40, token_delay: float = 0.01, prefill_per_token: float = 0.0) -> FastAPI:
+    # `prefill_per_token` adds latency proportional to the prompt size.
+    app = FastAPI()
+    app.state.counts = {"chat": 0, "stream": 0, "stream_aborted": 0, "speech": 0, "quiz": 0}
+    app.state.prompts = []
+
+    def _reply_words(body: Dict[str, Any]) -> list:
+        msgs = body.get("messages") or []
+        last = str(msgs[-1].get("content") if msgs else "")
+        words = [f"word{i}" for i in range(tokens)]
+        return (last.split()[:5] + words)[:tokens]
+
+    def _quiz_text(body: Dict[str, Any]) -> str:
+        # JSON quiz prompts get questions back: a JSON array, on every other
+        # call wrapped in a code fence with a trailing comma the way models
+        # sometimes answer, or JSON Lines when the prompt asks for them.
+        msgs = body.get("messages") or []
+        last = str(msgs[-1].get("content") if msgs else "")
+        m = re.search(r"Create (\d+)", last)
+        n = int(m.group(1)) if m else 5
+        app.state.counts["quiz"] += 1
+        call = app.state.counts["quiz"]
+        items = [
+            {"q": f"Quiz {call} question {i + 1}: what does concept {call * 100 + i} imply?", "a": " ".join(f"answer{j}" for j in range(tokens // 2))}
+            for i in range(n)
+        ]
+        if "JSON Lines" in last:
+            # One object per line, after a line of prose, with a malformed
+            # line after the second question.
+            lines = [json.dumps(it) for it in items]
+            lines.insert(min(2, len(lines)), '{"q": "Quiz %d broken question, "a": }' % call)
+            return "Here are your questions:\n" + "\n".join(lines) + "\n"
+        text = json.dumps(items, indent=1)
+        if call % 2 == 0:
+            text = "```json\n" + text[:-1].rstrip() + ",\n]\n```"
+        return text
+
+    @app.post("/v1/chat/completions")
+    async def chat(req: Request):
+        body = await req.json()
+        created = int(time.time())
+        msgs = body.get("messages") or []
+        if msgs and "valid JSON" in str(msgs[0].get("content")):
+            text = _quiz_text(body)
+            # Roughly four characters per token.
+            words = [text[i:i + 4] for i in range(0, len(text), 4)]
+            joiner = ""
+        else:
+            words = _reply_words(body)
+            joiner = " "
+        prompt_tokens = _prompt_tokens(body)
+        app.state.prompts.append({"tokens": prompt_tokens, "temperature": body.get("temperature")})
+        prefill = prompt_tokens * prefill_per_token
+        if body.get("stream"):
+            app.state.counts["stream"] += 1
+
+            async def gen():
+                # Streams the client walks away from are counted as aborted.
+                app.state.counts["stream_aborted"] += 1
+                await asyncio.sleep(latency + prefill)
+                for i, w in enumerate(words):
+                    text = w + (". " if (i + 1) % 8 == 0 else " ") if joiner else w
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(token_delay)
+                yield "data: [DONE]\n\n"
+                app.state.counts["stream_aborted"] -= 1
+
+            return StreamingResponse(gen(), media_type="text/event-stream")
+
+        app.state.counts["chat"] += 1
+        await asyncio.sleep(latency + prefill + token_delay * len(words))
+        return JSONResponse({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": joiner.join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": len(words) + prompt_tokens},
+        })
+
+    @app.post("/v1/audio/speech")
+    async def speech(req: Request):
+        body = await req.json()
+        app.state.counts["speech"] += 1
+        await asyncio.sleep(latency)
+        text = str(body.get("input") or "")
+        return Response(b"ID3" + text.encode("utf-8") * 64, media_type="audio/mpeg")
+
+    @app.get("/_stats")
+    async def stats():
+        return app.state.counts
+
+    @app.get("/_prompts")
+    async def prompts(reset: bool = False):
+        out = list(app.state.prompts)
+        if reset:
+            app.state.prompts.clear()
+        return out
+
+    return app
+
+def main() -> int:
+    import uvicorn
+    ap = argparse.ArgumentParser(description="Fake OpenAI server for local benchmarks.")
+    ap.add_argument("--port", type=int, default=3099)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--tokens", type=int, default=40)
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    ap.add_argument("--prefill-per-token", type=float, default=0.0, help="extra seconds per prompt token")
+    args = ap.parse_args()
+    uvicorn.run(build_app(args.latency, args.tokens, args.token_delay, args.prefill_per_token), host="127.0.0.1", port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
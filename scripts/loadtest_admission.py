@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Overloads /api/chat with a mix of masters, bachelors and associates students
+# (open loop, a fixed arrival rate well above what the fake upstream can serve)
+# once with ADMISSION_ENABLED=0 and once with admission control on, and prints
+# per-plan outcomes and latency. With admission on, masters latency should
+# stay bounded while associates get 429s with Retry-After instead of queueing.
+#
+# Each phase gets its own temporary DATA_DIR so data/ is not touched.
+#
+#   python scripts/loadtest_admission.py --rate 40 --duration 20 --upstream-limit 8
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import uvicorn
+
+from fake_openai import build_app
+
+ROOT = Path(__file__).resolve().parents[1]
+PLANS = ("masters", "bachelors", "associates")
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+async def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                r = await c.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+async def _phase(args: argparse.Namespace, admission: bool) -> Dict[str, Dict[str, List[float]]]:
+    tmp = tempfile.mkdtemp(prefix="loadtest-admission-")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+        "OPENAI_MAX_CONCURRENCY": str(args.upstream_limit),
+        "ADMISSION_ENABLED": "1" if admission else "0",
+        "DATA_DIR": tmp,
+        # Keep quiz bank refills out of the measured upstream traffic.
+        "QUIZ_BANK_PREFILL": "0",
+        "QUIZ_BANK_REFILL": "0",
+        "PYTHONPATH": str(ROOT),
+    })
+    app_proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+    # plan -> "ok" / "429" / "error" -> latencies (seconds)
+    results: Dict[str, Dict[str, List[float]]] = {plan: defaultdict(list) for plan in PLANS}
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        await _wait_ready(f"{base}/api/health")
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+        async with httpx.AsyncClient(base_url=base, timeout=300.0, limits=limits) as c:
+            tokens: Dict[str, List[str]] = {}
+            for plan in PLANS:
+                tokens[plan] = []
+                for i in range(args.students):
+                    r = await c.post("/api/auth", json={"email": f"{plan}{i}@load.test", "plan": plan, "student_id": f"BN-LOAD-{plan}-{i}"})
+                    tokens[plan].append(r.json()["token"])
+
+            rnd = random.Random(args.seed)
+            weights = [args.mix_masters, args.mix_bachelors, 1.0 - args.mix_masters - args.mix_bachelors]
+
+            async def one(i: int, plan: str, token: str) -> None:
+                t0 = time.perf_counter()
+                try:
+                    r = await c.post(
+                        "/api/chat",
+                        json={"message": f"load question {i}", "subject": "Load", "plan": plan},
+                        headers={"Authorization": f"Bearer {token}", "Cache-Control": "no-cache"},
+                    )
+                    if r.status_code == 429:
+                        outcome = "429"
+                    else:
+                        outcome = "ok" if r.status_code == 200 and "error" not in r.json() else "error"
+                except httpx.HTTPError:
+                    outcome = "error"
+                results[plan][outcome].append(time.perf_counter() - t0)
+
+            tasks = []
+            start = time.perf_counter()
+            for i in range(int(args.rate * args.duration)):
+                delay = start + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                plan = rnd.choices(PLANS, weights)[0]
+                tasks.append(asyncio.create_task(one(i, plan, rnd.choice(tokens[plan]))))
+            await asyncio.gather(*tasks)
+            health = (await c.get("/api/health")).json().get("admission") or {}
+        gate = health.get("gate") or {}
+        print(f"  gate: admitted {gate.get('admitted')}, queued {gate.get('queued')}, rejected {gate.get('rejected')}; buckets limited {(health.get('buckets') or {}).get('limited')}")
+        return results
+    finally:
+        app_proc.terminate()
+        app_proc.wait(timeout=10)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _report(results: Dict[str, Dict[str, List[float]]]) -> None:
+    print(f"  {'plan':<11}{'ok':>6}{'429':>6}{'error':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for plan in PLANS:
+        ok = results[plan]["ok"]
+        print(
+            f"  {plan:<11}{len(ok):>6}{len(results[plan]['429']):>6}{len(results[plan]['error']):>7}"
+            f"{_pct(ok, 50) * 1000:>9.0f}{_pct(ok, 99) * 1000:>9.0f}{(max(ok) if ok else 0) * 1000:>9.0f}"
+        )
+
+async def _run(args: argparse.Namespace) -> int:
+    fake = uvicorn.Server(uvicorn.Config(
+        build_app(args.latency, args.tokens, 0.0),
+        host="127.0.0.1", port=args.fake_port, log_level="warning",
+    ))
+    fake_task = asyncio.create_task(fake.serve())
+    try:
+        await _wait_ready(f"http://127.0.0.1:{args.fake_port}/_stats")
+        capacity = args.upstream_limit / args.latency
+        print(f"{args.rate:.0f} req/s for {args.duration:.0f}s against ~{capacity:.0f} req/s of upstream capacity "
+              f"(mix {args.mix_masters:.0%} masters, {args.mix_bachelors:.0%} bachelors)")
+        summary = {}
+        for admission in (False, True):
+            print(f"\nadmission {'on' if admission else 'off'}:")
+            results = await _phase(args, admission)
+            _report(results)
+            summary[admission] = _pct(results["masters"]["ok"], 99)
+        print(f"\nmasters p99: {summary[False] * 1000:.0f} ms -> {summary[True] * 1000:.0f} ms")
+        return 0
+    finally:
+        fake.should_exit = True
+        await fake_task
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Load test plan-aware admission control against a fake OpenAI upstream.")
+    ap.add_argument("--rate", type=float, default=40.0, help="arrivals per second")
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--mix-masters", type=float, default=0.2)
+    ap.add_argument("--mix-bachelors", type=float, default=0.3)
+    ap.add_argument("--students", type=int, default=50, help="students per plan")
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--tokens", type=int, default=40)
+    ap.add_argument("--upstream-limit", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--port", type=int, default=3051)
+    ap.add_argument("--fake-port", type=int, default=3099)
+    return asyncio.run(_run(ap.parse_args()))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Hammers one student's history and subscription record from several worker
+# processes at once and checks that no update was lost, for both backends.
+#
+#   python scripts/loadtest_datastore.py --procs 8 --ops 200
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.datastore import DataStore, FileStore, SqliteStore
+
+def _open(backend: str, root: str) -> DataStore:
+    if backend == "sqlite":
+        return SqliteStore(Path(root) / "load.db", pool_size=2)
+    return FileStore(Path(root), history_max=10 ** 9)
+
+def _bump(rec: Dict[str, Any]) -> Dict[str, Any]:
+    rec["counter"] = int(rec.get("counter") or 0) + 1
+    return rec
+
+def _worker(backend: str, root: str, wid: int, ops: int) -> None:
+    store = _open(backend, root)
+    for i in range(ops):
+        store.history_append("BN-LOAD", [{"role": "user", "content": f"w{wid} op{i}", "id": f"{wid}-{i}"}])
+        store.sub_update("BN-LOAD", _bump)
+    store.close()
+
+def _run(backend: str, procs: int, ops: int) -> bool:
+    with tempfile.TemporaryDirectory() as root:
+        _open(backend, root).close()
+        t0 = time.perf_counter()
+        workers = [mp.Process(target=_worker, args=(backend, root, w, ops)) for w in range(procs)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - t0
+
+        store = _open(backend, root)
+        seen = 0
+        cursor = 0
+        while True:
+            page, _, more = store.history_read("BN-LOAD", since=cursor, limit=1000)
+            seen += len(page)
+            if not page or not more:
+                break
+            cursor = int(page[-1]["seq"])
+        counter = int((store.sub_get("BN-LOAD") or {}).get("counter") or 0)
+        store.close()
+
+    expected = procs * ops
+    ok = seen == expected and counter == expected
+    rate = 2 * expected / elapsed
+    print(f"{backend:6}: {procs} procs x {ops} ops in {elapsed:.2f}s ({rate:.0f} writes/s) "
+          f"history {seen}/{expected}, counter {counter}/{expected} -> {'OK' if ok else 'LOST UPDATES'}")
+    return ok
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Multi-process lost-update test for the data backends.")
+    ap.add_argument("--procs", type=int, default=8)
+    ap.add_argument("--ops", type=int, default=200)
+    ap.add_argument("--backend", choices=["file", "sqlite", "both"], default="both")
+    args = ap.parse_args()
+    backends = ["file", "sqlite"] if args.backend == "both" else [args.backend]
+    results = [_run(b, args.procs, args.ops) for b in backends]
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
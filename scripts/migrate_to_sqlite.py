@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Imports the file-based data/ tree (history, subscriptions, announcements,
+# photos) into the SQLite backend used with DATA_BACKEND=sqlite.
+#
+#   python scripts/migrate_to_sqlite.py [--data-dir data] [--db data/botnology.db]
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.datastore import FileStore, SqliteStore
+
+def main() -> int:
+    root = Path(__file__).resolve().parents[1]
+    ap = argparse.ArgumentParser(description="Migrate data/ JSON files into SQLite.")
+    ap.add_argument("--data-dir", default=str(root / "data"))
+    ap.add_argument("--db", default=None, help="defaults to <data-dir>/botnology.db")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.exists():
+        print(f"Missing data directory: {data_dir}")
+        return 1
+    src = FileStore(data_dir, history_max=10 ** 9)
+    dst = SqliteStore(Path(args.db) if args.db else data_dir / "botnology.db", history_max=10 ** 9)
+
+    students = {fp.stem for fp in src.history.root.glob("*.json")} | {fp.stem for fp in src.history.root.glob("*.jsonl")}
+    n_msgs = 0
+    for sid in sorted(students):
+        msgs, _, _ = src.history_read(sid, since=0, limit=1000)
+        everything = list(msgs)
+        while msgs and len(msgs) == 1000:
+            msgs, _, _ = src.history_read(sid, since=int(everything[-1]["seq"]), limit=1000)
+            everything.extend(msgs)
+        n_msgs += dst.history_replace(sid, everything)
+    print(f"history       : {len(students)} students, {n_msgs} messages")
+
+    n_subs = 0
+    for fp in sorted(src.subs_dir.glob("*.json")):
+        rec = src.sub_get(fp.stem)
+        # Skip placeholders like example.json that are not subscription records.
+        if not rec or "status" not in rec:
+            continue
+        dst.sub_update(fp.stem, lambda _cur, rec=rec: rec)
+        n_subs += 1
+    print(f"subscriptions : {n_subs}")
+
+    items = src.announcements_list() or []
+    clean = [it if isinstance(it, dict) else {"text": str(it)} for it in items]
+    clean = [it for it in clean if it.get("text")]
+    # Stored newest-first in the file; insert oldest first so ids keep that order.
+    for it in reversed(clean):
+        dst.announcement_add({"text": str(it["text"]), "date": it.get("date")}, keep=100)
+    print(f"announcements : {len(clean)}")
+
+    n_photos = 0
+    for fp in sorted(src.photos_dir.glob("*.png")):
+        variants = {name: src.photo_variant_get(fp.stem, name) or b"" for name in src.photo_variants(fp.stem)}
+        dst.photo_put(fp.stem, fp.read_bytes(), variants)
+        n_photos += 1
+    print(f"photos        : {n_photos}")
+    print(f"Wrote {dst.path}. Start the app with DATA_BACKEND=sqlite to use it.")
+    dst.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
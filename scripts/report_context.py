@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Replays multi-turn conversations through /api/chat twice, once with the old
+# fixed 16-turn window (CONTEXT_PACKING=0) and once with token-budget packing,
+# against a fake OpenAI server whose latency grows with the prompt size, and
+# compares prompt tokens and latency per chat turn.
+#
+#   python scripts/report_context.py --conversations 12 --turns 30
+#   python scripts/report_context.py --replay chats.jsonl   (one JSON list of user messages per line)
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+import uvicorn
+
+from fake_openai import build_app
+
+ROOT = Path(__file__).resolve().parents[1]
+PLANS = ("associates", "bachelors", "masters")
+WORDS = (
+    "photosynthesis derivative integral mitochondria equilibrium vector matrix enzyme theorem proof "
+    "essay thesis citation momentum velocity entropy molecule reaction polynomial probability sample "
+    "variance hypothesis experiment lecture chapter exam revision notes example question answer"
+).split()
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+async def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                r = await c.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up")
+
+def _synthetic(n: int, turns: int, seed: int) -> List[List[str]]:
+    # Mostly short questions with the occasional pasted essay or problem set.
+    rnd = random.Random(seed)
+    convs = []
+    for c in range(n):
+        msgs = []
+        for t in range(turns):
+            size = rnd.randint(300, 900) if rnd.random() < 0.15 else rnd.randint(6, 40)
+            msgs.append(f"conv{c} turn{t}: " + " ".join(rnd.choices(WORDS, k=size)))
+        convs.append(msgs)
+    return convs
+
+async def _replay(base: str, convs: List[List[str]], concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=300.0) as c:
+        async def one(i: int, msgs: List[str]) -> None:
+            async with sem:
+                hist: List[Dict[str, str]] = []
+                for msg in msgs:
+                    t0 = time.perf_counter()
+                    r = await c.post("/api/chat", json={"message": msg, "history": hist, "plan": PLANS[i % len(PLANS)], "subject": "Replay"})
+                    latencies.append(time.perf_counter() - t0)
+                    r.raise_for_status()
+                    hist = hist + [{"role": "user", "content": msg}, {"role": "assistant", "content": r.json().get("reply") or ""}]
+
+        await asyncio.gather(*(one(i, msgs) for i, msgs in enumerate(convs)))
+    return latencies
+
+async def _run_mode(args: argparse.Namespace, packing: bool, convs: List[List[str]]) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+        "CONTEXT_PACKING": "1" if packing else "0",
+        "RESPONSE_CACHE_CHAT": "0",
+        "ADMISSION_ENABLED": "0",
+        # Keep quiz bank refills out of the measured upstream traffic.
+        "QUIZ_BANK_PREFILL": "0",
+        "QUIZ_BANK_REFILL": "0",
+        "PYTHONPATH": str(ROOT),
+    })
+    app_proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        await _wait_ready(f"{base}/api/health")
+        async with httpx.AsyncClient() as c:
+            await c.get(f"http://127.0.0.1:{args.fake_port}/_prompts", params={"reset": "true"})
+        latencies = await _replay(base, convs, args.concurrency)
+        async with httpx.AsyncClient() as c:
+            prompts = (await c.get(f"http://127.0.0.1:{args.fake_port}/_prompts", params={"reset": "true"})).json()
+            health = (await c.get(f"{base}/api/health")).json()
+    finally:
+        app_proc.terminate()
+        app_proc.wait(timeout=10)
+    # Chat calls run at temperature 0.7, summaries at 0.2.
+    chat = [p["tokens"] for p in prompts if p["temperature"] == 0.7]
+    summary = [p["tokens"] for p in prompts if p["temperature"] != 0.7]
+    return {"chat": chat, "summary": summary, "latencies": latencies, "context": health.get("context") or {}}
+
+def _row(name: str, r: Dict[str, Any]) -> str:
+    chat, lat = r["chat"], r["latencies"]
+    return (f"{name:<8} {len(chat):>6} {statistics.mean(chat):>9.0f} {_pct(chat, 95):>8.0f} {max(chat):>8}"
+            f" {len(r['summary']):>9} {sum(r['summary']):>10}"
+            f" {statistics.mean(lat) * 1000:>8.0f} {_pct(lat, 50) * 1000:>8.0f} {_pct(lat, 95) * 1000:>8.0f}")
+
+async def _run(args: argparse.Namespace) -> int:
+    if args.replay:
+        convs = [json.loads(line) for line in Path(args.replay).read_text("utf-8").splitlines() if line.strip()]
+    else:
+        convs = _synthetic(args.conversations, args.turns, args.seed)
+    fake = uvicorn.Server(uvicorn.Config(
+        build_app(args.latency, args.tokens, 0.0, args.prefill_ms / 1000.0),
+        host="127.0.0.1", port=args.fake_port, log_level="warning",
+    ))
+    fake_task = asyncio.create_task(fake.serve())
+    try:
+        await _wait_ready(f"http://127.0.0.1:{args.fake_port}/_stats")
+        results = {}
+        for name, packing in (("before", False), ("after", True)):
+            results[name] = await _run_mode(args, packing, convs)
+    finally:
+        fake.should_exit = True
+        await fake_task
+
+    turns = sum(len(c) for c in convs)
+    print(f"{len(convs)} conversations, {turns} turns; upstream {args.latency * 1000:.0f} ms + {args.prefill_ms} ms per prompt token")
+    print(f"tokenizer: {results['after']['context'].get('tokenizer')}, budgets: {results['after']['context'].get('budgets')}\n")
+    print(f"{'':<8} {'calls':>6} {'prompt':>9} {'p95':>8} {'max':>8} {'summaries':>9} {'sum tok':>10} {'lat ms':>8} {'p50':>8} {'p95':>8}")
+    for name in ("before", "after"):
+        print(_row(name, results[name]))
+    before = sum(results["before"]["chat"])
+    after = sum(results["after"]["chat"]) + sum(results["after"]["summary"])
+    print(f"\ntotal input tokens incl. summaries: {before} -> {after} ({(after - before) / max(1, before):+.0%})")
+    return 0
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Prompt tokens and latency with and without context packing.")
+    ap.add_argument("--conversations", type=int, default=12)
+    ap.add_argument("--turns", type=int, default=30)
+    ap.add_argument("--replay", help="JSONL file, one list of user messages per line")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--concurrency", type=int, default=6)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--prefill-ms", type=float, default=0.05, help="upstream ms per prompt token")
+    ap.add_argument("--tokens", type=int, default=120, help="words per fake reply")
+    ap.add_argument("--port", type=int, default=3052)
+    ap.add_argument("--fake-port", type=int, default=3099)
+    return asyncio.run(_run(ap.parse_args()))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
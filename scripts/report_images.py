@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Size/latency report for responsive image variants: for each image, the
+# original against every generated width/format, with encode time and the
+# transfer time on a slow and a typical mobile link.
+#
+#   python scripts/report_images.py [images...]   (defaults to public/ images)
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api import images
+
+LINKS = (("3G", 1.6), ("4G", 10.0))  # Mbit/s
+
+def _ms(nbytes: int, mbps: float) -> float:
+    return nbytes * 8 / (mbps * 1_000_000) * 1000
+
+def main() -> int:
+    root = Path(__file__).resolve().parents[1]
+    ap = argparse.ArgumentParser(description="Compare original images with their resized variants.")
+    ap.add_argument("paths", nargs="*")
+    ap.add_argument("--widths", default=",".join(str(w) for w in images.WIDTHS))
+    args = ap.parse_args()
+
+    if not images.available():
+        print("Pillow is not installed (pip install Pillow).")
+        return 1
+    paths = [Path(p) for p in args.paths] or sorted(p for p in (root / "public").rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png") and p.name != "favicon.ico")
+    widths = [int(w) for w in args.widths.split(",") if w.strip()]
+    link_cols = "".join(f" {name + ' ms':>9}" for name, _ in LINKS)
+    print(f"formats: {', '.join(images.formats())}\n")
+
+    for fp in paths:
+        data = fp.read_bytes()
+        print(f"{fp.name}  ({len(data) / 1024:.0f} KiB original)")
+        print(f"  {'variant':<12} {'KiB':>8} {'vs orig':>8} {'encode ms':>10}{link_cols}")
+        print(f"  {'original':<12} {len(data) / 1024:8.1f} {'100%':>8} {'-':>10}" + "".join(f" {_ms(len(data), mbps):9.0f}" for _, mbps in LINKS))
+        for fmt in images.formats():
+            for w in widths:
+                t0 = time.perf_counter()
+                name, blob = next(iter(images.make_variants(data, [w], [fmt]).items()))
+                enc = (time.perf_counter() - t0) * 1000
+                print(f"  {name:<12} {len(blob) / 1024:8.1f} {len(blob) / len(data):8.1%} {enc:10.0f}"
+                      + "".join(f" {_ms(len(blob), mbps):9.0f}" for _, mbps in LINKS))
+        print()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,47 @@
+import asyncio
+
+import api.index as index
+from api import upstream
+
+
+def test_identical_requests_take_one_upstream_slot(monkeypatch):
+    taken = []
+
+    async def reserve():
+        await asyncio.sleep(0.01)
+        r = upstream.Reservation()
+        taken.append(r)
+        return r
+
+    monkeypatch.setattr(upstream, "reserve", reserve)
+
+    async def run():
+        got = await asyncio.gather(*(index._reserve_flight("same") for _ in range(4)))
+        assert len(taken) == 1 and got.count(None) == 3
+        # Once the leader's slot is spent or released, the next request leads.
+        taken[0].state = "released"
+        assert await index._reserve_flight("same") is not None
+        assert len(taken) == 2
+
+    asyncio.run(run())
+
+
+def test_refused_leader_lets_the_next_request_try(monkeypatch):
+    calls = []
+
+    async def reserve():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("overloaded")
+        return upstream.Reservation()
+
+    monkeypatch.setattr(upstream, "reserve", reserve)
+
+    async def run():
+        first, second = await asyncio.gather(
+            index._reserve_flight("other"), index._reserve_flight("other"), return_exceptions=True,
+        )
+        assert isinstance(first, RuntimeError)
+        assert isinstance(second, upstream.Reservation)
+
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+import asyncio
+
+from api.coalesce import ResumableStreams
+
+
+def test_full_table_never_evicts_live_runs():
+    async def run():
+        replay = ResumableStreams("test", max_streams=2)
+        gate = asyncio.Event()
+
+        async def slow():
+            await gate.wait()
+            yield "slow"
+
+        async def quick():
+            yield "quick"
+
+        live = replay.start(slow)
+        finished = replay.start(quick)
+        await asyncio.sleep(0)
+        assert [x async for x in replay.subscribe(finished)] == ["quick"]
+
+        # The finished run makes room; the live one is left alone.
+        third = replay.start(slow)
+        assert third is not None and finished not in replay._runs
+        # Two live runs fill the table, so nothing else is registered.
+        assert replay.start(quick) is None
+        assert replay.counters["full"] == 1
+        assert not replay._runs[live].task.cancelled()
+
+        gate.set()
+        assert [x async for x in replay.subscribe(live)] == ["slow"]
+        assert [x async for x in replay.subscribe(third)] == ["slow"]
+
+    asyncio.run(run())
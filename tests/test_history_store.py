@@ -0,0 +1,110 @@
+import json
+import threading
+
+from api.history_store import HistoryStore
+
+
+def _msgs(prefix, n, role="user"):
+    return [{"role": role, "content": f"{prefix} {i}", "id": f"{prefix}-{i}"} for i in range(n)]
+
+
+def test_append_assigns_increasing_seqs_and_skips_known_ids(tmp_path):
+    store = HistoryStore(tmp_path)
+    assert store.append("BN-1", _msgs("a", 3)) == (3, 3)
+    # A retry of the same batch plus one new message only adds the new one.
+    assert store.append("BN-1", _msgs("a", 4)) == (1, 4)
+    page, last, more = store.read("BN-1")
+    assert [m["seq"] for m in page] == [1, 2, 3, 4]
+    assert [m["content"] for m in page] == ["a 0", "a 1", "a 2", "a 3"]
+    assert last == 4 and not more
+
+
+def test_cursors_page_forward_and_backward(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.append("BN-1", _msgs("m", 10))
+    page, last, more = store.read("BN-1", since=3, limit=4)
+    assert [m["seq"] for m in page] == [4, 5, 6, 7] and more and last == 10
+    page, _, more = store.read("BN-1", since=7, limit=4)
+    assert [m["seq"] for m in page] == [8, 9, 10] and not more
+    page, _, more = store.read("BN-1", before=5, limit=3)
+    assert [m["seq"] for m in page] == [2, 3, 4] and more
+    page, _, more = store.read("BN-1", before=3, limit=3)
+    assert [m["seq"] for m in page] == [1, 2] and not more
+
+
+def test_second_store_sees_appends_from_another_worker(tmp_path):
+    a, b = HistoryStore(tmp_path), HistoryStore(tmp_path)
+    a.append("BN-1", _msgs("a", 2))
+    assert b.read("BN-1")[1] == 2
+    b.append("BN-1", _msgs("b", 2))
+    page, last, _ = a.read("BN-1")
+    assert last == 4
+    assert [m["content"] for m in page] == ["a 0", "a 1", "b 0", "b 1"]
+
+
+def test_concurrent_appends_with_compaction_keep_newest_and_unique_seqs(tmp_path):
+    # Two stores on one directory stand in for two workers; each has writer
+    # threads, and the log is compacted several times along the way.
+    stores = [HistoryStore(tmp_path, max_messages=40), HistoryStore(tmp_path, max_messages=40)]
+    errors = []
+
+    def writer(store, name):
+        try:
+            for i in range(30):
+                store.append("BN-1", [{"role": "user", "content": f"{name} {i}", "id": f"{name}-{i}"}])
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(stores[i % 2], f"w{i}")) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+    page, last, _ = HistoryStore(tmp_path).read("BN-1", limit=1000)
+    seqs = [m["seq"] for m in page]
+    assert last == 120
+    assert seqs == sorted(set(seqs))
+    # Compaction keeps at most max_messages * 5 / 4 and always the newest.
+    assert 40 <= len(page) <= 50
+    assert seqs[-1] == 120
+    lines = (tmp_path / "BN-1.jsonl").read_text("utf-8").splitlines()
+    assert [json.loads(line)["seq"] for line in lines] == seqs
+    # A cursor from before compaction still resumes after it.
+    newer, _, _ = stores[0].read("BN-1", since=100)
+    assert [m["seq"] for m in newer] == list(range(101, 121))
+
+
+def test_partial_trailing_line_is_not_read_until_complete(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.append("BN-1", _msgs("a", 1))
+    fp = tmp_path / "BN-1.jsonl"
+    with fp.open("a", encoding="utf-8") as f:
+        f.write('{"role":"user","content":"half","seq":2')
+    assert [m["seq"] for m in store.read("BN-1")[0]] == [1]
+    with fp.open("a", encoding="utf-8") as f:
+        f.write("}\n")
+    assert [m["seq"] for m in store.read("BN-1")[0]] == [1, 2]
+
+
+def test_legacy_json_history_seeds_the_log(tmp_path):
+    (tmp_path / "BN-1.json").write_text(json.dumps({"history": [
+        {"role": "user", "content": "old q"},
+        {"role": "assistant", "content": "old a"},
+        {"role": "system", "content": "dropped"},
+    ]}), "utf-8")
+    store = HistoryStore(tmp_path)
+    assert [m["seq"] for m in store.read("BN-1")[0]] == [1, 2]
+    assert store.append("BN-1", _msgs("new", 1)) == (1, 3)
+    page = HistoryStore(tmp_path).read("BN-1")[0]
+    assert [m["content"] for m in page] == ["old q", "old a", "new 0"]
+
+
+def test_replace_keeps_seqs_growing(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.append("BN-1", _msgs("a", 3))
+    assert store.replace("BN-1", [{"role": "user", "content": "only"}]) == 1
+    page, last, _ = store.read("BN-1")
+    assert [(m["seq"], m["content"]) for m in page] == [(4, "only")]
+    assert last == 4
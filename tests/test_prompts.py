@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.index as index
+from api import upstream
+
+
+def _history(turns):
+    hist = []
+    for i in range(turns):
+        hist.append({"role": "user", "content": f"Question {i}: how does step {i} of the proof follow from the lemma?"})
+        hist.append({"role": "assistant", "content": f"Step {i} follows because " + "the bound holds term by term; " * 6})
+    return hist
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    seen = []
+
+    async def fake_completion(model, messages, temperature, timeout=None):
+        seen.append(messages)
+        return "ok"
+
+    async def fake_stream(model, messages, temperature, timeout=None):
+        seen.append(messages)
+        yield "ok"
+
+    monkeypatch.setattr(upstream, "available", lambda: True)
+    monkeypatch.setattr(upstream, "chat_completion", fake_completion)
+    monkeypatch.setattr(upstream, "chat_stream", fake_stream)
+    monkeypatch.setattr(index, "OPENAI_ENABLED", True)
+    # No quiz bank generations in the count.
+    monkeypatch.setattr(index, "QUIZ_BANK_ENABLED", False)
+    monkeypatch.setattr(index, "QUIZ_BANK_PREFILL", False)
+    return seen
+
+
+def _encode(messages):
+    return json.dumps(messages, ensure_ascii=False).encode("utf-8")
+
+
+def test_chat_endpoints_send_a_byte_identical_stable_prefix(sent):
+    body = {"message": "What is a limit?", "history": _history(6), "subject": "Calculus", "plan": "masters"}
+    with TestClient(index.app) as c:
+        c.post("/api/chat", json=body, headers={"Cache-Control": "no-cache"})
+        c.post("/api/chat/stream", json=body)
+        c.post("/api/chat", json=dict(body, message="And a derivative?"), headers={"Cache-Control": "no-cache"})
+    assert len(sent) == 3
+    chat, stream, other = sent
+    # Both endpoints send the upstream exactly the same bytes.
+    assert _encode(chat) == _encode(stream)
+    # Only the final question differs when the question changes.
+    assert _encode(other[:-1]) == _encode(chat[:-1])
+    assert other[-1]["content"] != chat[-1]["content"]
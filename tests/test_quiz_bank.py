@@ -0,0 +1,73 @@
+import asyncio
+
+from api import admission
+from api.quiz_bank import QuizBank
+
+
+def test_only_one_worker_prefills_a_shared_bank(tmp_path):
+    calls = []
+
+    async def generate(topic, level, n):
+        calls.append((topic, level))
+        return [{"q": f"{topic} {level} question {i}?", "a": "answer"} for i in range(n)]
+
+    async def run():
+        first = QuizBank(tmp_path, generate, target=5, batch=5)
+        second = QuizBank(tmp_path, generate, target=5, batch=5)
+        assert first.prefill(["Physics"], ["associates"])
+        assert not second.prefill(["Physics"], ["associates"])
+        assert second.stats()["queued"] == 0
+        await first._task
+        assert calls == [("physics", "associates")]
+        # A worker started after the fill finds the pool on disk.
+        third = QuizBank(tmp_path, generate, target=5, batch=5)
+        assert third.size("Physics", "associates") == 5
+
+    asyncio.run(run())
+
+
+def test_only_catalog_pools_and_pools_in_use_are_refilled(tmp_path):
+    calls = []
+
+    async def generate(topic, level, n):
+        calls.append(topic)
+        return [{"q": f"{topic} refill question {len(calls)} {i}?", "a": "answer"} for i in range(n)]
+
+    async def run():
+        bank = QuizBank(tmp_path, generate, target=10, batch=5)
+        live = [{"q": f"Live question number {i}?", "a": "answer"} for i in range(5)]
+        # A topic seen once in a live generation keeps its questions, no more.
+        bank.add("Some random topic", "associates", live, "student:BN-1")
+        bank.want("Some random topic", "associates")
+        assert bank.stats()["queued"] == 0 and bank._task is None
+
+        # Once it serves a quiz, it is worth topping up.
+        assert bank.sample("Some random topic", "associates", 5, "student:BN-2")
+        assert bank.stats()["queued"] == 1
+        await bank._task
+        assert calls == ["some random topic"]
+        assert bank.size("Some random topic", "associates") == 10
+
+    asyncio.run(run())
+
+
+def test_background_work_waits_behind_every_plan():
+    async def run():
+        gate = admission.PriorityGate(1)
+        await gate.acquire("masters")
+        order = []
+
+        async def take(plan):
+            await gate.acquire(plan)
+            order.append(plan)
+            gate.release()
+
+        waiters = [asyncio.ensure_future(take(admission.BACKGROUND))]
+        await asyncio.sleep(0)
+        waiters.append(asyncio.ensure_future(take("associates")))
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*waiters)
+        assert order == ["associates", admission.BACKGROUND]
+
+    asyncio.run(run())
@@ -0,0 +1,31 @@
+import api.index as index
+from api import search_index
+from api.search_index import SearchIndex
+
+HISTORY = [
+    {"seq": 1, "role": "user", "content": "How does the krebs cycle produce ATP?"},
+    {"seq": 2, "role": "assistant", "content": "The krebs cycle yields NADH that feeds oxidative phosphorylation."},
+    {"seq": 3, "role": "user", "content": "And glycolysis, before the krebs cycle?"},
+]
+
+
+def _index():
+    return SearchIndex(
+        lambda student_id, since: ((0, 0), None if since == (0, 0) else {}),
+        lambda student_id, path: None,
+        lambda student_id, since: [m for m in HISTORY if m["seq"] > since],
+    )
+
+
+def test_history_hits_read_like_indexed_messages():
+    hits = _index().search("BN-1", "krebs cycle", k=5)
+    assert {h["text"] for h in hits} == {search_index.history_text(m) for m in HISTORY}
+
+
+def test_turns_already_in_the_prompt_are_not_retrieved_again(monkeypatch):
+    monkeypatch.setattr(index, "SEARCH", _index())
+    monkeypatch.setattr(index, "RAG_ENABLED", True)
+    turns = [{"role": m["role"], "content": m["content"]} for m in HISTORY[1:]]
+    context = index._retrieval_context("BN-1", "krebs cycle", turns)
+    assert "earlier chat #1" in context
+    assert "#2" not in context and "#3" not in context
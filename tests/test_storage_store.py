@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+from api.httputil import iter_file, parse_range
+from api.storage_store import Conflict, NotFound, StorageStore, TooLarge, hash_bytes
+
+
+def test_write_list_and_skip_unchanged(tmp_path):
+    store = StorageStore(tmp_path)
+    out = store.write_many("BN-1", [("notes/a.txt", b"alpha"), ("notes/b.txt", b"beta"), ("c.txt", b"gamma")])
+    assert all(r.get("saved") for r in out)
+    assert store.write("BN-1", "notes/a.txt", b"alpha").get("skipped")
+
+    page, cursor = store.list("BN-1", limit=2)
+    assert [e["path"] for e in page] == ["c.txt", "notes/a.txt"] and cursor == "notes/a.txt"
+    page, cursor = store.list("BN-1", cursor=cursor, limit=2)
+    assert [e["path"] for e in page] == ["notes/b.txt"] and cursor is None
+    page, _ = store.list("BN-1", prefix="notes/")
+    assert [e["hash"] for e in page] == [hash_bytes(b"alpha"), hash_bytes(b"beta")]
+
+
+def test_manifest_is_shared_and_rebuilt_when_missing(tmp_path):
+    a, b = StorageStore(tmp_path), StorageStore(tmp_path)
+    a.write("BN-1", "x.txt", b"one")
+    assert b.stat("BN-1", "x.txt")["size"] == 3
+    b.delete("BN-1", "x.txt")
+    assert a.stat("BN-1", "x.txt") is None
+
+    a.write("BN-1", "y.txt", b"two")
+    a.manifest_path("BN-1").unlink()
+    fresh = StorageStore(tmp_path)
+    assert fresh.stat("BN-1", "y.txt")["hash"] == hash_bytes(b"two")
+    assert json.loads(fresh.manifest_path("BN-1").read_text("utf-8"))["y.txt"]["size"] == 3
+
+
+def test_snapshot_reports_changes_only(tmp_path):
+    store = StorageStore(tmp_path)
+    version, entries = store.snapshot("BN-1")
+    assert entries == {}
+    assert store.snapshot("BN-1", since=version)[1] is None
+    store.write("BN-1", "a.txt", b"a")
+    version2, entries = store.snapshot("BN-1", since=version)
+    assert version2 != version and list(entries) == ["a.txt"]
+    assert store.snapshot("BN-1", since=version2)[1] is None
+
+
+def test_reads_for_student_without_files_leave_nothing_behind(tmp_path):
+    store = StorageStore(tmp_path)
+    store.snapshot("BN-1")
+    store.list("BN-1")
+    assert store.stat("BN-1", "a.txt") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_paths_cannot_escape_the_student_dir(tmp_path):
+    store = StorageStore(tmp_path)
+    for rel in ("../BN-2/a.txt", "", "/"):
+        with pytest.raises(ValueError):
+            store.write("BN-1", rel, b"x")
+
+
+def test_upload_resumes_after_partial_write(tmp_path):
+    store = StorageStore(tmp_path)
+    data = bytes(range(256)) * 40
+    up = store.create_upload("BN-1", "big/file.bin", length=len(data))
+
+    # The first request dies part way through its chunk.
+    with store.append_upload("BN-1", up["id"], 0) as w:
+        w.write(data[:1000])
+        w.write(data[1000:1500])
+    status = store.upload_status("BN-1", up["id"])
+    assert status["offset"] == 1500
+
+    # The client asks where to continue; resending from a stale offset is refused.
+    with pytest.raises(Conflict):
+        with store.append_upload("BN-1", up["id"], 1000):
+            pass
+    with pytest.raises(Conflict):
+        store.finish_upload("BN-1", up["id"])
+    with store.append_upload("BN-1", up["id"], status["offset"]) as w:
+        w.write(data[1500:])
+
+    out = store.finish_upload("BN-1", up["id"])
+    assert out["hash"] == hash_bytes(data) and out["size"] == len(data)
+    assert store.read("BN-1", "big/file.bin") == data
+    assert store.stat("BN-1", "big/file.bin")["hash"] == hash_bytes(data)
+
+
+def test_upload_cannot_exceed_declared_length(tmp_path):
+    store = StorageStore(tmp_path, max_file_bytes=100)
+    with pytest.raises(TooLarge):
+        store.create_upload("BN-1", "a.bin", length=101)
+    up = store.create_upload("BN-1", "a.bin", length=10)
+    with pytest.raises(TooLarge):
+        with store.append_upload("BN-1", up["id"], 0) as w:
+            w.write(b"x" * 11)
+    assert store.upload_status("BN-1", up["id"])["offset"] == 0
+
+
+def test_aborted_upload_is_gone(tmp_path):
+    store = StorageStore(tmp_path)
+    up = store.create_upload("BN-1", "a.bin")
+    store.abort_upload("BN-1", up["id"])
+    with pytest.raises(NotFound):
+        store.upload_status("BN-1", up["id"])
+
+
+def test_ranged_reads_of_a_stored_file(tmp_path):
+    store = StorageStore(tmp_path)
+    data = b"0123456789" * 10
+    store.write("BN-1", "r.bin", data)
+    fp, entry = store.open_file("BN-1", "r.bin")
+    size = entry["size"]
+    assert parse_range("bytes=10-19", size) == (10, 19)
+    assert parse_range("bytes=95-", size) == (95, 99)
+    assert parse_range("bytes=-5", size) == (95, 99)
+    assert parse_range("bytes=90-500", size) == (90, 99)
+    assert parse_range("", size) is None
+    assert parse_range("bytes=0-1,5-6", size) is None
+    for bad in ("bytes=100-", "bytes=5-2", "bytes=x-1", "bytes=-0"):
+        with pytest.raises(ValueError):
+            parse_range(bad, size)
+
+    async def read(start, end):
+        return b"".join([chunk async for chunk in iter_file(fp, start, end, chunk_size=7)])
+
+    start, end = parse_range("bytes=15-44", size)
+    assert asyncio.run(read(start, end)) == data[15:45]
@@ -0,0 +1,119 @@
+import json
+import threading
+
+import pytest
+
+from api.datastore import FileStore, SqliteStore
+from api.webhook_inbox import WebhookInbox, event_id
+
+
+def _event(name, student, updated_at, sub_id=1000):
+    return {
+        "meta": {"event_name": name, "custom_data": {"student_id": student, "plan": "masters", "cadence": "monthly"}},
+        "data": {"type": "subscriptions", "id": str(sub_id), "attributes": {"subscription_id": sub_id, "updated_at": updated_at}},
+    }
+
+
+def _deliver(inbox, event):
+    body = json.dumps(event).encode("utf-8")
+    inbox.append(event_id(event, body), body)
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "file":
+        return FileStore(tmp_path / "data")
+    return SqliteStore(tmp_path / "bench.db")
+
+
+def test_duplicate_delivery_is_applied_once(tmp_path, store):
+    inbox = WebhookInbox(tmp_path / "webhooks", store)
+    ev = _event("subscription_created", "BN-1", "2026-01-01T00:00:01Z")
+    _deliver(inbox, ev)
+    _deliver(inbox, ev)
+    inbox.drain()
+    assert inbox.counters["applied"] == 1 and inbox.counters["duplicates"] == 1
+    # A replay in a later batch is still recognised.
+    _deliver(inbox, ev)
+    inbox.drain()
+    assert inbox.counters["applied"] == 1 and inbox.counters["duplicates"] == 2
+    assert store.sub_get("BN-1")["status"] == "active"
+
+
+def test_out_of_order_events_end_on_the_newest(tmp_path, store):
+    inbox = WebhookInbox(tmp_path / "webhooks", store)
+    _deliver(inbox, _event("subscription_cancelled", "BN-1", "2026-01-01T00:00:03Z"))
+    _deliver(inbox, _event("subscription_created", "BN-1", "2026-01-01T00:00:01Z"))
+    _deliver(inbox, _event("subscription_payment_failed", "BN-1", "2026-01-01T00:00:02Z"))
+    inbox.drain()
+    rec = store.sub_get("BN-1")
+    assert rec["status"] == "cancelled" and rec["event_updated_at"] == "2026-01-01T00:00:03Z"
+    # All three landed in one record write, oldest first.
+    assert inbox.counters["writes"] == 1
+
+    # An event older than the record, arriving in a later batch, is skipped.
+    _deliver(inbox, _event("subscription_resumed", "BN-1", "2026-01-01T00:00:02.5Z"))
+    inbox.drain()
+    assert store.sub_get("BN-1")["status"] == "cancelled"
+    assert inbox.counters["stale"] == 1
+
+
+def test_replay_after_crash_before_checkpoint(tmp_path, store):
+    inbox = WebhookInbox(tmp_path / "webhooks", store)
+    _deliver(inbox, _event("subscription_created", "BN-1", "2026-01-01T00:00:01Z"))
+    _deliver(inbox, _event("subscription_cancelled", "BN-2", "2026-01-01T00:00:01Z", 1001))
+    state_before = inbox._load_state()
+
+    # The batch is applied, then the process dies before the checkpoint
+    # write: put the old state back as if it had never been saved.
+    inbox.drain()
+    inbox.state_path.write_text(json.dumps(state_before), "utf-8")
+    applied = {s: store.sub_get(s) for s in ("BN-1", "BN-2")}
+
+    restarted = WebhookInbox(tmp_path / "webhooks", store)
+    assert restarted.pending_bytes() > 0
+    restarted.drain()
+    assert restarted.pending_bytes() == 0
+    for s, rec in applied.items():
+        again = store.sub_get(s)
+        assert again["status"] == rec["status"] and again["event_updated_at"] == rec["event_updated_at"]
+    # Nothing re-applied rolls a record back, and the next run has nothing to do.
+    restarted.drain()
+    assert WebhookInbox(tmp_path / "webhooks", store).pending_bytes() == 0
+
+
+def test_torn_final_line_waits_for_the_rest(tmp_path, store):
+    inbox = WebhookInbox(tmp_path / "webhooks", store)
+    _deliver(inbox, _event("subscription_created", "BN-1", "2026-01-01T00:00:01Z"))
+    with inbox.path.open("ab") as f:
+        f.write(b'{"id":"half')
+    assert inbox.drain() == 1
+    assert inbox.pending_bytes() > 0
+    assert store.sub_get("BN-1")["status"] == "active"
+
+
+def test_invalid_and_unknown_events_are_counted_not_applied(tmp_path, store):
+    inbox = WebhookInbox(tmp_path / "webhooks", store)
+    inbox.append("sha256:junk", b"not json")
+    _deliver(inbox, {"meta": {}, "data": {}})
+    inbox.drain()
+    assert inbox.counters["invalid"] == 1 and inbox.counters["ignored"] == 1
+    assert inbox.counters["writes"] == 0
+
+
+def test_concurrent_appends_are_all_durable(tmp_path, store):
+    inbox = WebhookInbox(tmp_path / "webhooks", store, batch_size=7)
+    students = [f"BN-{i}" for i in range(40)]
+
+    def send(i, s):
+        _deliver(inbox, _event("subscription_created", s, "2026-01-01T00:00:01Z", 1000 + i))
+
+    threads = [threading.Thread(target=send, args=(i, s)) for i, s in enumerate(students)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(inbox.path.read_bytes().splitlines()) == len(students)
+    assert inbox.drain() == len(students)
+    assert inbox.counters["fsyncs"] <= len(students)
+    assert all(store.sub_get(s)["status"] == "active" for s in students)